@@ -0,0 +1,103 @@
+# !/usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+@Version  : Python 3.12
+@Time     : 2025/7/10 21:36
+@Author   : wieszheng
+@Software : PyCharm
+"""
+import threading
+from typing import Dict, Optional
+
+from loguru import logger
+
+
+class ActivitySignal:
+    """
+    场景活跃信号，执行器在关键阶段（如回答流式输出期间）置为活跃
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def set_active(self, active: bool = True):
+        if active:
+            self._event.set()
+        else:
+            self._event.clear()
+
+    @property
+    def is_active(self) -> bool:
+        return self._event.is_set()
+
+
+class AdaptiveRatePolicy:
+    """
+    自适应采样频率
+    指标波动超过阈值或场景处于活跃阶段时立即切到最高频率；
+    连续 steady_samples 次平稳后按 backoff 倍数逐步降频，频率始终限定在 [1/max_interval, 1/min_interval]
+    """
+
+    def __init__(self, min_interval: float = 0.5, max_interval: float = 5.0, cpu_delta: float = 5.0,
+                 pss_delta: float = 20.0, fps_drop: float = 10.0, backoff: float = 1.5, steady_samples: int = 3,
+                 activity: Optional[ActivitySignal] = None):
+        """
+        :param min_interval: 最短采样间隔（秒）
+        :param max_interval: 最长采样间隔（秒）
+        :param cpu_delta: CPU使用率变化阈值（%）
+        :param pss_delta: PSS变化阈值（MB）
+        :param fps_drop: FPS下降阈值
+        :param backoff: 平稳时间隔放大倍数
+        :param steady_samples: 连续平稳多少次后降频
+        :param activity: 场景活跃信号
+        """
+        if not 0 < min_interval <= max_interval:
+            raise ValueError("采样间隔范围不正确")
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.thresholds = {'cpu': cpu_delta, 'pss': pss_delta}
+        self.fps_drop = fps_drop
+        self.backoff = backoff
+        self.steady_samples = steady_samples
+        self.activity = activity
+        self.interval = min_interval
+        self._last: Dict[str, float] = {}
+        self._steady = 0
+
+    @property
+    def rate_hz(self) -> float:
+        return round(1 / self.interval, 3)
+
+    def is_volatile(self, metrics: Dict[str, float]) -> bool:
+        """
+        与上一次采样相比是否出现明显波动
+        :param metrics: cpu(%)、pss(MB)、fps 中的任意几项
+        :return:
+        """
+        for key, threshold in self.thresholds.items():
+            if key in metrics and key in self._last and abs(metrics[key] - self._last[key]) > threshold:
+                return True
+        if 'fps' in metrics and 'fps' in self._last and self._last['fps'] - metrics['fps'] > self.fps_drop:
+            return True
+        return False
+
+    def observe(self, metrics: Dict[str, float]) -> float:
+        """
+        根据本次采样结果计算下一次的采样间隔
+        :param metrics:
+        :return: 下一次的采样间隔（秒）
+        """
+        metrics = {key: value for key, value in metrics.items() if isinstance(value, (int, float))}
+        active = self.activity is not None and self.activity.is_active
+        if active or self.is_volatile(metrics):
+            if self.interval != self.min_interval:
+                logger.debug(f"指标波动或场景活跃，采样间隔调整为 {self.min_interval}s")
+            self.interval = self.min_interval
+            self._steady = 0
+        else:
+            self._steady += 1
+            if self._steady >= self.steady_samples:
+                self.interval = min(self.max_interval, self.interval * self.backoff)
+                self._steady = 0
+        self._last.update(metrics)
+        return self.interval
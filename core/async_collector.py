@@ -0,0 +1,184 @@
+# !/usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+@Version  : Python 3.12
+@Time     : 2025/7/6 16:05
+@Author   : wieszheng
+@Software : PyCharm
+"""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Callable, List, Optional
+
+from loguru import logger
+
+from core.cpu import CpuMonitor
+from core.fps import FpsMonitor
+from core.hdc import HDC
+from core.memory import MemoryMonitor
+from hmdriver2.driver import Driver
+
+
+@dataclass
+class MetricSource:
+    """
+    一个指标源：阻塞的采集函数 + 独立的采样间隔
+    """
+    name: str
+    interval: float
+    fetch: Callable[[], Any]
+
+
+@dataclass
+class Sample:
+    """
+    合并后的采样流中的一条数据
+    """
+    timestamp: int
+    source: str
+    data: Any
+    latency_ms: float
+
+
+class AsyncCollector:
+    """
+    asyncio采集引擎
+    每个指标源是一个独立的协程，按各自的间隔在单调时钟栅格上触发；
+    阻塞的 device.shell 调用放到线程池中并发执行，结果合并到同一个带时间戳的采样流中。
+    新增指标不会拉长其他指标的采样周期。
+    """
+
+    def __init__(self, sources: List[MetricSource], max_workers: Optional[int] = None, queue_size: int = 1000):
+        self.sources = sources
+        self.executor = ThreadPoolExecutor(max_workers=max_workers or len(sources) or 1,
+                                           thread_name_prefix='collector')
+        self.queue_size = queue_size
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._stop: Optional[asyncio.Event] = None
+        self._stop_requested = False
+
+    async def _run_source(self, source: MetricSource):
+        """
+        单个指标源的采集循环，超时错过的栅格点直接跳过
+        :param source:
+        :return:
+        """
+        start = time.monotonic()
+        index = 0
+        while not self._stop.is_set():
+            delay = start + index * source.interval - time.monotonic()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._stop.wait(), delay)
+                    break
+                except asyncio.TimeoutError:
+                    pass
+
+            timestamp = int(time.time() * 1000)
+            began = time.monotonic()
+            try:
+                data = await self.loop.run_in_executor(self.executor, source.fetch)
+            except Exception as e:
+                logger.error(f"[{source.name}] 采集失败: {e}")
+                data = None
+            finished = time.monotonic()
+            if data is not None:
+                await self._queue.put(Sample(timestamp=timestamp, source=source.name, data=data,
+                                             latency_ms=round((finished - began) * 1000, 3)))
+            index = max(index + 1, int((finished - start) // source.interval) + 1)
+
+    async def stream(self, duration: Optional[float] = None) -> AsyncIterator[Sample]:
+        """
+        启动全部指标源并按到达顺序产出采样
+        :param duration: 采集时长（秒），为空时一直采集直到stop()
+        :return:
+        """
+        self.loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._stop = asyncio.Event()
+        if self._stop_requested:
+            self._stop.set()
+        tasks = [asyncio.create_task(self._run_source(source)) for source in self.sources]
+        closer = asyncio.create_task(self._close_on_stop(tasks))
+        if duration is not None:
+            self.loop.call_later(duration, self._stop.set)
+        try:
+            while True:
+                sample = await self._queue.get()
+                if sample is None:
+                    break
+                yield sample
+        finally:
+            self._stop.set()
+            for task in tasks + [closer]:
+                task.cancel()
+            await asyncio.gather(*tasks, closer, return_exceptions=True)
+
+    async def _close_on_stop(self, tasks: List[asyncio.Task]):
+        """
+        停止后等待所有指标源退出，再放入结束标记
+        :param tasks:
+        :return:
+        """
+        await self._stop.wait()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self._queue.put(None)
+
+    async def run(self, handler: Callable[[Sample], None], duration: Optional[float] = None):
+        """
+        采集并将每条采样交给handler处理
+        :param handler:
+        :param duration:
+        :return:
+        """
+        async for sample in self.stream(duration):
+            handler(sample)
+
+    def stop(self):
+        """
+        停止采集，可在其他线程中调用
+        :return:
+        """
+        self._stop_requested = True
+        if self.loop is not None and self._stop is not None:
+            self.loop.call_soon_threadsafe(self._stop.set)
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+
+def default_sources(device: Driver, package_name: str, pid: Optional[str] = None, cpu_interval: float = 1.0,
+                    memory_interval: float = 1.0, fps_interval: float = 1.0,
+                    hidumper_interval: float = 5.0) -> List[MetricSource]:
+    """
+    常用指标源：CPU、内存、FPS，指定pid时追加hidumper内存
+    :param device:
+    :param package_name:
+    :param pid:
+    :param cpu_interval:
+    :param memory_interval:
+    :param fps_interval:
+    :param hidumper_interval:
+    :return:
+    """
+    cpu_monitor = CpuMonitor(device)
+    mem_monitor = MemoryMonitor(device)
+    fps_monitor = FpsMonitor(device)
+    sources = [
+        MetricSource('cpu', cpu_interval, lambda: cpu_monitor.get_sp_daemon_cpu(package_name)),
+        MetricSource('memory', memory_interval, lambda: mem_monitor.get_sp_daemon_memory(package_name)),
+        MetricSource('fps', fps_interval, lambda: fps_monitor.get_sp_daemon_fps(package_name)),
+    ]
+    if pid:
+        sources.append(MetricSource('hidumper', hidumper_interval, lambda: mem_monitor.get_hidumper_memory(pid)))
+    return sources
+
+
+if __name__ == '__main__':
+    hdc = HDC()
+    collector = AsyncCollector(default_sources(hdc.driver, "com.baidu.yiyan.ent"))
+    asyncio.run(collector.run(lambda sample: print(sample), duration=10))
+    collector.close()
@@ -0,0 +1,357 @@
+# !/usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+@Version  : Python 3.12
+@Time     : 2025/7/17 21:05
+@Author   : wieszheng
+@Software : PyCharm
+"""
+import argparse
+import codecs
+import gzip
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, asdict
+from typing import Any, Callable, Deque, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from hmdriver2.hdc import CommandResult
+from loguru import logger
+
+from core.cpu import CpuMonitor
+from core.hdc import open_shell_stream
+from core.mem_table import parse_mem_table
+from core.metric_schema import SP_DAEMON_SCHEMA
+from core.sample_buffer import SampleBuffer
+from core.sp_parser import TOKEN_PATTERN, parse_fields
+
+
+@dataclass
+class CaptureRecord:
+    """
+    一次shell调用的原始记录
+    """
+    timestamp: int
+    cmd: str
+    output: str
+    elapsed_ms: float = 0.0
+    serial: str = ''
+
+
+class CaptureWriter:
+    """
+    原始输出的追加写入器：gzip压缩的JSON Lines，每次打开追加一个gzip成员，
+    多个成员拼接后仍可被gzip顺序读取，进程异常退出时只丢失未flush的部分。
+    """
+
+    def __init__(self, path: str, flush_every: int = 100):
+        """
+        :param path: 采集文件路径，通常以 .jsonl.gz 结尾
+        :param flush_every: 每写入多少条flush一次
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.flush_every = flush_every
+        self.count = 0
+        self._file = gzip.open(path, 'at', encoding='utf-8')
+        self._lock = threading.Lock()
+
+    def write(self, record: CaptureRecord):
+        line = json.dumps(asdict(record), ensure_ascii=False)
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.write(line + '\n')
+            self.count += 1
+            if self.count % self.flush_every == 0:
+                self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+        logger.info(f"原始输出已记录{self.count}条: {self.path}")
+
+    def __enter__(self) -> "CaptureWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def read_capture(path: str) -> Iterator[CaptureRecord]:
+    """
+    顺序读取采集文件，末尾被截断的记录忽略
+    :param path:
+    :return:
+    """
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        try:
+            for line in f:
+                try:
+                    yield CaptureRecord(**json.loads(line))
+                except (ValueError, TypeError):
+                    logger.warning(f"忽略损坏的记录: {path}")
+        except (EOFError, OSError) as e:
+            logger.warning(f"采集文件不完整 {path}: {e}")
+
+
+class CaptureDriver:
+    """
+    Driver的记录包装：shell调用照常执行，同时把命令、主机时间戳和原始输出写入采集文件
+    其它属性和方法原样转发给被包装的Driver
+    """
+
+    def __init__(self, device: Any, writer: CaptureWriter):
+        self.device = device
+        self.writer = writer
+
+    def shell(self, cmd: str, *args, **kwargs):
+        timestamp = int(time.time() * 1000)
+        start = time.monotonic()
+        result = self.device.shell(cmd, *args, **kwargs)
+        self.writer.write(CaptureRecord(timestamp=timestamp, cmd=cmd, output=result.output,
+                                        elapsed_ms=round((time.monotonic() - start) * 1000, 3),
+                                        serial=getattr(self.device, 'serial', '') or ''))
+        return result
+
+    def open_shell_stream(self, cmd: str):
+        """
+        持续输出的shell命令照常启动，stdout读取到的每一行同时写入采集文件
+        :param cmd:
+        :return:
+        """
+        process = open_shell_stream(self.device, cmd)
+        process.stdout = _CaptureStream(process.stdout, cmd, self.writer, getattr(self.device, 'serial', '') or '')
+        return process
+
+    def __getattr__(self, name: str):
+        return getattr(self.device, name)
+
+
+class _CaptureStream:
+    """
+    流式stdout的记录包装：按行写入采集文件，SP_daemon输出按order序号回绕合并为一个采样块一条记录，
+    与单次shell调用的记录格式一致，重放时可以用同样的解析器处理
+    """
+
+    def __init__(self, stream: Any, cmd: str, writer: CaptureWriter, serial: str):
+        self.stream = stream
+        self.cmd = cmd
+        self.writer = writer
+        self.serial = serial
+        self._decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self._pending = ''
+        self._lines: List[str] = []
+        self._timestamp = 0
+        self._last_order = -1
+
+    def read1(self, size: int = -1) -> bytes:
+        chunk = self.stream.read1(size)
+        self._feed(self._decoder.decode(chunk, final=not chunk))
+        if not chunk:
+            if self._pending:
+                self._feed_line(self._pending)
+                self._pending = ''
+            self._flush()
+        return chunk
+
+    def _feed(self, text: str):
+        lines = (self._pending + text).split('\n')
+        self._pending = lines.pop()
+        for line in lines:
+            self._feed_line(line)
+
+    def _feed_line(self, line: str):
+        match = TOKEN_PATTERN.search(line)
+        if match:
+            order = int(match.group(1))
+            if order <= self._last_order:
+                self._flush()
+            self._last_order = order
+        if not self._lines:
+            self._timestamp = int(time.time() * 1000)
+        self._lines.append(line)
+
+    def _flush(self):
+        if self._lines:
+            self.writer.write(CaptureRecord(timestamp=self._timestamp, cmd=self.cmd, output='\n'.join(self._lines),
+                                            serial=self.serial))
+            self._lines = []
+        self._last_order = -1
+
+    def __getattr__(self, name: str):
+        return getattr(self.stream, name)
+
+
+class ReplayDriver:
+    """
+    基于采集文件的确定性设备替身
+    同一条命令按记录顺序依次返回输出，用完后从头循环（loop=False时返回空输出）；
+    未记录过的命令返回空输出，可选按记录的耗时sleep以模拟设备延迟。
+    """
+
+    def __init__(self, records: Iterable[CaptureRecord], loop: bool = True, realtime: bool = False,
+                 serial: str = 'replay'):
+        self.loop = loop
+        self.realtime = realtime
+        self._outputs: Dict[str, List[CaptureRecord]] = defaultdict(list)
+        for record in records:
+            self._outputs[record.cmd].append(record)
+            serial = record.serial or serial
+        self.serial = serial
+        self._queues: Dict[str, Deque[CaptureRecord]] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_file(cls, path: str, **kwargs) -> "ReplayDriver":
+        return cls(read_capture(path), **kwargs)
+
+    @property
+    def commands(self) -> List[str]:
+        return list(self._outputs)
+
+    def shell(self, cmd: str, *args, **kwargs) -> CommandResult:
+        with self._lock:
+            queue = self._queues.get(cmd)
+            if not queue and (cmd not in self._queues or self.loop):
+                queue = self._queues[cmd] = deque(self._outputs.get(cmd, ()))
+            record = queue.popleft() if queue else None
+        if record is None:
+            return CommandResult('', '', 0)
+        if self.realtime and record.elapsed_ms:
+            time.sleep(record.elapsed_ms / 1000)
+        return CommandResult(record.output, '', 0)
+
+
+@dataclass
+class ReplaySample:
+    """
+    重新解析得到的一条采样
+    """
+    timestamp: int
+    kind: str
+    cmd: str
+    data: Dict[str, Any]
+
+
+def classify_command(cmd: str) -> str:
+    """
+    按命令判断原始输出的类型
+    :param cmd:
+    :return: sp_daemon / hidumper_mem / hidumper_cpu / other
+    """
+    if 'SP_daemon' in cmd:
+        return 'sp_daemon'
+    if 'hidumper --mem' in cmd:
+        return 'hidumper_mem'
+    if 'hidumper --cpuusage' in cmd:
+        return 'hidumper_cpu'
+    return 'other'
+
+
+def parse_record(record: CaptureRecord) -> Optional[ReplaySample]:
+    """
+    用当前的解析器重新解析一条记录
+    :param record:
+    :return: 无法解析或不关心的记录返回None
+    """
+    kind = classify_command(record.cmd)
+    try:
+        if kind == 'sp_daemon':
+            data = SP_DAEMON_SCHEMA.record(parse_fields(record.output))
+        elif kind == 'hidumper_mem':
+            data = parse_mem_table(record.output).flatten()
+        elif kind == 'hidumper_cpu':
+            pid = record.cmd.split()[-1]
+            data = CpuMonitor.parse_cpu_usage(record.output, pid)
+        else:
+            return None
+    except ValueError:
+        return None
+    if not data:
+        return None
+    return ReplaySample(timestamp=record.timestamp, kind=kind, cmd=record.cmd, data=data)
+
+
+def _parse_chunk(records: Sequence[CaptureRecord]) -> List[ReplaySample]:
+    samples = []
+    for record in records:
+        sample = parse_record(record)
+        if sample is not None:
+            samples.append(sample)
+    return samples
+
+
+class ReplayEngine:
+    """
+    离线重放：读取采集文件，按块分发到多个进程并行重新解析，结果按时间顺序写回采样存储
+    """
+
+    def __init__(self, paths: Sequence[str], max_workers: Optional[int] = None, chunk_size: int = 500):
+        """
+        :param paths: 采集文件
+        :param max_workers: 解析进程数，默认CPU核数
+        :param chunk_size: 每个任务包含的记录数
+        """
+        self.paths = list(paths)
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+
+    def _chunks(self) -> Iterator[List[CaptureRecord]]:
+        chunk = []
+        for path in self.paths:
+            for record in read_capture(path):
+                chunk.append(record)
+                if len(chunk) >= self.chunk_size:
+                    yield chunk
+                    chunk = []
+        if chunk:
+            yield chunk
+
+    def samples(self) -> List[ReplaySample]:
+        """
+        并行解析全部记录
+        :return: 按主机时间戳排序的采样
+        """
+        result: List[ReplaySample] = []
+        if self.max_workers <= 1:
+            for chunk in self._chunks():
+                result.extend(_parse_chunk(chunk))
+        else:
+            with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+                for samples in executor.map(_parse_chunk, self._chunks()):
+                    result.extend(samples)
+        result.sort(key=lambda sample: sample.timestamp)
+        return result
+
+    def run(self, buffer: Optional[SampleBuffer] = None,
+            handler: Optional[Callable[[ReplaySample], None]] = None) -> Tuple[int, Dict[str, int]]:
+        """
+        重新解析并写入采样存储
+        :param buffer: SP_daemon采样写入的列式缓冲区
+        :param handler: 每条采样的回调，如写日志或入库
+        :return: (采样数, 各类型的采样数)
+        """
+        counts: Dict[str, int] = defaultdict(int)
+        samples = self.samples()
+        for sample in samples:
+            counts[sample.kind] += 1
+            if buffer is not None and sample.kind == 'sp_daemon':
+                buffer.append(sample.data)
+            if handler is not None:
+                handler(sample)
+        logger.info(f"重放完成: {len(samples)}条采样 {dict(counts)}")
+        return len(samples), dict(counts)
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description="离线重放采集文件")
+    arg_parser.add_argument('paths', nargs='+', help="采集文件(.jsonl.gz)")
+    arg_parser.add_argument('--workers', type=int, default=None)
+    args = arg_parser.parse_args()
+    print(ReplayEngine(args.paths, max_workers=args.workers).run())
@@ -8,34 +8,40 @@
 """
 import re
 from datetime import datetime
-from typing import List, Dict, Any
-
-from loguru import logger
-
-from core.hdc import HDC
+from functools import lru_cache
+from typing import List, Dict, Any, Iterator, Optional, Sequence, Tuple
+
+from core.hdc import HDC, run_batch_shell
+from core.metric_schema import SP_DAEMON_SCHEMA
+from core.process import ProcessResolver
+from core.sp_daemon_stream import SpDaemonStream
+from core.sp_parser import parse_fields
 from hmdriver2.driver import Driver
 
+PROCESS_KEYS = frozenset(["ProcAppName", "ProcId", "ProcCpuLoad", "ProcCpuUsage", "ProcSCpuUsage", "ProcUCpuUsage"])
+CORE_KEY_PATTERN = re.compile(r"^(cpu\d+)(\w+)$")
+CORE_METRIC_NAMES = {
+    "Frequency": "frequency",
+    "Usage": "usage",
+    "idleUsage": "idle",
+    "systemUsage": "system",
+    "userUsage": "user",
+    "irqUsage": "irq",
+}
+
 
 class CpuMonitor:
-    def __init__(self, device):
+    def __init__(self, device, resolver: ProcessResolver = None):
         self.device: Driver = device
+        self.resolver = resolver or ProcessResolver(device)
 
     def get_pid(self, package_name: str) -> List[str]:
         """
-        获取进程pid
+        获取应用全部进程的pid（主进程及子进程），结果由ProcessResolver缓存
         :param package_name:
         :return:
         """
-        out = self.device.shell("ps -f | grep %s" % package_name).output
-        pid = []
-        for line in out.splitlines():
-            line = line.strip()
-            if line.startswith("shell"):
-                continue
-            elif package_name in line:
-                line_data = line.split()
-                pid.append(line_data[1])
-        return pid
+        return self.resolver.pids(package_name)
 
     def get_cpu_usage(self, pid: str) -> Dict[str, Any]:
         """
@@ -43,9 +49,28 @@ class CpuMonitor:
         :param pid:
         :return:
         """
+        out = self.device.shell("hidumper --cpuusage %s" % pid).output
+        return self.parse_cpu_usage(out, pid)
+
+    def get_cpu_usage_batch(self, pids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        一次shell调用获取多个进程的cpu使用率
+        :param pids:
+        :return: pid -> cpu使用率
+        """
+        outputs = run_batch_shell(self.device, {str(pid): "hidumper --cpuusage %s" % pid for pid in pids})
+        return {pid: self.parse_cpu_usage(out, pid) for pid, out in outputs.items()}
+
+    @staticmethod
+    def parse_cpu_usage(out: str, pid: str) -> Dict[str, Any]:
+        """
+        解析hidumper --cpuusage的输出
+        :param out:
+        :param pid:
+        :return:
+        """
         cpu_data = ["PID", "Total Usage", "User Space", "Kernel Space", "Page Fault Minor", "Page Fault Major", "Name"]
         cpu_list_data = []
-        out = self.device.shell("hidumper --cpuusage %s" % pid).output
         for line in out.splitlines():
             line = line.strip()
 
@@ -68,99 +93,83 @@ class CpuMonitor:
         :param package_name:
         :return:
         """
-        out = self.device.shell(f"SP_daemon -PKG {package_name} -c -N 1").output
-        data_block = re.search(r'(?s)order:.*', out)
-        if not data_block:
-            raise ValueError("内存数据格式不正确，未找到有效数据块")
-        raw_data = data_block.group(0)
-        # 准备数据结构
+        return self.parse_sp_daemon_fields(self.get_sp_daemon_fields(package_name))
+
+    def get_sp_daemon_fields(self, package_name: str, items: Sequence[str] = ("c",)) -> Dict[str, str]:
+        """
+        执行一次SP_daemon -c，返回原始键值对
+        :param package_name:
+        :param items: SP_daemon采集项，需包含 c；如 ("c", "f") 同时采集FPS
+        :return:
+        """
+        flags = " ".join(f"-{item}" for item in items)
+        out = self.device.shell(f"SP_daemon -PKG {package_name} {flags} -N 1").output
+        fields = parse_fields(out)
+        if not fields:
+            raise ValueError("CPU数据格式不正确，未找到有效数据块")
+        return fields
+
+    def parse_sp_daemon_fields(self, fields: Dict[str, str]) -> Dict[str, Any]:
+        """
+        将SP_daemon的原始键值对转换为CPU数据结构
+        :param fields: 一个采样块的 key -> value 字符串
+        :return:
+        """
         result: Dict[str, Any] = {
             "timestamp": 0,
             "process": {},
             "system": {},
             "cpus": {}
         }
+        for key, value in fields.items():
+            self.process_key_value(result, key, value)
+        return result
 
-        for line in raw_data.split("\n"):
-            line = line.strip()
-            if not line or "=" not in line:
-                continue
-
-            try:
-                # 提取键值对
-                if line.startswith("order:"):
-                    # 处理"order:X key=value"格式
-                    parts = re.split(r"\s+", line, 1)
-                    key_value = parts[1] if len(parts) > 1 else ""
-
-                    if "=" in key_value:
-                        key, value = key_value.split("=", 1)
-                        self.process_key_value(result, key, value)
-                else:
-                    # 直接处理"key=value"格式
-                    key, value = line.split("=", 1)
-                    self.process_key_value(result, key, value)
-
-            except (IndexError, ValueError) as e:
-                logger.warning(f"解析行失败: {line} - {str(e)}")
-                continue
+    def stream_sp_daemon_cpu(self, package_name: str, count: int = 3600) -> Iterator[Dict[str, Any]]:
+        """
+        流式获取CPU数据，整个会话只启动一次SP_daemon
+        :param package_name:
+        :param count: 采样次数
+        :return:
+        """
+        with SpDaemonStream(self.device, package_name, items=("c",), count=count) as stream:
+            for fields in stream:
+                yield self.parse_sp_daemon_fields(fields)
 
-        return result
     def process_key_value(self, result: Dict[str, Any], key: str, value: str):
         """
-        处理键值对
+        处理键值对，键的归类由分派表决定，取值按指标表转换为目标单位（频率为GHz）
         :param result:
         :param key:
         :param value:
         :return:
         """
-        if value == "NA":
-            value = None
-        else:
-            try:
-                value = float(value) if "." in value else int(value)
-            except ValueError:
-                pass
-
-        if key == "timestamp":
+        route = cpu_key_route(key)
+        if route is None:
+            return
+        value = SP_DAEMON_SCHEMA.convert(key, value)
+        section, name, metric = route
+        if section == "timestamp":
             result["timestamp"] = value
+        elif section == "cpus":
+            self.handle_cpu_core_metric(result, name, metric, value)
+        else:
+            result.setdefault(section, {})[name] = value
 
-        # 进程相关信息
-        elif key in ["ProcAppName", "ProcId", "ProcCpuLoad", "ProcCpuUsage", "ProcSCpuUsage", "ProcUCpuUsage"]:
-            result["process"][key] = value
-
-        # 子进程信息(当前都为NA)
-        elif key.startswith("ChildProc"):
-            if "child_processes" not in result:
-                result["child_processes"] = {}
-            result["child_processes"][key] = value
-
-        # 系统级CPU指标
-        elif key.startswith("Totalcpu"):
-            result["system"][key] = value
-
-        # CPU核心指标
-        elif key.startswith("cpu") and any(char.isdigit() for char in key):
-            self.handle_cpu_core_metric(result, key, value)
-
-    def handle_cpu_core_metric(self, result: Dict[str, Any], key: str, value: Any):
+    @staticmethod
+    def handle_cpu_core_metric(result: Dict[str, Any], core_name: str, metric: str, value: Any):
         """
         处理CPU核心指标
         :param result:
-        :param key:
+        :param core_name: 如cpu0
+        :param metric: 结果中的指标名，如usage
         :param value:
         :return:
         """
-        # 匹配核心编号和指标类型
-        match = re.match(r"^(cpu\d+)(\w+)$", key)
-        if not match:
-            return
-
-        core_name = match.group(1)
-        metric_name = match.group(2)
-        # 确保核心对象存在
-        if core_name not in result["cpus"]:
-            result["cpus"][core_name] = {
+        core = result["cpus"].get(core_name)
+        if core is None:
+            # 确保核心对象存在
+            core = result["cpus"][core_name] = {
                 "frequency": 0,
                 "usage": 0.0,
                 "idle": 0.0,
@@ -168,22 +177,34 @@ class CpuMonitor:
                 "user": 0.0,
                 "irq": 0.0,
             }
+        core[metric] = value
+
+
+@lru_cache(maxsize=None)
+def cpu_key_route(key: str) -> Optional[Tuple[str, str, Optional[str]]]:
+    """
+    SP_daemon键到结果位置的分派表，结果按键缓存，同一种输出格式只计算一次
+    :param key:
+    :return: (分组, 名称, 核心指标名)，不需要的键返回None
+    """
+    if key == "timestamp":
+        return "timestamp", key, None
+    # 进程相关信息
+    if key in PROCESS_KEYS:
+        return "process", key, None
+    # 子进程信息(当前都为NA)
+    if key.startswith("ChildProc"):
+        return "child_processes", key, None
+    # 系统级CPU指标
+    if key.startswith("Totalcpu"):
+        return "system", key, None
+    # CPU核心指标
+    match = CORE_KEY_PATTERN.match(key)
+    if match:
+        core_name, metric_name = match.groups()
+        return "cpus", core_name, CORE_METRIC_NAMES.get(metric_name, metric_name.lower())
+    return None
 
-        # 根据指标类型赋值
-        if metric_name == "Frequency":
-            result["cpus"][core_name]["frequency"] = value
-        elif metric_name == "Usage":
-            result["cpus"][core_name]["usage"] = value
-        elif metric_name == "idleUsage":
-            result["cpus"][core_name]["idle"] = value
-        elif metric_name == "systemUsage":
-            result["cpus"][core_name]["system"] = value
-        elif metric_name == "userUsage":
-            result["cpus"][core_name]["user"] = value
-        elif metric_name == "irqUsage":
-            result["cpus"][core_name]["irq"] = value
-        else:
-            result["cpus"][core_name][metric_name.lower()] = value
 
 if __name__ == '__main__':
     hdc = HDC()
@@ -0,0 +1,265 @@
+# !/usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+@Version  : Python 3.12
+@Time     : 2025/7/9 22:03
+@Author   : wieszheng
+@Software : PyCharm
+"""
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Sequence
+
+from loguru import logger
+
+from core.hdc import HDC
+from core.sp_daemon_stream import SpDaemonBlockParser
+from hmdriver2.driver import Driver
+
+REMOTE_DIR = '/data/local/tmp/perf_agent'
+
+# 设备端采样脚本，参数: 目录 包名 间隔(秒) 每段样本数 最多段数 SP_daemon参数
+# 样本写入 cur，写满一段后改名为 seg.<序号>；段数超过上限时删除最旧的段（环形）；
+# 删除 run 文件即停止
+AGENT_SCRIPT = r'''#!/bin/sh
+DIR=$1; PKG=$2; INTERVAL=$3; SEG=$4; MAXSEG=$5; shift 5; SP_FLAGS="$*"
+seq=0; seg=0; n=0
+while [ -f "$DIR/run" ]; do
+  seq=$((seq+1))
+  pid=$(pidof "$PKG" | cut -d' ' -f1)
+  {
+    echo "#sample $seq $(date +%s) $(cut -d' ' -f1 /proc/uptime) $pid"
+    head -n 1 /proc/stat
+    if [ -n "$pid" ]; then
+      echo "pstat $(cat /proc/$pid/stat 2>/dev/null)"
+      echo "statm $(cat /proc/$pid/statm 2>/dev/null)"
+    fi
+    if [ -n "$SP_FLAGS" ]; then
+      SP_daemon -PKG "$PKG" -N 1 $SP_FLAGS 2>/dev/null | grep 'order:'
+    fi
+    echo "#end $seq"
+  } >> "$DIR/cur"
+  n=$((n+1))
+  if [ $n -ge $SEG ]; then
+    mv "$DIR/cur" "$DIR/seg.$(printf %08d $seg)"
+    seg=$((seg+1)); n=0
+    if [ $(ls "$DIR" | grep -c '^seg\.') -gt $MAXSEG ]; then
+      rm -f "$DIR/$(ls "$DIR" | grep '^seg\.' | head -n 1)"
+    fi
+  fi
+  sleep $INTERVAL
+done
+'''
+
+# 拉取脚本，参数: 目录 [cur]；输出并删除已写满的段（及正在写入的段）
+# hdc shell 会把命令包在双引号里交给主机shell执行，命令行中的 $ 会先在主机展开，
+# 因此需要展开变量的逻辑都放在设备端脚本里
+PULL_SCRIPT = r'''#!/bin/sh
+cd "$1" || exit 0; shift
+for f in $(ls seg.* 2>/dev/null) "$@"; do
+  if [ -f "$f" ]; then cat "$f"; rm -f "$f"; fi
+done
+'''
+
+
+@dataclass
+class AgentSample:
+    """
+    设备端agent采集的一条样本
+    """
+    seq: int
+    timestamp: int
+    pid: str = ''
+    total_ticks: int = 0
+    proc_ticks: int = 0
+    rss_kb: int = 0
+    cpu_usage: float = 0.0
+    uptime: float = 0.0
+    sp_fields: Dict[str, str] = field(default_factory=dict)
+
+
+class LocalShell:
+    """
+    设备shell的本地替身，在本机 /bin/sh 中执行命令，用于在没有设备时验证agent
+    接口与 Driver 的 shell/push_file 一致
+    """
+
+    class _Result:
+        def __init__(self, output: str):
+            self.output = output
+
+    def shell(self, cmd: str):
+        process = subprocess.run(['sh', '-c', cmd], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        return self._Result(process.stdout.decode('utf-8', errors='replace'))
+
+    def push_file(self, lpath: str, rpath: str):
+        shutil.copyfile(lpath, rpath)
+
+
+def parse_agent_output(out: str) -> List[AgentSample]:
+    """
+    解析agent输出的样本块
+    :param out:
+    :return:
+    """
+    samples = []
+    current: Optional[AgentSample] = None
+    parser = SpDaemonBlockParser()
+    for line in out.splitlines():
+        if line.startswith('#sample '):
+            parts = line.split()
+            wall, uptime = int(parts[2]), float(parts[3])
+            current = AgentSample(seq=int(parts[1]), timestamp=wall * 1000, uptime=uptime,
+                                  pid=parts[4] if len(parts) > 4 else '')
+        elif current is None:
+            continue
+        elif line.startswith('#end '):
+            for block in parser.close():
+                current.sp_fields.update(block)
+            samples.append(current)
+            current = None
+        elif line.startswith('cpu '):
+            current.total_ticks = sum(int(v) for v in line.split()[1:])
+        elif line.startswith('pstat '):
+            fields = line[line.rfind(')') + 1:].split()
+            if len(fields) > 12:
+                # utime、stime 为 stat 的第14、15个字段
+                current.proc_ticks = int(fields[11]) + int(fields[12])
+        elif line.startswith('statm '):
+            fields = line.split()
+            if len(fields) > 2:
+                current.rss_kb = int(fields[2]) * 4
+        else:
+            for block in parser.feed(line + '\n'):
+                current.sp_fields.update(block)
+    return samples
+
+
+class DeviceAgent:
+    """
+    设备端采样agent
+    将采样脚本推送到设备，在设备上按指定频率采集 /proc 和 SP_daemon 数据写入环形段文件，
+    主机每隔一段时间批量拉取已写满的段并解析。采样精度不再受hdc往返延迟影响，可以达到亚秒级。
+    """
+
+    def __init__(self, device, package_name: str, interval: float = 0.2, segment_size: int = 20,
+                 max_segments: int = 100, sp_daemon_items: Sequence[str] = (), remote_dir: str = REMOTE_DIR):
+        """
+        :param device: Driver 或 LocalShell
+        :param package_name:
+        :param interval: 设备端采样间隔（秒）
+        :param segment_size: 每段样本数，主机只拉取写满的段
+        :param max_segments: 设备端最多保留的段数，主机长时间未拉取时丢弃最旧的段
+        :param sp_daemon_items: 每次采样附带的SP_daemon采集项，如 ("c", "r")；SP_daemon单次约1秒，亚秒级采样时留空
+        :param remote_dir:
+        """
+        self.device: Driver = device
+        self.package_name = package_name
+        self.interval = interval
+        self.segment_size = segment_size
+        self.max_segments = max_segments
+        self.sp_daemon_items = list(sp_daemon_items)
+        self.remote_dir = remote_dir
+        self._anchor: Optional[float] = None
+        self._last: Optional[AgentSample] = None
+        self.stop_event = threading.Event()
+        self._running = False
+
+    def start(self):
+        """
+        推送并启动agent
+        :return:
+        """
+        self.device.shell(f"rm -rf {self.remote_dir}; mkdir -p {self.remote_dir}")
+        self._push_script(AGENT_SCRIPT, 'agent.sh')
+        self._push_script(PULL_SCRIPT, 'pull.sh')
+        flags = " ".join(f"-{item}" for item in self.sp_daemon_items)
+        self.device.shell(
+            f"touch {self.remote_dir}/run; nohup sh {self.remote_dir}/agent.sh {self.remote_dir} {self.package_name} "
+            f"{self.interval} {self.segment_size} {self.max_segments} {flags} > /dev/null 2>&1 &"
+        )
+        logger.info(f"设备端agent已启动: {self.package_name}, 间隔{self.interval}s")
+
+    def _push_script(self, content: str, name: str):
+        with tempfile.NamedTemporaryFile('w', suffix='.sh', delete=False, newline='\n') as f:
+            f.write(content)
+            local_path = f.name
+        try:
+            self.device.push_file(local_path, f"{self.remote_dir}/{name}")
+        finally:
+            os.remove(local_path)
+
+    def pull(self, include_current: bool = False) -> List[AgentSample]:
+        """
+        拉取并删除设备端已写满的段
+        :param include_current: 是否同时拉取正在写入的段（停止时使用）
+        :return:
+        """
+        current = " cur" if include_current else ""
+        out = self.device.shell(f"sh {self.remote_dir}/pull.sh {self.remote_dir}{current}").output
+        samples = sorted(parse_agent_output(out), key=lambda item: item.seq)
+        return self._derive(samples)
+
+    def stop(self) -> List[AgentSample]:
+        """
+        停止agent；未在run()中运行时直接拉取剩余样本，否则由run()完成最后一次拉取
+        :return:
+        """
+        self.stop_event.set()
+        self.device.shell(f"rm -f {self.remote_dir}/run")
+        if self._running:
+            return []
+        time.sleep(self.interval)
+        return self.pull(include_current=True)
+
+    def run(self, handler: Callable[[List[AgentSample]], None], pull_interval: float = 5.0):
+        """
+        启动agent并周期性批量拉取，直到stop_event被设置
+        :param handler: 每批样本的处理函数
+        :param pull_interval: 拉取间隔（秒）
+        :return:
+        """
+        self._running = True
+        self.start()
+        try:
+            while not self.stop_event.wait(pull_interval):
+                samples = self.pull()
+                if samples:
+                    handler(samples)
+            time.sleep(self.interval)
+            samples = self.pull(include_current=True)
+            if samples:
+                handler(samples)
+        finally:
+            self._running = False
+
+    def _derive(self, samples: List[AgentSample]) -> List[AgentSample]:
+        """
+        用设备开机时间修正时间戳，并根据相邻样本的节拍差计算进程CPU占比
+        :param samples:
+        :return:
+        """
+        for sample in samples:
+            if self._anchor is None:
+                self._anchor = sample.timestamp / 1000 - sample.uptime
+            sample.timestamp = int((self._anchor + sample.uptime) * 1000)
+            last = self._last
+            if last is not None and last.pid == sample.pid and sample.total_ticks > last.total_ticks:
+                sample.cpu_usage = round(
+                    (sample.proc_ticks - last.proc_ticks) * 100 / (sample.total_ticks - last.total_ticks), 2)
+            self._last = sample
+        return samples
+
+
+if __name__ == '__main__':
+    hdc = HDC()
+    agent = DeviceAgent(hdc.driver, "com.baidu.yiyan.ent", interval=0.5)
+    agent.start()
+    time.sleep(15)
+    for item in agent.stop():
+        print(item)
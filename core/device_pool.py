@@ -0,0 +1,173 @@
+# !/usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+@Version  : Python 3.12
+@Time     : 2025/7/7 20:41
+@Author   : wieszheng
+@Software : PyCharm
+"""
+import json
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, asdict
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from hmdriver2.hdc import list_devices
+from loguru import logger
+
+from config.conf import ROOT_PATH
+from core.hdc import HDC
+from core.thread_mem_cpu import ThreadMemCPU
+from utils import time_format
+
+
+def discover_devices() -> List[str]:
+    """
+    获取当前连接的全部设备序列号
+    :return:
+    """
+    try:
+        return list_devices()
+    except Exception as e:
+        logger.error(f"获取设备列表失败: {e}")
+        return []
+
+
+@dataclass
+class DeviceResult:
+    """
+    单台设备的运行结果
+    """
+    serial: str
+    log_dir: str
+    ok: bool = False
+    error: Optional[str] = None
+    start_time: Optional[str] = None
+    end_time: Optional[str] = None
+
+
+class DevicePool:
+    """
+    多设备并行监控
+    每台设备一个工作线程（采集本身是hdc子进程调用，线程足以扩展到几十台设备），
+    单台设备的异常只影响该设备，所有设备的数据写入同一个运行目录下的 <serial>/ 子目录
+    """
+
+    def __init__(self, serials: Optional[List[str]] = None, run_dir: Optional[str] = None,
+                 package_name: str = 'com.baidu.yiyan.ent', max_workers: Optional[int] = None,
+                 collector_factory: Optional[Callable[..., Any]] = None,
+                 hdc_factory: Optional[Callable[[str], HDC]] = None, **collector_kwargs):
+        """
+        :param serials: 设备序列号，为空时自动发现
+        :param run_dir: 运行目录，默认 log/<时间>
+        :param package_name:
+        :param max_workers: 并行设备数上限
+        :param collector_factory: 采集器构造函数，参数与ThreadMemCPU一致，需提供start/stop_mem_cpu_thread
+        :param hdc_factory: 按序列号创建HDC，默认真机HDC，压测时可传入FakeHDC
+        :param collector_kwargs: 透传给采集器的参数，如 backend、interval
+        """
+        self.serials = serials if serials is not None else discover_devices()
+        self.run_dir = run_dir or os.path.join(ROOT_PATH, "log", time_format.get_str_detail_time_logfile())
+        self.package_name = package_name
+        self.max_workers = max_workers or max(1, len(self.serials))
+        self.collector_factory = collector_factory or ThreadMemCPU
+        self.hdc_factory = hdc_factory or HDC
+        self.collector_kwargs = collector_kwargs
+        self.stop_event = threading.Event()
+        self.results: Dict[str, DeviceResult] = {}
+
+    def device_dir(self, serial: str) -> str:
+        """
+        设备的日志目录，序列号中的 : 等字符替换为 _
+        :param serial:
+        :return:
+        """
+        return os.path.join(self.run_dir, re.sub(r'[^\w.\-]', '_', serial))
+
+    def _create_log_dirs(self, serial: str) -> Dict[str, str]:
+        base = self.device_dir(serial)
+        dirs = {name: os.path.join(base, name) for name in ('mem', 'cpu', 'view', 'sched')}
+        for path in dirs.values():
+            os.makedirs(path, exist_ok=True)
+        return dirs
+
+    def _run_device(self, serial: str, scenario: Optional[Callable[[HDC], Any]],
+                    duration: Optional[float]) -> DeviceResult:
+        """
+        在单台设备上采集，并可选地执行场景
+        :param serial:
+        :param scenario: 场景函数，参数为该设备的HDC
+        :param duration: 无场景时的采集时长（秒）
+        :return:
+        """
+        result = DeviceResult(serial=serial, log_dir=self.device_dir(serial),
+                              start_time=datetime.now().isoformat(timespec='seconds'))
+        collector = None
+        try:
+            hdc = self.hdc_factory(serial)
+            if hdc.driver is None:
+                raise RuntimeError(f"设备 {serial} 驱动初始化失败")
+            dirs = self._create_log_dirs(serial)
+            collector = self.collector_factory(hdc, dirs['mem'], dirs['cpu'], dirs['view'],
+                                               package_name=self.package_name, log_sched_dir=dirs['sched'],
+                                               **self.collector_kwargs)
+            collector.start_mem_cpu_thread()
+            if scenario is not None:
+                scenario(hdc)
+            else:
+                self.stop_event.wait(duration)
+            result.ok = True
+        except Exception as e:
+            logger.error(f"[{serial}] 运行失败: {e}")
+            result.error = str(e)
+        finally:
+            if collector is not None:
+                try:
+                    collector.stop_mem_cpu_thread()
+                except Exception as e:
+                    logger.error(f"[{serial}] 停止采集失败: {e}")
+                    result.ok = False
+                    result.error = result.error or str(e)
+            result.end_time = datetime.now().isoformat(timespec='seconds')
+        return result
+
+    def run(self, scenario: Optional[Callable[[HDC], Any]] = None,
+            duration: Optional[float] = None) -> Dict[str, DeviceResult]:
+        """
+        在所有设备上并行运行，返回每台设备的结果并写入 summary.json
+        :param scenario: 场景函数，参数为该设备的HDC；为空时按duration采集或直到stop()
+        :param duration:
+        :return:
+        """
+        if not self.serials:
+            logger.warning("未发现可用设备")
+            return {}
+        os.makedirs(self.run_dir, exist_ok=True)
+        logger.info(f"开始多设备监控: {len(self.serials)}台设备, 目录: {self.run_dir}")
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='device') as executor:
+            futures = {serial: executor.submit(self._run_device, serial, scenario, duration)
+                       for serial in self.serials}
+            for serial, future in futures.items():
+                self.results[serial] = future.result()
+
+        with open(os.path.join(self.run_dir, 'summary.json'), 'w', encoding='utf-8') as f:
+            json.dump({serial: asdict(res) for serial, res in self.results.items()}, f, indent=2,
+                      ensure_ascii=False)
+        failed = [serial for serial, res in self.results.items() if not res.ok]
+        logger.info(f"多设备监控结束: 成功{len(self.results) - len(failed)}台, 失败{len(failed)}台 {failed}")
+        return self.results
+
+    def stop(self):
+        """
+        结束无场景的采集
+        :return:
+        """
+        self.stop_event.set()
+
+
+if __name__ == '__main__':
+    pool = DevicePool()
+    pool.run(duration=60)
@@ -13,6 +13,8 @@ from datetime import datetime
 
 from loguru import logger
 
+from core.adaptive import ActivitySignal
+
 
 class Executor(ABC):
     """
@@ -34,6 +36,22 @@ class Executor(ABC):
         self.is_setup = False
         self.is_executed = False
         self.is_teardown = False
+        self.activity: Optional[ActivitySignal] = None
+
+    def set_activity(self, activity: ActivitySignal):
+        """
+        绑定场景活跃信号，采集端可据此在关键阶段提高采样频率
+        :param activity:
+        :return:
+        """
+        self.activity = activity
+
+    def _mark_active(self, active: bool = True):
+        """
+        标记场景是否处于活跃阶段
+        """
+        if self.activity is not None:
+            self.activity.set_active(active)
 
     def run(self) -> Any:
         """
@@ -54,6 +72,7 @@ class Executor(ABC):
             self.end_time = datetime.now()
             self.is_executed = True
             self._log("执行完成")
+            self._mark_active(False)
 
             # 3. 清理阶段
             self._log("开始清理...")
@@ -65,6 +84,7 @@ class Executor(ABC):
 
         except Exception as e:
             self._log(f"执行过程中发生错误: {str(e)}")
+            self._mark_active(False)
             # 确保即使出错也要尝试清理
             if self.is_setup and not self.is_teardown:
                 try:
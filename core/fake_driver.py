@@ -0,0 +1,448 @@
+# !/usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+@Version  : Python 3.12
+@Time     : 2025/7/18 20:16
+@Author   : wieszheng
+@Software : PyCharm
+"""
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple, Union
+
+import cv2
+import numpy as np
+from hmdriver2.hdc import CommandResult
+from hmdriver2.proto import Point
+from loguru import logger
+
+from core.capture import ReplayDriver
+from core.hdc import BATCH_BEGIN, BATCH_END, HDC
+
+_BATCH_PATTERN = re.compile(rf'echo {BATCH_BEGIN}(\w+); (.*?); echo; echo {BATCH_END}\1')
+_STAT_PATTERN = re.compile(r'/proc/(\d+)/stat')
+
+
+class LatencyModel:
+    """
+    命令耗时分布（秒）
+      constant     固定为mean
+      uniform      [mean - spread, mean + spread]
+      normal       均值mean、标准差spread，截断到0以上
+      lognormal    中位数mean、形状参数spread，长尾
+      exponential  均值mean
+    """
+
+    KINDS = ('constant', 'uniform', 'normal', 'lognormal', 'exponential')
+
+    def __init__(self, kind: str = 'constant', mean: float = 0.0, spread: float = 0.0, seed: Optional[int] = None):
+        if kind not in self.KINDS:
+            raise ValueError(f"不支持的耗时分布: {kind}")
+        self.kind = kind
+        self.mean = mean
+        self.spread = spread
+        self.random = random.Random(seed)
+
+    def sample(self) -> float:
+        if self.mean <= 0:
+            return 0.0
+        if self.kind == 'uniform':
+            value = self.random.uniform(self.mean - self.spread, self.mean + self.spread)
+        elif self.kind == 'normal':
+            value = self.random.gauss(self.mean, self.spread)
+        elif self.kind == 'lognormal':
+            value = self.mean * self.random.lognormvariate(0, self.spread)
+        elif self.kind == 'exponential':
+            value = self.random.expovariate(1 / self.mean)
+        else:
+            value = self.mean
+        return max(0.0, value)
+
+
+class FakeElement:
+    """
+    xpath查找结果的替身，接口与hmdriver2的_XMLElement一致，总是可以找到
+    """
+
+    def __init__(self, driver: "FakeDriver", xpath: str):
+        self._d = driver
+        self.xpath = xpath
+        width, height = driver.screen_size
+        self.center = Point(width // 2, height // 2)
+
+    def exists(self) -> bool:
+        return True
+
+    def click(self):
+        self._d.click(self.center.x, self.center.y)
+
+    def click_if_exists(self):
+        self.click()
+
+    def double_click(self):
+        self._d.double_click(self.center.x, self.center.y)
+
+    def long_click(self):
+        self._d.long_click(self.center.x, self.center.y)
+
+    def input_text(self, text: str):
+        self.click()
+        self._d.input_text(text)
+
+    @property
+    def info(self) -> Dict[str, Any]:
+        return {'xpath': self.xpath, 'text': ''}
+
+    @property
+    def text(self) -> str:
+        return ''
+
+
+class FakeStreamProcess:
+    """
+    持续输出SP_daemon采样的替身进程，接口与 subprocess.Popen 中用到的部分一致
+    """
+
+    def __init__(self, driver: "FakeDriver", cmd: str, interval: float):
+        read_fd, write_fd = os.pipe()
+        self.stdout = os.fdopen(read_fd, 'rb')
+        self._writer = os.fdopen(write_fd, 'wb')
+        self._stop = threading.Event()
+        count = re.search(r'-N\s+(\d+)', cmd)
+        self._thread = threading.Thread(target=self._run, name=f'fake-stream-{driver.serial}', daemon=True,
+                                        args=(driver, cmd, int(count.group(1)) if count else 1, interval))
+        self._thread.start()
+        self.returncode: Optional[int] = None
+
+    def _run(self, driver: "FakeDriver", cmd: str, count: int, interval: float):
+        try:
+            for i in range(count):
+                if i and self._stop.wait(interval):
+                    break
+                self._writer.write((driver.sp_daemon_output(cmd, samples=1) + '\n').encode('utf-8'))
+                self._writer.flush()
+        except (BrokenPipeError, ValueError):
+            pass
+        finally:
+            try:
+                self._writer.close()
+            except OSError:
+                pass
+            self.returncode = 0
+
+    def poll(self) -> Optional[int]:
+        return self.returncode
+
+    def terminate(self):
+        self._stop.set()
+
+    kill = terminate
+
+    def wait(self, timeout: Optional[float] = None) -> Optional[int]:
+        self._thread.join(timeout)
+        return self.returncode
+
+
+class FakeDriver:
+    """
+    模拟设备，可替代 hmdriver2 的 Driver
+    shell 按命令生成与真机格式一致的合成输出（SP_daemon、hidumper、ps、/proc/<pid>/stat，以及 run_batch_shell
+    的批量命令），也可以优先返回采集文件中录制的输出；各类操作的耗时按配置的分布sleep。
+    应用进程状态随 start_app/stop_app 变化，UI操作只记录不执行。
+    """
+
+    def __init__(self, serial: str = 'fake-0', core_count: int = 8, package_name: str = 'com.baidu.yiyan.ent',
+                 latency: Union[LatencyModel, Dict[str, LatencyModel], None] = None, seed: Optional[int] = None,
+                 replay: Optional[ReplayDriver] = None, screen_size: Tuple[int, int] = (1260, 2720),
+                 stream_interval: float = 1.0, app_running: bool = True):
+        """
+        :param serial:
+        :param core_count: CPU核心数
+        :param package_name: 默认运行中的应用
+        :param latency: 耗时分布，可按类型分别指定：sp_daemon、hidumper、shell、ui、screenshot
+        :param seed: 随机种子，固定后输出可复现
+        :param replay: 录制的输出，命中的命令直接返回录制内容
+        :param screen_size:
+        :param stream_interval: 流式SP_daemon的输出间隔（秒）
+        :param app_running: 默认应用是否已在运行
+        """
+        self.serial = serial
+        self.core_count = core_count
+        self.screen_size = screen_size
+        self.stream_interval = stream_interval
+        self.replay = replay
+        self.random = random.Random(seed)
+        if isinstance(latency, LatencyModel) or latency is None:
+            self.latency: Dict[str, LatencyModel] = {'default': latency or LatencyModel()}
+        else:
+            self.latency = dict(latency)
+        self.actions: Deque[Tuple[float, str, Tuple[Any, ...]]] = deque(maxlen=1000)
+        self.shell_count = 0
+        self._lock = threading.Lock()
+        self._next_pid = 10000
+        self._uptime_ticks = 100000
+        self._apps: Dict[str, Tuple[int, int]] = {}
+        # 各指标的当前值，按随机游走变化
+        self._state: Dict[str, float] = {'proc_cpu': 10.0, 'pss': 300 * 1024.0, 'fps': 60.0}
+        self._core_usage = [self.random.uniform(5, 30) for _ in range(core_count)]
+        if app_running:
+            self.start_app(package_name)
+            self.actions.clear()
+
+    # ---------------------------------------------------------------- 耗时与记录
+
+    def _sleep(self, kind: str):
+        model = self.latency.get(kind) or self.latency.get('default')
+        if model is not None:
+            delay = model.sample()
+            if delay:
+                time.sleep(delay)
+
+    def _record(self, action: str, *args):
+        self.actions.append((time.time(), action, args))
+
+    # ---------------------------------------------------------------- shell
+
+    def shell(self, cmd: str, timeout: float = None) -> CommandResult:
+        with self._lock:
+            self.shell_count += 1
+        if self.replay is not None and cmd in self.replay.commands:
+            return self.replay.shell(cmd)
+        if BATCH_BEGIN in cmd:
+            parts = []
+            for key, sub_cmd in _BATCH_PATTERN.findall(cmd):
+                parts.append(f"{BATCH_BEGIN}{key}\n{self._output(sub_cmd)}\n{BATCH_END}{key}")
+            self._sleep('shell')
+            return CommandResult('\n'.join(parts), '', 0)
+        output = self._output(cmd)
+        self._sleep(self._kind(cmd))
+        return CommandResult(output, '', 0)
+
+    def open_shell_stream(self, cmd: str) -> FakeStreamProcess:
+        """
+        持续输出的shell命令（SP_daemon -N），供 core.hdc.open_shell_stream 使用
+        :param cmd:
+        :return:
+        """
+        return FakeStreamProcess(self, cmd, self.stream_interval)
+
+    @staticmethod
+    def _kind(cmd: str) -> str:
+        if 'SP_daemon' in cmd:
+            return 'sp_daemon'
+        if 'hidumper' in cmd:
+            return 'hidumper'
+        return 'shell'
+
+    def _output(self, cmd: str) -> str:
+        if 'SP_daemon' in cmd:
+            return self.sp_daemon_output(cmd)
+        if 'hidumper --mem' in cmd:
+            return self.hidumper_mem_output()
+        if 'hidumper --cpuusage' in cmd:
+            return self.hidumper_cpu_output(cmd.split()[-1])
+        if cmd.strip().startswith('ps'):
+            return self.ps_output()
+        if '/proc/' in cmd and '/stat' in cmd:
+            return self.proc_stat_output(_STAT_PATTERN.findall(cmd))
+        return ''
+
+    def _walk(self, value: float, step: float, low: float, high: float) -> float:
+        return min(high, max(low, value + self.random.uniform(-step, step)))
+
+    def sp_daemon_output(self, cmd: str, samples: int = 1) -> str:
+        """
+        生成与 SP_daemon -c/-r/-f 格式一致的输出
+        :param cmd:
+        :param samples: 采样块个数
+        :return:
+        """
+        flags = set(cmd.split())
+        package = re.search(r'-PKG\s+(\S+)', cmd)
+        package = package.group(1) if package else ''
+        pid = self._apps.get(package, (None, 0))[0]
+        blocks = []
+        for _ in range(samples):
+            state = self._state
+            pairs: List[Tuple[str, Any]] = [('timestamp', int(time.time() * 1000))]
+            if '-c' in flags:
+                state['proc_cpu'] = self._walk(state['proc_cpu'], 5, 0, 100)
+                pairs += [('ProcAppName', package), ('ProcId', pid if pid else 'NA'), ('ProcCpuLoad', 'NA'),
+                          ('ProcCpuUsage', f"{state['proc_cpu']:.6f}"),
+                          ('ProcSCpuUsage', f"{state['proc_cpu'] * 0.3:.6f}"),
+                          ('ProcUCpuUsage', f"{state['proc_cpu'] * 0.7:.6f}")]
+                self._core_usage = [self._walk(usage, 10, 0, 100) for usage in self._core_usage]
+                total = sum(self._core_usage) / self.core_count
+                pairs += [('TotalcpuUsage', f"{total:.6f}"), ('TotalcpuidleUsage', f"{100 - total:.6f}"),
+                          ('TotalcpusystemUsage', f"{total * 0.4:.6f}"), ('TotalcpuuserUsage', f"{total * 0.6:.6f}")]
+                for core, usage in enumerate(self._core_usage):
+                    frequency = 2400000 if usage > 50 else 1992000 if usage > 20 else 1100000
+                    pairs += [(f'cpu{core}Frequency', frequency), (f'cpu{core}Usage', f"{usage:.6f}"),
+                              (f'cpu{core}idleUsage', f"{100 - usage:.6f}"),
+                              (f'cpu{core}irqUsage', '0.000000'),
+                              (f'cpu{core}systemUsage', f"{usage * 0.4:.6f}"),
+                              (f'cpu{core}userUsage', f"{usage * 0.6:.6f}")]
+            if '-r' in flags:
+                state['pss'] = self._walk(state['pss'], 4096, 100 * 1024, 2048 * 1024)
+                pss = int(state['pss'])
+                pairs += [('pss', pss), ('nativeHeapPss', pss * 3 // 10), ('arktsHeapPss', pss // 5),
+                          ('gpuPss', pss // 10), ('graphicPss', pss // 20), ('stackPss', 1024), ('swapPss', 'NA')]
+            if '-f' in flags:
+                state['fps'] = self._walk(state['fps'], 3, 30, 60)
+                pairs.append(('fps', int(state['fps'])))
+            blocks.append('\n'.join(f"order:{i} {key}={value}" for i, (key, value) in enumerate(pairs)))
+        return '\n'.join(blocks)
+
+    def hidumper_mem_output(self) -> str:
+        """
+        生成与 hidumper --mem <pid> 格式一致的内存分类表
+        :return:
+        """
+        pss = int(self._state['pss'])
+        rows = {
+            'GL': pss // 20, 'Graph': pss // 20, 'ark ts heap': pss // 5, 'guard': 0, 'native heap': pss * 3 // 10,
+            'AnonPage other': pss // 10, 'stack': 1024, '.so': pss // 10, 'dev': 4, 'FilePage other': pss // 10,
+        }
+        header = ['Pss Shared Shared Private Private Swap SwapPss Heap Heap Heap',
+                  'Total Clean Dirty Clean Dirty Total Total Size Alloc Free',
+                  ' '.join(['( kB )'] * 10), '-' * 80]
+        lines = [' ' * 20 + line for line in header]
+        total = [0] * 10
+        for name, value in rows.items():
+            heap = [value * 3 // 2, value, value // 2] if name == 'native heap' else [0, 0, 0]
+            values = [value, value // 10, value // 8, 0, value - value // 8, 0, 0] + heap
+            total = [a + b for a, b in zip(total, values)]
+            lines.append(f"{name:>20}" + ''.join(f"{v:>15}" for v in values))
+        lines.append(' ' * 20 + '-' * 80)
+        lines.append(f"{'Total':>20}" + ''.join(f"{v:>15}" for v in total))
+        return '\n'.join(lines) + '\n'
+
+    def hidumper_cpu_output(self, pid: str) -> str:
+        usage = self._state['proc_cpu']
+        name = next((package for package, (p, _) in self._apps.items() if str(p) == pid), 'unknown')
+        return (f"PID   Total Usage   User Space   Kernel Space   Page Fault Minor   Page Fault Major   Name\n"
+                f"{pid}   {usage:.2f}%   {usage * 0.7:.2f}%   {usage * 0.3:.2f}%   {self.random.randint(0, 500)}   0   "
+                f"{name}\n")
+
+    def ps_output(self) -> str:
+        lines = ["UID PID PPID C STIME TTY TIME CMD",
+                 "root 1 0 0 10:00:00 ? 00:00:05 init",
+                 "system 600 1 0 10:00:00 ? 00:00:01 render_service"]
+        for package, (pid, _) in self._apps.items():
+            lines.append(f"u0_a1 {pid} 600 0 10:00:00 ? 00:00:03 {package}")
+            lines.append(f"u0_a1 {pid + 1} {pid} 0 10:00:00 ? 00:00:00 {package}:render")
+        return '\n'.join(lines)
+
+    def proc_stat_output(self, pids: List[str]) -> str:
+        lines = []
+        for package, (pid, start) in self._apps.items():
+            for proc_pid, name in ((pid, package), (pid + 1, f"{package}:render")):
+                if str(proc_pid) in pids:
+                    fields = ['S'] + ['0'] * 18 + [str(start)] + ['0'] * 10
+                    lines.append(f"{proc_pid} ({name[-15:]}) {' '.join(fields)}")
+        return '\n'.join(lines)
+
+    # ---------------------------------------------------------------- 应用与UI
+
+    def start_app(self, package_name: str, page_name: Optional[str] = None):
+        with self._lock:
+            if package_name not in self._apps:
+                self._next_pid += 2
+                self._uptime_ticks += 100
+                self._apps[package_name] = (self._next_pid, self._uptime_ticks)
+        self._record('start_app', package_name, page_name)
+        self._sleep('ui')
+
+    def force_start_app(self, package_name: str, page_name: Optional[str] = None):
+        self.stop_app(package_name)
+        self.start_app(package_name, page_name)
+
+    def stop_app(self, package_name: str):
+        with self._lock:
+            self._apps.pop(package_name, None)
+        self._record('stop_app', package_name)
+        self._sleep('ui')
+
+    def current_app(self) -> Tuple[Optional[str], Optional[str]]:
+        package = next(iter(self._apps), None)
+        return package, None
+
+    def xpath(self, xpath: str) -> FakeElement:
+        self._sleep('ui')
+        return FakeElement(self, xpath)
+
+    def screenshot(self, path: str, method: str = 'snapshot_display') -> str:
+        """
+        生成一张合成截图（纯色背景加噪声）
+        :param path:
+        :param method:
+        :return:
+        """
+        width, height = self.screen_size
+        image = np.full((height // 4, width // 4, 3), 240, dtype=np.uint8)
+        image += np.random.default_rng(self.random.randint(0, 2 ** 31)).integers(0, 15, image.shape, dtype=np.uint8)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        cv2.imwrite(path, cv2.resize(image, (width, height), interpolation=cv2.INTER_NEAREST))
+        self._record('screenshot', path)
+        self._sleep('screenshot')
+        return path
+
+    def display_size(self) -> Tuple[int, int]:
+        return self.screen_size
+
+    def click(self, x, y):
+        self._record('click', x, y)
+        self._sleep('ui')
+
+    def double_click(self, x, y):
+        self._record('double_click', x, y)
+        self._sleep('ui')
+
+    def long_click(self, x, y):
+        self._record('long_click', x, y)
+        self._sleep('ui')
+
+    def swipe(self, x1, y1, x2, y2, speed: int = 2000):
+        self._record('swipe', x1, y1, x2, y2)
+        self._sleep('ui')
+
+    def input_text(self, text: str):
+        self._record('input_text', text)
+        self._sleep('ui')
+
+    def go_home(self):
+        self._record('go_home')
+
+    def go_back(self):
+        self._record('go_back')
+
+    def unlock(self):
+        self._record('unlock')
+
+    def push_file(self, lpath: str, rpath: str):
+        self._record('push_file', lpath, rpath)
+
+    def pull_file(self, rpath: str, lpath: str):
+        self._record('pull_file', rpath, lpath)
+
+
+class FakeHDC(HDC):
+    """
+    使用 FakeDriver 的 HDC，可直接传给 ThreadMemCPU、DevicePool 和场景脚本
+    """
+
+    def __init__(self, serial: str = 'fake-0', **driver_kwargs):
+        """
+        :param serial:
+        :param driver_kwargs: 透传给 FakeDriver 的参数
+        """
+        self.driver_kwargs = driver_kwargs
+        super().__init__(serial)
+
+    def init_hdc_driver(self, serial=None) -> FakeDriver:
+        logger.debug(f"初始化模拟设备 {serial}")
+        return FakeDriver(serial or 'fake-0', **self.driver_kwargs)
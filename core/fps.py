@@ -0,0 +1,50 @@
+# !/usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+@Version  : Python 3.12
+@Time     : 2025/7/6 15:20
+@Author   : wieszheng
+@Software : PyCharm
+"""
+from typing import Dict, Any
+
+from core.hdc import HDC
+from core.metric_schema import SP_DAEMON_SCHEMA
+from core.sp_daemon_stream import SpDaemonBlockParser
+from hmdriver2.driver import Driver
+
+
+class FpsMonitor:
+    def __init__(self, device):
+        self.device: Driver = device
+
+    def get_sp_daemon_fps(self, package_name: str) -> Dict[str, Any]:
+        """
+        获取指定包名的帧率
+        :param package_name:
+        :return:
+        """
+        out = self.device.shell(f"SP_daemon -PKG {package_name} -f -N 1").output
+        parser = SpDaemonBlockParser()
+        blocks = parser.feed(out) + parser.close()
+        if not blocks:
+            raise ValueError("帧率数据格式不正确，未找到有效数据块")
+        return self.parse_sp_daemon_fields(blocks[-1])
+
+    def parse_sp_daemon_fields(self, fields: Dict[str, str]) -> Dict[str, Any]:
+        """
+        将SP_daemon的原始键值对转换为帧率数据
+        :param fields: 一个采样块的 key -> value 字符串
+        :return:
+        """
+        record = SP_DAEMON_SCHEMA.record(fields, groups=('meta', 'fps'))
+        return {
+            'fps': record.get('fps') or 0,
+            'timestamp': record.get('timestamp') or 0,
+        }
+
+
+if __name__ == '__main__':
+    hdc = HDC()
+    fps_monitor = FpsMonitor(hdc.driver)
+    print(fps_monitor.get_sp_daemon_fps("com.baidu.yiyan.ent"))
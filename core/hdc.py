@@ -7,7 +7,8 @@
 @Software : PyCharm
 """
 import os
-from typing import Optional, Tuple
+import subprocess
+from typing import Dict, List, Optional, Tuple
 from loguru import logger
 from hmdriver2.driver import Driver
 
@@ -52,6 +53,73 @@ class HDC:
         return find_image(source_image, template_image, method=mode, **kwargs)
 
 
+def hdc_prefix() -> List[str]:
+    """
+    hdc命令前缀，与hmdriver2一致：设置了 HDC_SERVER_HOST 和 HDC_SERVER_PORT 时连接远程hdc server
+    :return:
+    """
+    host = os.getenv('HDC_SERVER_HOST')
+    port = os.getenv('HDC_SERVER_PORT')
+    if host and port:
+        return ['hdc', '-s', f'{host}:{port}']
+    return ['hdc']
+
+
+def open_shell_stream(device: Driver, cmd: str) -> subprocess.Popen:
+    """
+    启动一个长驻的hdc shell进程，stdout以管道方式持续读取
+    Driver.shell会等待命令结束后一次性返回输出，不适用于SP_daemon -N这类持续输出的命令
+    设备对象自身提供 open_shell_stream 时（如模拟设备）交由其处理
+    :param device:
+    :param cmd: 设备端执行的命令
+    :return:
+    """
+    if hasattr(device, 'open_shell_stream'):
+        return device.open_shell_stream(cmd)
+    # 命令作为单个参数直接交给hdc，不经过主机shell，无需处理引号和 $ 展开
+    args = [*hdc_prefix(), '-t', device.serial, 'shell', cmd]
+    logger.debug(f"启动流式命令: {args}")
+    return subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+
+
+BATCH_BEGIN = '__PERF_BEGIN__'
+BATCH_END = '__PERF_END__'
+
+
+def run_batch_shell(device: Driver, commands: Dict[str, str], chunk_size: int = 32) -> Dict[str, str]:
+    """
+    在一次shell调用中执行多条命令，用哨兵行分隔各命令的输出
+    命令会被hdc包裹在双引号中，命令本身不能包含双引号
+    :param device:
+    :param commands: key -> 命令，key只能包含字母数字
+    :param chunk_size: 每次shell调用最多包含的命令数，避免命令行过长
+    :return: key -> 输出
+    """
+    results: Dict[str, str] = {}
+    items = list(commands.items())
+    for start in range(0, len(items), chunk_size):
+        # 结束哨兵前多输出一个换行，命令输出末尾没有换行时哨兵也独占一行
+        script = '; '.join(
+            f"echo {BATCH_BEGIN}{key}; {cmd}; echo; echo {BATCH_END}{key}"
+            for key, cmd in items[start:start + chunk_size]
+        )
+        out = device.shell(script).output
+        key, lines = None, []
+        for line in out.splitlines():
+            stripped = line.strip()
+            if stripped.startswith(BATCH_BEGIN):
+                key, lines = stripped[len(BATCH_BEGIN):], []
+            elif stripped.startswith(BATCH_END) and key is not None:
+                if lines and lines[-1] == '':
+                    # 去掉多输出的换行产生的空行
+                    lines.pop()
+                results[key] = '\n'.join(lines)
+                key = None
+            elif key is not None:
+                lines.append(line)
+    return results
+
+
 if __name__ == '__main__':
     hdc = HDC()
     print(hdc.find_image(os.path.join(ROOT_PATH, r'config\pic\back.jpeg')))
@@ -0,0 +1,126 @@
+# !/usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+@Version  : Python 3.12
+@Time     : 2025/7/16 20:41
+@Author   : wieszheng
+@Software : PyCharm
+"""
+import re
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# hidumper --mem 的默认列（单位kB），表头解析失败时使用
+HIDUMPER_MEM_COLUMNS = [
+    'pss_total', 'shared_clean', 'shared_dirty', 'private_clean', 'private_dirty',
+    'swap_total', 'swappss_total', 'heap_size', 'heap_alloc', 'heap_free',
+]
+
+# 数据行至少包含的数值列数，用于排除表格之前的 pid 等说明行
+_MIN_COLUMNS = 4
+_NUMBER = re.compile(r'^-?\d+$')
+_SEPARATOR = re.compile(r'^-{10,}$')
+
+
+@dataclass
+class MemTable:
+    """
+    hidumper --mem 的内存分类表，行为内存分类（native heap、ark ts heap...），列为各统计项，单位kB
+    """
+    rows: List[str]
+    columns: List[str]
+    data: np.ndarray
+
+    def __post_init__(self):
+        self._row_index = {name: i for i, name in enumerate(self.rows)}
+        self._column_index = {name: i for i, name in enumerate(self.columns)}
+
+    def __contains__(self, row: str) -> bool:
+        return row in self._row_index
+
+    def get(self, row: str, column: Optional[str] = None, default: int = 0) -> int:
+        """
+        :param row: 分类名
+        :param column: 列名，为空时取第一列（Pss Total）
+        :param default: 分类或列不存在时的返回值
+        :return:
+        """
+        i = self._row_index.get(row)
+        j = 0 if column is None else self._column_index.get(column)
+        if i is None or j is None:
+            return default
+        return int(self.data[i, j])
+
+    def row(self, name: str) -> Dict[str, int]:
+        return dict(zip(self.columns, self.data[self._row_index[name]].tolist()))
+
+    def column(self, name: str) -> Dict[str, int]:
+        return dict(zip(self.rows, self.data[:, self._column_index[name]].tolist()))
+
+    def to_dict(self) -> Dict[str, Dict[str, int]]:
+        """
+        :return: 分类 -> 列 -> 值
+        """
+        return {name: self.row(name) for name in self.rows}
+
+    def flatten(self, columns: Optional[List[str]] = None) -> Dict[str, int]:
+        """
+        展开为一行，键为“分类.列”，便于按任意列写日志或画图
+        :param columns: 只保留这些列，为空时保留全部
+        :return:
+        """
+        columns = columns or self.columns
+        return {f"{row}.{column}": self.get(row, column) for row in self.rows for column in columns}
+
+
+def _column_names(header_lines: List[List[str]], width: int) -> List[str]:
+    """
+    多行表头按列拼接为列名，如 Pss/Total -> pss_total；无法对齐时使用默认列名
+    """
+    lines = [tokens for tokens in header_lines if len(tokens) == width and not tokens[0].startswith('(')]
+    if not lines:
+        return HIDUMPER_MEM_COLUMNS[:width] if width <= len(HIDUMPER_MEM_COLUMNS) else \
+            [f'col{i}' for i in range(width)]
+    return ['_'.join(line[i] for line in lines).lower() for i in range(width)]
+
+
+def parse_mem_table(out: str) -> MemTable:
+    """
+    一次扫描解析hidumper --mem输出中的整张内存分类表
+    数据行为“分类名 + 固定个数的整数”，分类名可包含空格；遇到表格后的第一个空行结束
+    :param out:
+    :return:
+    """
+    header: List[List[str]] = []
+    rows: List[str] = []
+    values: List[List[int]] = []
+    width = 0
+    for line in out.splitlines():
+        tokens = line.split()
+        if not tokens:
+            if rows:
+                break
+            header.clear()
+            continue
+        if _SEPARATOR.match(tokens[0]):
+            continue
+        # 从右往左取连续的整数列
+        n = 0
+        while n < len(tokens) and _NUMBER.match(tokens[-1 - n]):
+            n += 1
+        if n < _MIN_COLUMNS or n == len(tokens):
+            if not rows:
+                header.append(tokens)
+            continue
+        if width == 0:
+            width = n
+        elif n != width:
+            continue
+        rows.append(' '.join(tokens[:-n]))
+        values.append([int(token) for token in tokens[-n:]])
+    if not rows:
+        raise ValueError("内存数据格式不正确，未找到内存分类表")
+    data = np.array(values, dtype=np.int64)
+    return MemTable(rows=rows, columns=_column_names(header, width), data=data)
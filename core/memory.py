@@ -6,29 +6,31 @@
 @Author   : wieszheng
 @Software : PyCharm
 """
-import re
-from typing import Dict, Any
+from typing import Dict, Any, Iterator, List
 
 from loguru import logger
 
-from core.hdc import HDC
+from core.hdc import HDC, run_batch_shell
+from core.mem_table import MemTable, parse_mem_table
+from core.metric_schema import SP_DAEMON_SCHEMA
+from core.sp_daemon_stream import SpDaemonStream
+from core.sp_parser import parse_fields
 from hmdriver2.driver import Driver
 
+# 输出字段 -> SP_daemon键，单位换算（KB -> MB）由指标表完成
+MEMORY_FIELDS = {
+    'total_pss_mb': 'pss',
+    'native_heap_pss_mb': 'nativeHeapPss',
+    'ark_ts_heap_pss_mb': 'arktsHeapPss',
+    'gpu_pss_mb': 'gpuPss',
+    'graphic_pss_mb': 'graphicPss',
+    'stack_pas_mb': 'stackPss',
+    'swap_pss_mb': 'swapPss',
+}
 
-def find_first_digit(data):
-    """
-    从字符串中找出第一个数字
-    :param data:
-    :return:
-    """
-    for index, item in enumerate(data):
-        if item.isdigit():  # 只能判断非负整数字符串
-            return {
-                "index": index,
-                "value": int(item),
-                "type": "int"
-            }
-    return None
+# get_hidumper_memory 返回的分类
+HIDUMPER_MEM_ROWS = ["GL", "Graph", "ark ts heap", "guard", "native heap", "AnonPage other", "stack", "dev",
+                     "FilePage other"]
 
 
 class MemoryMonitor:
@@ -41,43 +43,44 @@ class MemoryMonitor:
         :param pid:
         :return:
         """
-        mem_data = {
-            "GL": 0,
-            "Graph": 0,
-            "ark ts heap": 0,
-            "guard": 0,
-            "native heap": 0,
-            "AnonPage other": 0,
-            "stack": 0,
-            "dev": 0,
-            "FilePage other": 0
-        }
-
         # 使用hidumper --mem获取系统内存信息
         out = self.device.shell(f"hidumper --mem {pid}").output
+        return self.parse_hidumper_memory(out)
+
+    def get_hidumper_memory_batch(self, pids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        一次shell调用获取多个进程的内存信息
+        :param pids:
+        :return: pid -> 内存信息
+        """
+        outputs = run_batch_shell(self.device, {str(pid): f"hidumper --mem {pid}" for pid in pids})
+        result = {}
+        for pid, out in outputs.items():
+            try:
+                result[pid] = self.parse_hidumper_memory(out)
+            except (AttributeError, ValueError) as e:
+                logger.warning(f"解析进程{pid}内存失败: {e}")
+        return result
 
-        for line in out.splitlines():
-            line = line.strip()
-            if line.startswith("GL"):
-                mem_data["GL"] = find_first_digit(line.split()).get("value")
-            elif line.startswith("Graph"):
-                mem_data["Graph"] = find_first_digit(line.split()).get("value")
-            elif line.startswith("ark"):
-                mem_data["ark ts heap"] = find_first_digit(line.split()).get("value")
-            elif line.startswith("guard"):
-                mem_data["guard"] = find_first_digit(line.split()).get("value")
-            elif line.startswith("native"):
-                mem_data["native heap"] = find_first_digit(line.split()).get("value")
-            elif line.startswith("AnonPage"):
-                mem_data["AnonPage other"] = find_first_digit(line.split()).get("value")
-            elif line.startswith("stack"):
-                mem_data["stack"] = find_first_digit(line.split()).get("value")
-            elif line.startswith("dev"):
-                mem_data["dev"] = find_first_digit(line.split()).get("value")
-            elif line.startswith("FilePage"):
-                mem_data["FilePage other"] = find_first_digit(line.split()).get("value")
-                break
-        mem_data["Total"] = sum(value for value in mem_data.values() if isinstance(value, int))
+    def get_hidumper_mem_table(self, pid: str) -> MemTable:
+        """
+        获取指定进程完整的内存分类表（所有分类、所有列）
+        :param pid:
+        :return:
+        """
+        out = self.device.shell(f"hidumper --mem {pid}").output
+        return parse_mem_table(out)
+
+    @staticmethod
+    def parse_hidumper_memory(out: str) -> Dict[str, Any]:
+        """
+        解析hidumper --mem的输出，取常用分类的Pss Total
+        :param out:
+        :return:
+        """
+        table = parse_mem_table(out)
+        mem_data = {name: table.get(name) for name in HIDUMPER_MEM_ROWS}
+        mem_data["Total"] = sum(mem_data.values())
         return mem_data
 
     def get_sp_daemon_memory(self, package_name: str) -> Dict[str, Any]:
@@ -86,48 +89,41 @@ class MemoryMonitor:
         :param package_name:
         :return:
         """
+        return self.parse_sp_daemon_fields(self.get_sp_daemon_fields(package_name))
+
+    def get_sp_daemon_fields(self, package_name: str) -> Dict[str, str]:
+        """
+        执行一次SP_daemon -r，返回原始键值对
+        :param package_name:
+        :return:
+        """
         out = self.device.shell(f"SP_daemon -PKG {package_name} -r -N 1").output
-        data_block = re.search(r'(?s)order:.*', out)
-        if not data_block:
+        fields = parse_fields(out)
+        if not fields:
             raise ValueError("内存数据格式不正确，未找到有效数据块")
-        raw_data = data_block.group(0)
-        parsed_data = {}
-        for line in raw_data.strip().split('\n'):
-            line = line.strip()
-            if not line or '=' not in line:
-                continue
-            # 提取键和值
-            try:
-                # 处理 "order:X key=value" 格式
-                parts = re.split(r'\s+', line, 1)
-                key_value = parts[-1]
-                if '=' in key_value:
-                    key, value = key_value.split('=', 1)
-                    if value == 'NA':
-                        parsed_data[key] = None
-                    else:
-                        try:
-                            parsed_data[key] = int(value)
-                        except ValueError:
-                            try:
-                                parsed_data[key] = float(value)
-                            except ValueError:
-                                parsed_data[key] = value  # 保留为字符串
-            except (IndexError, ValueError) as e:
-                logger.warning(f"解析行失败: {line} - {str(e)}")
-                continue
-        return {
-            'total_pss_mb': round(parsed_data.get('pss', 0) / 1024, 2) if parsed_data.get('pss') else 0,
-            'native_heap_pss_mb': round(parsed_data.get('nativeHeapPss', 0) / 1024, 2) if parsed_data.get(
-                'nativeHeapPss') else 0,
-            'ark_ts_heap_pss_mb': round(parsed_data.get('arktsHeapPss', 0) / 1024, 2) if parsed_data.get(
-                'arktsHeapPss') else 0,
-            'gpu_pss_mb': round(parsed_data.get('gpuPss', 0) / 1024, 2) if parsed_data.get('gpuPss') else 0,
-            'graphic_pss_mb': round(parsed_data.get('graphicPss', 0) / 1024, 2) if parsed_data.get('graphicPss') else 0,
-            'stack_pas_mb': round(parsed_data.get('stackPss', 0) / 1024, 2) if parsed_data.get('stackPss') else 0,
-            'swap_pss_mb': round(parsed_data.get('swapPss', 0) / 1024, 2) if parsed_data.get('swapPss') else 0,
-            'timestamp': parsed_data.get('timestamp', 0),
-        }
+        return fields
+
+    def parse_sp_daemon_fields(self, fields: Dict[str, str]) -> Dict[str, Any]:
+        """
+        将SP_daemon的原始键值对转换为内存数据（MB）
+        :param fields: 一个采样块的 key -> value 字符串
+        :return:
+        """
+        record = SP_DAEMON_SCHEMA.record(fields, groups=('meta', 'memory'))
+        result = {name: record.get(key) or 0 for name, key in MEMORY_FIELDS.items()}
+        result['timestamp'] = record.get('timestamp') or 0
+        return result
+
+    def stream_sp_daemon_memory(self, package_name: str, count: int = 3600) -> Iterator[Dict[str, Any]]:
+        """
+        流式获取内存数据，整个会话只启动一次SP_daemon
+        :param package_name:
+        :param count: 采样次数
+        :return:
+        """
+        with SpDaemonStream(self.device, package_name, items=("r",), count=count) as stream:
+            for fields in stream:
+                yield self.parse_sp_daemon_fields(fields)
 
 
 if __name__ == '__main__':
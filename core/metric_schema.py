@@ -0,0 +1,193 @@
+# !/usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+@Version  : Python 3.12
+@Time     : 2025/7/15 22:08
+@Author   : wieszheng
+@Software : PyCharm
+"""
+import re
+from dataclasses import dataclass, field, replace
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence
+
+import numpy as np
+
+
+CORE_PLACEHOLDER = '{core}'
+
+
+@dataclass(frozen=True)
+class MetricDef:
+    """
+    一个指标的声明：SP_daemon键、分组、单位和换算
+    每核指标的键用 {core} 占位，如 cpu{core}Usage
+    """
+    key: str
+    group: str
+    unit: str = ''
+    scale: float = 1.0
+    dtype: str = 'f8'
+    precision: Optional[int] = None
+    raw_unit: str = ''
+    kind: str = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        object.__setattr__(self, 'kind', np.dtype(self.dtype).kind)
+
+    @property
+    def is_numeric(self) -> bool:
+        return self.kind in 'iuf'
+
+    def convert(self, value: Optional[str]) -> Any:
+        """
+        原始字符串转换为目标单位下的数值，NA或空值为None
+        :param value:
+        :return:
+        """
+        if value is None or value == 'NA' or value == '':
+            return None
+        kind = self.kind
+        if kind not in 'iuf':
+            return value
+        try:
+            number = float(value) * self.scale
+        except ValueError:
+            return None
+        if kind in 'iu':
+            return int(number)
+        return round(number, self.precision) if self.precision is not None else number
+
+    @property
+    def column(self) -> str:
+        """
+        写入CSV时的列名：采集时做过单位换算的指标带目标单位后缀（如 pss_mb），
+        以便与旧版按原始单位写入的列区分
+        :return:
+        """
+        return f"{self.key}_{self.unit.lower()}" if self.raw_unit else self.key
+
+    def bind(self, core: str) -> "MetricDef":
+        return replace(self, key=self.key.replace(CORE_PLACEHOLDER, core))
+
+
+class MetricSchema:
+    """
+    声明式指标表，驱动SP_daemon输出的统一解析
+    键到指标定义的查找结果按键缓存；单个采样转换为带类型的记录，多个采样转换为NumPy结构化数组，
+    单位换算只在采集入口做一次，之后的写入、分析和渲染直接使用目标单位。
+    """
+
+    def __init__(self, metrics: Iterable[MetricDef]):
+        self.metrics = list(metrics)
+        self._exact = {m.key: m for m in self.metrics if CORE_PLACEHOLDER not in m.key}
+        self._templates = [
+            (re.compile('^' + re.escape(m.key).replace(re.escape(CORE_PLACEHOLDER), r'(\d+)') + '$'), m)
+            for m in self.metrics if CORE_PLACEHOLDER in m.key
+        ]
+        self._cache: Dict[str, Optional[MetricDef]] = {}
+
+    def lookup(self, key: str) -> Optional[MetricDef]:
+        """
+        按SP_daemon键查找指标定义，每核指标绑定到具体核心
+        :param key:
+        :return: 未声明的键返回None
+        """
+        try:
+            return self._cache[key]
+        except KeyError:
+            pass
+        metric = self._exact.get(key)
+        if metric is None:
+            for pattern, template in self._templates:
+                match = pattern.match(key)
+                if match:
+                    metric = template.bind(match.group(1))
+                    break
+        self._cache[key] = metric
+        return metric
+
+    def convert(self, key: str, value: Optional[str]) -> Any:
+        """
+        转换一个键值，未声明的键：NA为None，数值按是否含小数点转为float/int，其余保留字符串
+        :param key:
+        :param value:
+        :return:
+        """
+        metric = self.lookup(key)
+        if metric is not None:
+            return metric.convert(value)
+        if value is None or value == 'NA':
+            return None
+        try:
+            return float(value) if '.' in value else int(value)
+        except ValueError:
+            return value
+
+    def record(self, fields: Mapping[str, str], groups: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+        """
+        一个采样块的原始键值对转换为带类型的记录
+        :param fields: key -> value 字符串
+        :param groups: 只保留这些分组的已声明指标，为空时保留全部键
+        :return: key -> 目标单位下的值
+        """
+        if groups is None:
+            return {key: self.convert(key, value) for key, value in fields.items()}
+        result = {}
+        for key, value in fields.items():
+            metric = self.lookup(key)
+            if metric is not None and metric.group in groups:
+                result[key] = metric.convert(value)
+        return result
+
+    def column(self, key: str) -> str:
+        """
+        键对应的CSV列名，未声明的键原样返回
+        :param key:
+        :return:
+        """
+        metric = self.lookup(key)
+        return metric.column if metric is not None else key
+
+    def key_of(self, column: str) -> str:
+        """
+        CSV列名还原为SP_daemon键，column的逆操作
+        :param column:
+        :return:
+        """
+        key, _, _ = column.rpartition('_')
+        metric = self.lookup(key) if key else None
+        return key if metric is not None and metric.column == column else column
+
+    def group_of(self, key: str) -> Optional[str]:
+        metric = self.lookup(key)
+        return metric.group if metric is not None else None
+
+    def dtype(self, keys: Sequence[str]) -> np.dtype:
+        """
+        一组键对应的结构化数组类型
+        :param keys:
+        :return:
+        """
+        return np.dtype([(key, self.lookup(key).dtype) for key in keys])
+
+
+_CORE_USAGE = ["Usage", "idleUsage", "ioWaitUsage", "irqUsage", "niceUsage", "softIrqUsage", "systemUsage",
+               "userUsage"]
+
+SP_DAEMON_METRICS: List[MetricDef] = [
+    MetricDef('timestamp', 'meta', unit='ms', dtype='i8'),
+    MetricDef('ProcAppName', 'process', dtype='U128'),
+    MetricDef('ProcId', 'process', dtype='i8'),
+    MetricDef('ProcCpuLoad', 'process', unit='%'),
+    MetricDef('ProcCpuUsage', 'process', unit='%'),
+    MetricDef('ProcSCpuUsage', 'process', unit='%'),
+    MetricDef('ProcUCpuUsage', 'process', unit='%'),
+    *[MetricDef(f'Totalcpu{metric}', 'system', unit='%') for metric in _CORE_USAGE],
+    MetricDef('cpu{core}Frequency', 'cpu', unit='GHz', scale=1 / 1_000_000, precision=2, raw_unit='kHz'),
+    *[MetricDef(f'cpu{{core}}{metric}', 'cpu', unit='%') for metric in _CORE_USAGE],
+    *[MetricDef(key, 'memory', unit='MB', scale=1 / 1024, precision=2, raw_unit='KB')
+      for key in ['pss', 'nativeHeapPss', 'arktsHeapPss', 'gpuPss', 'graphicPss', 'stackPss', 'swapPss']],
+    MetricDef('fps', 'fps', unit='fps', dtype='i8'),
+]
+
+SP_DAEMON_SCHEMA = MetricSchema(SP_DAEMON_METRICS)
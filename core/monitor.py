@@ -6,7 +6,6 @@
 @Author   : wieszheng
 @Software : PyCharm
 """
-import os
 import re
 from datetime import datetime
 from typing import Any, Dict
@@ -14,14 +13,19 @@ from typing import Any, Dict
 import pandas as pd
 from loguru import logger
 
+from core.metric_schema import SP_DAEMON_SCHEMA
+from core.sp_parser import parse_fields
+from core.writer import CsvBatchWriter, csv_segments
 from hmdriver2.driver import Driver
 from pandas import Timestamp
 
+CORE_USAGE_PATTERN = re.compile(r'cpu\d+Usage$')
+
 
 class Monitor:
     def __init__(self, hdc: Any):
-        pass
         # self.device: Driver = hdc.device
+        self._csv_writers: Dict[str, CsvBatchWriter] = {}
 
     def get_once_sp_daemon_data(
             self,
@@ -34,7 +38,7 @@ class Monitor:
             is_temp: bool = False,
     ) -> Dict[str, Any]:
         """
-        获取一次SP_daemon数据
+        获取一次SP_daemon数据，取值已按指标表转换为目标单位（频率GHz、内存MB），NA为None
         :param package_name:
         :param is_cpu:
         :param is_memory:
@@ -107,28 +111,11 @@ class Monitor:
           order:43 cpu3systemUsage=0.000000
           order:44 cpu3userUsage=0.000000
         '''
-        data_block = re.search(r'(?s)order:.*', out)
-        if not data_block:
+        fields = parse_fields(out)
+        if not fields:
             logger.error("内存数据格式不正确，未找到有效数据块")
             raise ValueError("内存数据格式不正确，未找到有效数据块")
-        raw_data = data_block.group(0)
-        parsed_data = {}
-
-        for line in raw_data.strip().split('\n'):
-            line = line.strip()
-            if not line or '=' not in line:
-                continue
-
-            try:
-                match = re.search(r'(\w+)=(NA|\d+\.?\d*|\w[\w\.\-]*)', line)
-                if match:
-                    key, value = match.groups()
-                    parsed_data[key] = None if value == 'NA' else value
-            except Exception as e:
-                logger.error(f"解析数据错误：{e}")
-                raise ValueError(f"解析数据错误：{e}")
-
-        return parsed_data
+        return SP_DAEMON_SCHEMA.record(fields)
 
     def write_once_sp_daemon_csv(
             self,
@@ -136,37 +123,50 @@ class Monitor:
             filename: str,
     ):
         """
-        写入SP_daemon数据
-        :param data:
+        写入SP_daemon数据，文件保持打开并批量写盘，结束时需调用close
+        换算过单位的列名带单位后缀，如 pss_mb、cpu0Frequency_ghz
+        :param data: get_once_sp_daemon_data的结果
         :param filename:
         :return:
         """
-        file_exists = os.path.isfile(filename)
-        df = pd.DataFrame([data])
-        df.to_csv(filename, mode='a', header=not file_exists, index=False)
+        writer = self._csv_writers.get(filename)
+        if writer is None:
+            writer = self._csv_writers[filename] = CsvBatchWriter(filename)
+        writer.write({SP_DAEMON_SCHEMA.column(key): value for key, value in data.items()})
+
+    def flush(self):
+        """
+        将缓存的SP_daemon数据写盘
+        :return:
+        """
+        for writer in self._csv_writers.values():
+            writer.flush()
+
+    def close(self):
+        """
+        写完缓存的数据并关闭所有CSV文件
+        :return:
+        """
+        for writer in self._csv_writers.values():
+            writer.close()
+        self._csv_writers.clear()
 
     @staticmethod
     def parser_cpu_data(cpu_data: Dict[str, Any]):
         """
-        解析CPU数据
-        :param cpu_data:
+        解析CPU数据，频率单位GHz
+        :param cpu_data: get_once_sp_daemon_data的结果
         :return:
         """
         freq_info = {}
         usage_info = {}
         for key, value in cpu_data.items():
-            if re.match(r'cpu(\d+)Frequency', key):
-                if value in (None, 'NA'):
-                    freq_info[key] = 0
-                else:
-                    mhz_value = round(float(value) / 1_000_000, 2)  # MHz
-                    freq_info[key] = mhz_value
-
-            elif re.match(r'cpu(\d+)Usage', key):
-                if value in (None, 'NA'):
-                    usage_info[key] = 0
-                else:
-                    usage_info[key] = round(float(value), 2)
+            if SP_DAEMON_SCHEMA.group_of(key) != 'cpu':
+                continue
+            if key.endswith('Frequency'):
+                freq_info[key] = value or 0
+            elif CORE_USAGE_PATTERN.match(key):
+                usage_info[key] = round(value, 2) if value is not None else 0
 
         return {"freq": freq_info, "usage": usage_info}
 
@@ -180,15 +180,11 @@ class Monitor:
             ...
         }
         """
-        memory_info = {}
-        for key, value in memory_data.items():
-            if (key.endswith("Pss") and not key.startswith("child")) or key == "pss":
-                if value in (None, 'NA'):
-                    memory_info[key] = 0
-                else:
-                    mb_value = float(value) / 1024
-                    memory_info[key] = round(mb_value, 2)
-        return memory_info
+        return {
+            key: value or 0
+            for key, value in memory_data.items()
+            if SP_DAEMON_SCHEMA.group_of(key) == 'memory'
+        }
 
     @staticmethod
     def parser_fps_data(fps_data: Dict[str, Any]) -> Dict:
@@ -215,14 +211,40 @@ class Monitor:
     def parser_temp_data(self):
         pass
 
+    @staticmethod
+    def normalize_csv_columns(df: pd.DataFrame) -> pd.DataFrame:
+        """
+        CSV列统一为目标单位下的SP_daemon键
+        旧版CSV的列名没有单位后缀，取值为原始单位（内存KB、频率kHz），按指标表换算
+        :param df:
+        :return:
+        """
+        for col in list(df.columns):
+            metric = SP_DAEMON_SCHEMA.lookup(col)
+            if metric is None or not metric.raw_unit:
+                continue
+            legacy = pd.to_numeric(df.pop(col), errors='coerce') * metric.scale
+            if metric.precision is not None:
+                legacy = legacy.round(metric.precision)
+            df[metric.column] = df[metric.column].fillna(legacy) if metric.column in df else legacy
+        return df.rename(columns=SP_DAEMON_SCHEMA.key_of)
+
     def parser_data_to_json(self, csv_file_path: str):
         """
         解析CSV文件，生成结构化JSON数据并保存
         :param csv_file_path: 输入CSV路径
         :param output_json: 输出JSON路径
         """
+        writer = self._csv_writers.get(csv_file_path)
+        if writer is not None:
+            writer.flush()
         try:
-            df = pd.read_csv(csv_file_path, encoding='utf-8')
+            # 采集过程中列发生变化时数据分为多段，按顺序拼接，缺失的列为NaN
+            frames = [self.normalize_csv_columns(pd.read_csv(path, encoding='utf-8'))
+                      for path in csv_segments(csv_file_path)]
+            if not frames:
+                raise FileNotFoundError(csv_file_path)
+            df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
         except Exception as e:
             logger.error(f"读取CSV文件失败: {e}")
             return
@@ -230,9 +252,9 @@ class Monitor:
         result = {}
         cpu_freq_stats, cpu_usage_stats, mem_stats = [], [], []
 
-        def build_series(col, func, scale=1):
+        def build_series(col):
             return [
-                {"timestamp": row['timestamp'], "value": round(func(row[col]), 2)}
+                {"timestamp": row['timestamp'], "value": round(float(row[col]), 2)}
                 for _, row in df.iterrows()
             ]
 
@@ -241,31 +263,32 @@ class Monitor:
             if col == "timestamp":
                 continue
 
-            if re.search(r'cpu(\d+)Frequency', col):
+            # 取值已统一为目标单位（频率GHz、内存MB）
+            group = SP_DAEMON_SCHEMA.group_of(col)
+            if group == 'cpu' and col.endswith('Frequency'):
                 core_name = col.replace('Frequency', '')
-                freq_series = df[col] / 1_000_000
-                result[col] = {"data": build_series(col, lambda x: x / 1_000_000)}
+                result[col] = {"data": build_series(col)}
                 cpu_freq_stats.append({
-                    "Max": round(freq_series.max(), 2),
-                    "Min": round(freq_series.min(), 2),
-                    "Ave": round(freq_series.mean(), 2),
+                    "Max": round(df[col].max(), 2),
+                    "Min": round(df[col].min(), 2),
+                    "Ave": round(df[col].mean(), 2),
                     "Name": core_name
                 })
-            elif re.search(r'cpu(\d+)Usage', col):
+            elif group == 'cpu' and CORE_USAGE_PATTERN.match(col):
                 core_name = col.replace("Usage", "")
-                result[col] = {"data": build_series(col, float)}
+                result[col] = {"data": build_series(col)}
                 cpu_usage_stats.append({
                     "Max": round(df[col].max(), 2),
                     "Min": round(df[col].min(), 2),
                     "Ave": round(df[col].mean(), 2),
                     "Name": core_name
                 })
-            elif (col.endswith("Pss") and not col.startswith("child")) or col == "pss":
-                result[col] = {"data": build_series(col, lambda x: x / 1024)}
+            elif group == 'memory':
+                result[col] = {"data": build_series(col)}
                 mem_stats.append({
-                    "Max": round(df[col].max() / 1024, 2),
-                    "Min": round(df[col].min() / 1024, 2),
-                    "Ave": round(df[col].mean() / 1024, 2),
+                    "Max": round(df[col].max(), 2),
+                    "Min": round(df[col].min(), 2),
+                    "Ave": round(df[col].mean(), 2),
                     "Name": col
                 })
 
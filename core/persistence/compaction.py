@@ -0,0 +1,301 @@
+# !/usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+@Version  : Python 3.12
+@Time     : 2025/7/22 20:45
+@Author   : wieszheng
+@Software : PyCharm
+"""
+import argparse
+import json
+import os
+import shutil
+from collections import defaultdict
+from dataclasses import dataclass, field, asdict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+from sqlalchemy import select, insert, delete
+
+from config.conf import ROOT_PATH
+from core.persistence.db import DB_PATH, SQLPersister
+from core.persistence.models import TestRuns, Apps, MonitorData, MetricSample, MetricSampleCompact
+
+
+def minmax_indices(timestamps: np.ndarray, values: np.ndarray, max_points: int) -> np.ndarray:
+    """
+    等分为 max_points/2 个桶，每桶保留最小值和最大值，峰值不会丢失
+    :return: 保留的下标，升序
+    """
+    count = len(values)
+    buckets = max(1, max_points // 2)
+    if count <= max_points:
+        return np.arange(count)
+    edges = np.linspace(0, count, buckets + 1).astype(np.int64)
+    indices = [0, count - 1]
+    for start, end in zip(edges[:-1], edges[1:]):
+        segment = values[start:end]
+        indices.append(start + int(segment.argmin()))
+        indices.append(start + int(segment.argmax()))
+    return np.unique(indices)
+
+
+def lttb_indices(timestamps: np.ndarray, values: np.ndarray, max_points: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets：每桶保留与前一个选中点、下一桶均值构成三角形面积最大的点，保持曲线形状
+    :return: 保留的下标，升序
+    """
+    count = len(values)
+    if count <= max_points or max_points < 3:
+        return np.arange(count)
+    x = timestamps.astype(np.float64)
+    y = values
+    edges = np.linspace(1, count - 1, max_points - 1).astype(np.int64)
+    indices = [0]
+    selected = 0
+    for i in range(max_points - 2):
+        start, end = edges[i], edges[i + 1]
+        if i + 2 < len(edges):
+            next_x = x[end:edges[i + 2]].mean()
+            next_y = y[end:edges[i + 2]].mean()
+        else:
+            next_x, next_y = x[count - 1], y[count - 1]
+        area = np.abs((x[selected] - next_x) * (y[start:end] - y[selected])
+                      - (x[selected] - x[start:end]) * (next_y - y[selected]))
+        selected = start + int(area.argmax())
+        indices.append(selected)
+    indices.append(count - 1)
+    return np.asarray(indices)
+
+
+DOWNSAMPLERS: Dict[str, Callable[[np.ndarray, np.ndarray, int], np.ndarray]] = {
+    'minmax': minmax_indices,
+    'lttb': lttb_indices,
+}
+
+
+@dataclass
+class RetentionPolicy:
+    """
+    :param keep_runs: 保留全量采样的最近测试数
+    :param max_points: 旧测试每个指标降采样后的最多点数
+    :param method: 降采样算法 minmax / lttb
+    """
+    keep_runs: int = 10
+    max_points: int = 600
+    method: str = 'minmax'
+
+    def __post_init__(self):
+        if self.method not in DOWNSAMPLERS:
+            raise ValueError(f"不支持的降采样算法: {self.method}")
+
+
+@dataclass
+class RetentionRule:
+    """
+    按应用和场景覆盖默认策略，字段为空表示匹配任意值
+    """
+    policy: RetentionPolicy
+    package_name: Optional[str] = None
+    scenario_name: Optional[str] = None
+
+    def matches(self, package_name: Optional[str], scenario_name: Optional[str]) -> bool:
+        return (self.package_name in (None, package_name)) and (self.scenario_name in (None, scenario_name))
+
+    @property
+    def specificity(self) -> int:
+        return (self.package_name is not None) + (self.scenario_name is not None)
+
+
+@dataclass
+class CompactionConfig:
+    default: RetentionPolicy = field(default_factory=RetentionPolicy)
+    rules: List[RetentionRule] = field(default_factory=list)
+    # 保留的最近日志目录数，为空时不归档
+    keep_log_dirs: Optional[int] = None
+
+    def policy_for(self, package_name: Optional[str], scenario_name: Optional[str]) -> RetentionPolicy:
+        """
+        最具体的匹配规则优先（应用+场景 > 应用或场景 > 默认）
+        """
+        matched = [rule for rule in self.rules if rule.matches(package_name, scenario_name)]
+        if not matched:
+            return self.default
+        return max(matched, key=lambda rule: rule.specificity).policy
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "CompactionConfig":
+        """
+        {"default": {"keep_runs": 10, ...}, "keep_log_dirs": 20,
+         "rules": [{"package_name": "...", "scenario_name": "...", "keep_runs": 30, ...}]}
+        """
+        rules = []
+        for rule in data.get('rules', []):
+            rule = dict(rule)
+            package_name = rule.pop('package_name', None)
+            scenario_name = rule.pop('scenario_name', None)
+            rules.append(RetentionRule(RetentionPolicy(**rule), package_name, scenario_name))
+        return cls(default=RetentionPolicy(**data.get('default', {})), rules=rules,
+                   keep_log_dirs=data.get('keep_log_dirs'))
+
+    @classmethod
+    def from_file(cls, path: str) -> "CompactionConfig":
+        with open(path, encoding='utf-8') as f:
+            return cls.from_dict(json.load(f))
+
+
+class Compactor:
+    """
+    历史数据压缩
+    每个(应用, 场景)保留最近N次测试的全量采样，更早的测试按指标降采样写入 metric_sample_compact 并删除原始采样；
+    预聚合统计在测试结束时已由全量数据生成，不受影响。之后回收数据库空间，并把旧的日志目录打包归档。
+    """
+
+    def __init__(self, persister: Optional[SQLPersister] = None, config: Optional[CompactionConfig] = None,
+                 log_root: Optional[str] = None, archive_dir: Optional[str] = None):
+        """
+        :param persister:
+        :param config:
+        :param log_root: 日志根目录，默认 ROOT_PATH/log
+        :param archive_dir: 归档目录，默认 log_root/archive
+        """
+        self.persister = persister or SQLPersister()
+        self.engine = self.persister.engine
+        self.config = config or CompactionConfig()
+        self.log_root = log_root or os.path.join(ROOT_PATH, 'log')
+        self.archive_dir = archive_dir or os.path.join(self.log_root, 'archive')
+
+    def plan(self) -> List[Tuple[int, RetentionPolicy]]:
+        """
+        需要压缩的测试：超出保留数量且仍有原始采样
+        :return: [(测试id, 策略)]
+        """
+        query = (select(TestRuns.id, TestRuns.scenario_name, Apps.package_name)
+                 .select_from(TestRuns).outerjoin(Apps, Apps.id == TestRuns.app_id)
+                 .order_by(TestRuns.start_time.desc(), TestRuns.id.desc()))
+        with self.engine.connect() as conn:
+            runs = conn.execute(query).all()
+            raw = set(conn.execute(select(MetricSample.test_run_id).distinct()).scalars())
+        seen: Dict[Tuple[Any, Any], int] = defaultdict(int)
+        result = []
+        for run_id, scenario_name, package_name in runs:
+            policy = self.config.policy_for(package_name, scenario_name)
+            seen[(package_name, scenario_name)] += 1
+            if seen[(package_name, scenario_name)] > policy.keep_runs and run_id in raw:
+                result.append((run_id, policy))
+        return result
+
+    def compact_run(self, test_run_id: int, policy: RetentionPolicy) -> Tuple[int, int]:
+        """
+        降采样一次测试，单个事务内重建预聚合统计、写入降采样结果并删除原始采样，
+        删除后整个测试的统计仍可从预聚合表读取（迁移来的旧测试此前没有预聚合）
+        :return: (原始点数, 保留点数)
+        """
+        downsample = DOWNSAMPLERS[policy.method]
+        query = (select(MetricSample.metric_id, MetricSample.timestamp, MetricSample.value)
+                 .where(MetricSample.test_run_id == test_run_id)
+                 .order_by(MetricSample.metric_id, MetricSample.timestamp))
+        with self.engine.begin() as conn:
+            rows = conn.execute(query).all()
+            if not rows:
+                return 0, 0
+            metric_ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+            timestamps = np.fromiter((row[1] for row in rows), dtype=np.int64, count=len(rows))
+            values = np.fromiter((row[2] for row in rows), dtype=np.float64, count=len(rows))
+            bounds = np.concatenate(([0], np.flatnonzero(np.diff(metric_ids)) + 1, [len(rows)]))
+            compact = []
+            for start, end in zip(bounds[:-1], bounds[1:]):
+                keep = start + downsample(timestamps[start:end], values[start:end], policy.max_points)
+                compact.extend({'test_run_id': test_run_id, 'metric_id': metric_id, 'timestamp': timestamp,
+                                'value': value}
+                               for metric_id, timestamp, value in zip(metric_ids[keep].tolist(),
+                                                                      timestamps[keep].tolist(),
+                                                                      values[keep].tolist()))
+            self.persister.build_rollups(test_run_id, conn)
+            conn.execute(delete(MetricSampleCompact.__table__)
+                         .where(MetricSampleCompact.test_run_id == test_run_id))
+            conn.execute(insert(MetricSampleCompact.__table__), compact)
+            conn.execute(delete(MetricSample.__table__).where(MetricSample.test_run_id == test_run_id))
+            conn.execute(delete(MonitorData.__table__).where(MonitorData.test_run_id == test_run_id))
+        return len(rows), len(compact)
+
+    def vacuum(self):
+        """
+        合并WAL并回收空闲页
+        """
+        with self.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+            conn.exec_driver_sql('PRAGMA wal_checkpoint(TRUNCATE)')
+            conn.exec_driver_sql('VACUUM')
+
+    def archive_logs(self, dry_run: bool = False) -> List[str]:
+        """
+        保留最近的日志目录，其余打包为 archive_dir/<目录名>.tar.gz 后删除
+        :return: 归档的目录名
+        """
+        keep = self.config.keep_log_dirs
+        if keep is None or not os.path.isdir(self.log_root):
+            return []
+        archive_name = os.path.basename(self.archive_dir)
+        dirs = [name for name in os.listdir(self.log_root)
+                if name != archive_name and os.path.isdir(os.path.join(self.log_root, name))]
+        dirs.sort(key=lambda name: os.path.getmtime(os.path.join(self.log_root, name)), reverse=True)
+        archived = dirs[keep:]
+        if dry_run:
+            return archived
+        os.makedirs(self.archive_dir, exist_ok=True)
+        for name in archived:
+            shutil.make_archive(os.path.join(self.archive_dir, name), 'gztar', root_dir=self.log_root, base_dir=name)
+            shutil.rmtree(os.path.join(self.log_root, name))
+            logger.info(f"日志目录已归档: {name}")
+        return archived
+
+    def run(self, vacuum: bool = True, dry_run: bool = False) -> Dict[str, Any]:
+        """
+        执行一次压缩
+        :param vacuum: 压缩后回收数据库空间
+        :param dry_run: 只返回计划，不修改数据
+        :return: 统计
+        """
+        if not dry_run:
+            # 旧的JSON记录先迁移到窄表，之后随原始采样一起压缩；迁移失败不影响其它测试的保留策略
+            try:
+                self.persister.migrate_monitor_data()
+            except Exception as e:
+                logger.error(f"迁移旧监控数据失败，跳过迁移: {e}")
+        plan = self.plan()
+        report: Dict[str, Any] = {'runs': [run_id for run_id, _ in plan], 'points_before': 0, 'points_after': 0}
+        if not dry_run:
+            for run_id, policy in plan:
+                before, after = self.compact_run(run_id, policy)
+                report['points_before'] += before
+                report['points_after'] += after
+                logger.info(f"测试{run_id}已压缩: {before} -> {after}点 ({policy.method})")
+            if vacuum and plan:
+                self.vacuum()
+        report['archived_logs'] = self.archive_logs(dry_run=dry_run)
+        return report
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description="压缩历史测试数据并归档日志目录")
+    arg_parser.add_argument('--db', default=DB_PATH)
+    arg_parser.add_argument('--config', help="JSON配置文件，可按应用和场景设置保留策略")
+    arg_parser.add_argument('--keep-runs', type=int, help="默认保留全量采样的测试数")
+    arg_parser.add_argument('--max-points', type=int, help="默认降采样后每个指标的点数")
+    arg_parser.add_argument('--method', choices=list(DOWNSAMPLERS), help="默认降采样算法")
+    arg_parser.add_argument('--keep-logs', type=int, help="保留的日志目录数")
+    arg_parser.add_argument('--log-root', default=None)
+    arg_parser.add_argument('--no-vacuum', action='store_true')
+    arg_parser.add_argument('--dry-run', action='store_true')
+    args = arg_parser.parse_args()
+
+    compaction_config = CompactionConfig.from_file(args.config) if args.config else CompactionConfig()
+    overrides = {key: value for key, value in (('keep_runs', args.keep_runs), ('max_points', args.max_points),
+                                               ('method', args.method)) if value is not None}
+    if overrides:
+        compaction_config.default = RetentionPolicy(**{**asdict(compaction_config.default), **overrides})
+    if args.keep_logs is not None:
+        compaction_config.keep_log_dirs = args.keep_logs
+    compactor = Compactor(SQLPersister(args.db), compaction_config, log_root=args.log_root)
+    print(compactor.run(vacuum=not args.no_vacuum, dry_run=args.dry_run))
@@ -6,23 +6,138 @@
 @Author   : wieszheng
 @Software : PyCharm
 """
+import queue
+import threading
+import time
 from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
 
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import insert, select, func, delete
+from sqlalchemy.exc import IntegrityError
 
-from core.persistence.models import Base, MonitorData, DeviceInfo, Apps, TestRuns
+from core.persistence.models import Base, DeviceInfo, Apps, TestRuns, MetricDef, MetricSample, MetricRollup, \
+    MetricSampleCompact
+from core.persistence.registry import get_engine, get_sessionmaker
+from core.persistence.rollup import DEFAULT_ROLLUP_WINDOWS, ROLLUP_PERCENTILES, compute_rollups
+from core.persistence.timeseries import (DEFAULT_PERCENTILES, flatten_monitor_data, metric_unit,
+                                         migrate_monitor_data, percentile_key, query_stats, sample_filter,
+                                         to_epoch_ms)
 
 DB_PATH = 'history.db'
 
+class SampleIngest:
+    """
+    采样数据的批量写入线程
+    调用方把记录放入有界队列，写入线程按条数或时间阈值攒批，每批一个事务、一次executemany提交；
+    队列满时调用方阻塞等待，保证每条原始样本都入库。
+    """
+
+    _STOP = object()
+
+    def __init__(self, engine: Any, table: Any, batch_size: int = 500, flush_interval: float = 1.0,
+                 max_queue: int = 20000):
+        """
+        :param engine:
+        :param table: 写入的表
+        :param batch_size: 每批最多写入的条数
+        :param flush_interval: 距上次提交超过多少秒提交一次
+        :param max_queue: 队列容量
+        """
+        self.engine = engine
+        self.table = table
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue: "queue.Queue[Any]" = queue.Queue(maxsize=max_queue)
+        self.written = 0
+        self.failed = 0
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='db-ingest', daemon=True)
+                self._thread.start()
+
+    def put(self, rows: List[Dict[str, Any]]):
+        """
+        放入一组记录，队列满时阻塞
+        """
+        if rows:
+            self.start()
+            self.queue.put(rows)
+
+    def flush(self):
+        """
+        阻塞直到此前放入的记录全部提交
+        :return:
+        """
+        if self._thread is None:
+            return
+        done = threading.Event()
+        self.queue.put(done)
+        done.wait()
+
+    def close(self):
+        """
+        提交剩余记录并结束写入线程
+        :return:
+        """
+        if self._thread is not None:
+            self.queue.put(self._STOP)
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        rows: List[Dict[str, Any]] = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                item = self.queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                item = None
+            if isinstance(item, list):
+                rows.extend(item)
+                if len(rows) < self.batch_size:
+                    continue
+            self._commit(rows)
+            rows = []
+            deadline = time.monotonic() + self.flush_interval
+            if isinstance(item, threading.Event):
+                item.set()
+            elif item is self._STOP:
+                break
+
+    def _commit(self, rows: List[Dict[str, Any]]):
+        if not rows:
+            return
+        try:
+            with self.engine.begin() as conn:
+                conn.execute(insert(self.table), rows)
+            self.written += len(rows)
+        except Exception as e:
+            self.failed += len(rows)
+            print(f"批量写入数据库失败({len(rows)}条): {e}")
+
 
 class SQLPersister:
-    def __init__(self, db_path: str = DB_PATH):
+    def __init__(self, db_path: str = DB_PATH, batch_size: int = 500, flush_interval: float = 1.0,
+                 rollup_windows: Sequence[int] = DEFAULT_ROLLUP_WINDOWS):
+        """
+        :param db_path:
+        :param batch_size: 采样数据每批写入的条数
+        :param flush_interval: 采样数据最长多少秒提交一次
+        :param rollup_windows: 测试结束时预聚合的窗口长度（秒），0为整个测试
+        """
         self.db_path = db_path
-        db_url = f'sqlite:///{self.db_path}'
-        self.engine = create_engine(db_url, echo=False, future=True)
-        Base.metadata.create_all(self.engine)
-        self.Session = sessionmaker(bind=self.engine)
+        self.rollup_windows = tuple(rollup_windows)
+        # 同一数据库在进程内共用引擎和连接池，表结构只创建一次
+        self.engine = get_engine(self.db_path, Base.metadata)
+        self.Session = get_sessionmaker(self.db_path)
+        self.ingest = SampleIngest(self.engine, MetricSample.__table__, batch_size=batch_size,
+                                   flush_interval=flush_interval)
+        self._metric_ids: Dict[Tuple[str, str], int] = {}
+        self._metric_lock = threading.Lock()
 
     def save_device_info(self, device_id, os_version=None):
         """
@@ -90,100 +205,296 @@ class SQLPersister:
                            start_time=datetime.now())
             session.add(res)
             session.commit()
+            return res.id
         except Exception as e:
             session.rollback()
             print(f"写入数据库失败: {e}")
         finally:
             session.close()
 
-    def end_test_run(self, test_run_id, monitor_data):
-        end_time = datetime.now()
+    def end_test_run(self, test_run_id, monitor_data=None, end_time: Optional[datetime] = None):
+        """
+        结束测试：写入最后一条监控数据，等待队列中的监控数据全部提交后更新结束时间，并生成预聚合统计
+        :param end_time: 结束时间，默认当前时间；崩溃恢复时为最后一条采样的时间
+        """
+        end_time = end_time or datetime.now()
+        if monitor_data:
+            self.save_monitor_data(test_run_id=test_run_id, **monitor_data)
+        self.flush()
         session = self.Session()
         try:
             res = session.query(TestRuns).filter_by(id=test_run_id).first()
             if res:
-                duration = (datetime.now() - res.start_time)
+                duration = (end_time - res.start_time)
                 res.end_time = end_time
-                res.duration = str(duration.seconds / 60)
-
-                self.save_monitor_data(test_run_id=test_run_id, **monitor_data)
+                res.duration = str(int(duration.total_seconds()) / 60)
                 session.commit()
         except Exception as e:
             session.rollback()
             print(f"写入数据库失败: {e}")
         finally:
             session.close()
+        try:
+            self.build_rollups(test_run_id)
+        except Exception as e:
+            print(f"生成预聚合统计失败: {e}")
 
-    def save_monitor_data(self, test_run_id, cpu_usage, cpu_freq, mem, fps, timestamp):
+    def build_rollups(self, test_run_id: int, conn: Any = None) -> int:
+        """
+        重新计算一次测试的预聚合统计（整个测试和各固定窗口），替换已有结果
+        :param test_run_id:
+        :param conn: 在调用方的事务中执行，为空时自行开启事务
+        :return: 写入的行数
+        """
+        if conn is None:
+            self.flush()
+            with self.engine.begin() as conn:
+                return self.build_rollups(test_run_id, conn)
+        query = (select(MetricSample.metric_id, MetricSample.timestamp, MetricSample.value)
+                 .where(MetricSample.test_run_id == test_run_id))
+        rows = compute_rollups(test_run_id, conn.execute(query).all(), self.rollup_windows)
+        conn.execute(delete(MetricRollup.__table__).where(MetricRollup.test_run_id == test_run_id))
+        if rows:
+            conn.execute(insert(MetricRollup.__table__), rows)
+        return len(rows)
+
+    def get_rollups(self, test_run_id: Optional[int] = None, window_s: int = 0, metric: Optional[str] = None,
+                    group: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        读取预聚合统计
+        :param test_run_id: 为空时返回所有测试，用于跨版本对比
+        :param window_s: 窗口长度（秒），0为整个测试
+        :param metric: 指标名
+        :param group: 指标分组
+        :return: 每行附带指标的 group/name/unit，按测试、指标、窗口起点排序
+        """
+        table = MetricRollup.__table__
+        query = (select(table, MetricDef.group, MetricDef.name, MetricDef.unit)
+                 .join(MetricDef, MetricDef.id == table.c.metric_id)
+                 .where(table.c.window_s == window_s))
+        if test_run_id is not None:
+            query = query.where(table.c.test_run_id == test_run_id)
+        if metric is not None:
+            query = query.where(MetricDef.name == metric)
+        if group is not None:
+            query = query.where(MetricDef.group == group)
+        query = query.order_by(table.c.test_run_id, MetricDef.group, MetricDef.name, table.c.window_start)
+        with self.engine.connect() as conn:
+            return [dict(row) for row in conn.execute(query).mappings()]
+
+    def get_test_run(self, test_run_id: int) -> Optional[Dict[str, Any]]:
         session = self.Session()
         try:
-            record = MonitorData(
-                test_run_id=test_run_id, cpu_usage=cpu_usage,
-                cpu_freq=cpu_freq, mem=mem, fps=fps,
-                timestamp=timestamp
-            )
-            session.add(record)
-            session.commit()
-        except Exception as e:
-            session.rollback()
-            print(f"写入数据库失败: {e}")
+            res = session.query(TestRuns).filter_by(id=test_run_id).first()
+            return res.to_dict() if res else None
         finally:
             session.close()
 
-    def get_fps_avg(self, test_run_id=None):
+    def unfinished_runs(self) -> List[int]:
+        """
+        没有结束时间的测试，即进程在测试中途退出
+        """
+        with self.engine.connect() as conn:
+            return list(conn.execute(select(TestRuns.id).where(TestRuns.end_time.is_(None))
+                                     .order_by(TestRuns.id)).scalars())
 
-        session = Session()
+    def last_sample_timestamp(self, test_run_id: int) -> Optional[int]:
+        """
+        测试已入库的最后一条采样的毫秒时间戳，没有采样时返回None
+        """
+        self.flush()
+        with self.engine.connect() as conn:
+            return conn.execute(select(func.max(MetricSample.timestamp))
+                                .where(MetricSample.test_run_id == test_run_id)).scalar()
+
+    def save_monitor_data(self, test_run_id, cpu_usage, cpu_freq, mem, fps, timestamp):
+        """
+        写入一条监控数据，按指标展开为窄表的多行，由后台线程批量提交；需要立即可见时调用flush
+        """
+        timestamp = to_epoch_ms(timestamp)
+        self.ingest.put([
+            {'test_run_id': test_run_id, 'metric_id': self.metric_id(group, name),
+             'timestamp': timestamp, 'value': value}
+            for group, name, value in flatten_monitor_data(cpu_usage, cpu_freq, mem, fps)
+        ])
+
+    def metric_id(self, group: str, name: str) -> int:
+        """
+        指标id，不存在时创建
+        :param group: cpu_usage/cpu_freq/mem/fps
+        :param name:
+        :return:
+        """
+        key = (group, name)
+        metric_id = self._metric_ids.get(key)
+        if metric_id is not None:
+            return metric_id
+        with self._metric_lock:
+            if key not in self._metric_ids:
+                self._metric_ids[key] = self._get_or_create_metric(group, name)
+            return self._metric_ids[key]
+
+    def _get_or_create_metric(self, group: str, name: str) -> int:
+        session = self.Session()
         try:
-            query = session.query(MonitorData)
-            if test_run_id:
-                query = query.filter(MonitorData.test_run_id == test_run_id)
-            fps_values = []
-            for row in query:
-                # 假设fps字段为dict或float
-                fps = row.fps
-                if isinstance(fps, dict):
-                    # 取主fps
-                    fps_val = fps.get("fps", 0)
-                else:
-                    fps_val = float(fps)
-                fps_values.append(fps_val)
-            if fps_values:
-                return round(sum(fps_values) / len(fps_values), 2)
-            else:
-                return 0
+            res = session.query(MetricDef).filter_by(group=group, name=name).first()
+            if res is None:
+                res = MetricDef(group=group, name=name, unit=metric_unit(name))
+                session.add(res)
+                try:
+                    session.commit()
+                except IntegrityError:
+                    # 其它进程已创建
+                    session.rollback()
+                    res = session.query(MetricDef).filter_by(group=group, name=name).one()
+            return res.id
         finally:
             session.close()
 
-    def get_mem_avg(self, test_run_id=None):
+    def _metric_ids_of(self, metric: str, group: Optional[str] = None) -> List[int]:
+        query = select(MetricDef.id).where(MetricDef.name == metric)
+        if group is not None:
+            query = query.where(MetricDef.group == group)
+        with self.engine.connect() as conn:
+            return list(conn.execute(query).scalars())
+
+    def flush(self):
+        """
+        等待已写入的监控数据全部提交
+        """
+        self.ingest.flush()
+
+    def close(self):
+        """
+        提交剩余的采样数据；引擎由注册表共用，不在这里关闭
+        """
+        self.ingest.close()
+
+    def migrate_monitor_data(self, batch_size: int = 1000, drop: bool = False) -> int:
+        """
+        将旧的monitor_data JSON记录迁移到窄表
+        :param batch_size:
+        :param drop: 迁移后删除已迁移的JSON记录
+        :return: 写入的采样数
+        """
+        self.flush()
+        return migrate_monitor_data(self.engine, self.metric_id, batch_size=batch_size, drop=drop)
+
+    def list_metrics(self, test_run_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        指标列表，指定测试时只返回该测试有数据的指标
+        """
+        self.flush()
+        query = select(MetricDef).order_by(MetricDef.group, MetricDef.name)
+        if test_run_id is not None:
+            query = query.where(MetricDef.id.in_(
+                select(MetricSample.metric_id).where(MetricSample.test_run_id == test_run_id).distinct()))
         session = self.Session()
         try:
-            query = session.query(MonitorData)
-            if test_run_id:
-                query = query.filter(MonitorData.test_run_id == test_run_id)
-            mem_values = []
-            for row in query:
-                mem = row.mem
-                total = 0
-                if isinstance(mem, dict):
-                    total = sum(float(v) for v in mem.values() if isinstance(v, (int, float)) or (isinstance(v, str) and v.replace('.', '', 1).isdigit()))
-                elif isinstance(mem, str):
-                    import json
-                    try:
-                        mem_dict = json.loads(mem)
-                        total = sum(float(v) for v in mem_dict.values() if isinstance(v, (int, float)) or (isinstance(v, str) and v.replace('.', '', 1).isdigit()))
-                    except Exception:
-                        total = 0
-                mem_values.append(total)
-            if mem_values:
-                return round(sum(mem_values) / len(mem_values), 2)
-            else:
-                return 0
+            return [res.to_dict() for res in session.scalars(query)]
         finally:
             session.close()
 
+    def get_metric_stats(self, test_run_id: Optional[int], metric: str, group: Optional[str] = None,
+                         start_ms: Optional[int] = None, end_ms: Optional[int] = None,
+                         percentiles: Sequence[float] = DEFAULT_PERCENTILES) -> Dict[str, Any]:
+        """
+        指标统计值，全部在SQL中计算；整个测试的统计优先读取预聚合结果，测试没有预聚合时再统计原始采样
+        :param test_run_id: 为空时统计所有测试
+        :param metric: 指标名，如 fps、pss、cpu0Usage
+        :param group: 指标分组，为空时匹配所有同名指标
+        :param start_ms: 时间范围起点（含），毫秒
+        :param end_ms: 时间范围终点（不含），毫秒
+        :param percentiles: 百分位，最近秩法
+        :return: {'count', 'avg', 'min', 'max', 'p50', ...}
+        """
+        self.flush()
+        metric_ids = self._metric_ids_of(metric, group)
+        with self.engine.connect() as conn:
+            if test_run_id is not None and start_ms is None and end_ms is None:
+                stats = self._rollup_stats(conn, test_run_id, metric_ids, percentiles)
+                if stats is not None:
+                    return stats
+            return query_stats(conn, test_run_id, metric_ids, start_ms, end_ms, percentiles)
+
+    @staticmethod
+    def _run_rollups(conn: Any, test_run_id: int, metric_ids: Any) -> Optional[List[Any]]:
+        """
+        一次测试整体（window_s=0）的预聚合行，测试没有预聚合时返回None
+        """
+        table = MetricRollup.__table__
+        whole_run = (table.c.test_run_id == test_run_id) & (table.c.window_s == 0)
+        if conn.execute(select(table.c.id).where(whole_run).limit(1)).first() is None:
+            return None
+        return conn.execute(select(table).where(whole_run, table.c.metric_id.in_(metric_ids))).mappings().all()
+
+    def _rollup_stats(self, conn: Any, test_run_id: int, metric_ids: Sequence[int],
+                      percentiles: Sequence[float]) -> Optional[Dict[str, Any]]:
+        """
+        用预聚合结果计算整个测试的统计值；多个同名指标的百分位无法合并，此时返回None改为统计原始采样
+        """
+        if any(percentile not in ROLLUP_PERCENTILES for percentile in percentiles):
+            return None
+        rows = self._run_rollups(conn, test_run_id, metric_ids)
+        if rows is None or (len(rows) > 1 and percentiles):
+            return None
+        count = sum(row['count'] for row in rows)
+        stats: Dict[str, Any] = {
+            'count': count,
+            'avg': sum(row['mean'] * row['count'] for row in rows) / count if count else None,
+            'min': min((row['min'] for row in rows), default=None),
+            'max': max((row['max'] for row in rows), default=None),
+        }
+        for percentile in percentiles:
+            key = percentile_key(percentile)
+            stats[key] = rows[0][key] if rows else None
+        return stats
+
+    def get_metric_series(self, test_run_id: int, metric: str, group: Optional[str] = None,
+                          start_ms: Optional[int] = None, end_ms: Optional[int] = None) -> List[Tuple[int, float]]:
+        """
+        指标在时间范围内的采样，已压缩的测试返回降采样后的点
+        :return: [(毫秒时间戳, 数值)]，按时间排序
+        """
+        self.flush()
+        metric_ids = self._metric_ids_of(metric, group)
+        with self.engine.connect() as conn:
+            for table in (MetricSample, MetricSampleCompact):
+                query = sample_filter(select(table.timestamp, table.value), test_run_id, metric_ids,
+                                      start_ms, end_ms, table).order_by(table.timestamp)
+                rows = [tuple(row) for row in conn.execute(query)]
+                if rows:
+                    return rows
+        return []
+
+    def get_fps_avg(self, test_run_id=None):
+        stats = self.get_metric_stats(test_run_id, 'fps', group='fps', percentiles=())
+        return round(stats['avg'], 2) if stats['count'] else 0
+
+    def get_mem_avg(self, test_run_id=None):
+        """
+        平均内存：每次采样各内存指标之和的平均值
+        单个测试优先读取预聚合结果：各内存指标的总和除以采样次数（取各指标采样数的最大值）
+        """
+        self.flush()
+        mem_ids = select(MetricDef.id).where(MetricDef.group == 'mem')
+        if test_run_id:
+            with self.engine.connect() as conn:
+                rows = self._run_rollups(conn, test_run_id, mem_ids)
+            if rows is not None:
+                count = max((row['count'] for row in rows), default=0)
+                return round(sum(row['mean'] * row['count'] for row in rows) / count, 2) if count else 0
+        totals = select(func.sum(MetricSample.value).label('total')).where(MetricSample.metric_id.in_(mem_ids))
+        if test_run_id:
+            totals = totals.where(MetricSample.test_run_id == test_run_id)
+        totals = totals.group_by(MetricSample.test_run_id, MetricSample.timestamp).subquery()
+        with self.engine.connect() as conn:
+            avg = conn.execute(select(func.avg(totals.c.total))).scalar()
+        return round(avg, 2) if avg is not None else 0
+
 if __name__ == '__main__':
     sql = SQLPersister()
-    sql.start_test_run(1,1,"对话")
+    run_id = sql.start_test_run(1, 1, "对话")
     data = {
         "cpu_usage": {"ad": 1.2, "bd": 1.3},
         "cpu_freq": {"ad": 1.2, "bd": 1.3},
@@ -191,4 +502,5 @@ if __name__ == '__main__':
         "fps": {"ad": 1.2, "bd": 1.3},
         "timestamp": 122233,
     }
-    sql.end_test_run(1, data)
+    sql.end_test_run(run_id, data)
+    sql.close()
@@ -0,0 +1,368 @@
+# !/usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+@Version  : Python 3.12
+@Time     : 2025/7/23 21:30
+@Author   : wieszheng
+@Software : PyCharm
+"""
+import argparse
+import glob
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set
+
+from loguru import logger
+
+try:
+    import fcntl
+except ImportError:  # Windows没有fcntl，只按修改时间判断运行日志是否仍在使用
+    fcntl = None
+
+from config.conf import ROOT_PATH
+from core.persistence.db import DB_PATH, SQLPersister
+
+JOURNAL_DIR = os.path.join(ROOT_PATH, 'journal')
+JOURNAL_SUFFIX = '.journal'
+# 每条记录：长度(uint32) | CRC32(uint32) | JSON
+_FRAME = struct.Struct('<II')
+MONITOR_FIELDS = ('cpu_usage', 'cpu_freq', 'mem', 'fps')
+# 最近这么多秒内有写入的运行日志/测试视为仍在运行，恢复时跳过
+LIVE_SECONDS = 60.0
+
+
+def now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+def journal_path(test_run_id: int, journal_dir: str = JOURNAL_DIR) -> str:
+    return os.path.join(journal_dir, f'run_{test_run_id}{JOURNAL_SUFFIX}')
+
+
+class RunJournal:
+    """
+    测试运行的预写日志
+    追加的记录先进入内存，由写入线程成组写盘并fsync一次（group commit）：
+    间隔 commit_interval 秒或累计 commit_size 条时提交，fsync的开销被一组记录分摊。
+    append(wait=True) 阻塞到该记录落盘；进程崩溃最多丢失最近一个提交间隔内的记录，
+    写了一半或校验失败的尾部记录在读取时丢弃。
+    打开期间持有文件的排他锁，recover_runs 据此跳过仍在写入的运行日志；
+    写盘失败时写入线程退出，之后的 append/sync 抛出该异常。
+    """
+
+    def __init__(self, path: str, commit_interval: float = 0.2, commit_size: int = 256):
+        """
+        :param path:
+        :param commit_interval: 最长多少秒提交一次
+        :param commit_size: 累计多少条立即提交
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.commit_interval = commit_interval
+        self.commit_size = commit_size
+        self.commits = 0
+        self._file = open(path, 'ab')
+        if fcntl is not None:
+            try:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                self._file.close()
+                raise
+        self._error: Optional[OSError] = None
+        self._pending: List[bytes] = []
+        self._appended = 0
+        self._synced = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name='run-journal', daemon=True)
+        self._thread.start()
+
+    def append(self, record: Dict[str, Any], wait: bool = False):
+        """
+        追加一条记录
+        :param record:
+        :param wait: 阻塞到记录fsync完成
+        :return:
+        """
+        payload = json.dumps(record, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        frame = _FRAME.pack(len(payload), zlib.crc32(payload)) + payload
+        with self._cond:
+            self._raise_error()
+            if self._closed:
+                raise ValueError(f"运行日志已关闭: {self.path}")
+            self._pending.append(frame)
+            self._appended += 1
+            sequence = self._appended
+            if len(self._pending) >= self.commit_size or wait:
+                self._cond.notify_all()
+            if wait:
+                self._cond.wait_for(lambda: self._synced >= sequence)
+                self._raise_error()
+
+    def sync(self):
+        """
+        阻塞到此前追加的记录全部落盘
+        """
+        with self._cond:
+            sequence = self._appended
+            self._cond.notify_all()
+            self._cond.wait_for(lambda: self._synced >= sequence or self._file is None)
+            self._raise_error()
+
+    def close(self):
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+
+    def _raise_error(self):
+        if self._error is not None:
+            raise OSError(f"运行日志写入失败: {self.path}") from self._error
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: len(self._pending) >= self.commit_size or self._closed,
+                                    timeout=self.commit_interval)
+                batch, self._pending = self._pending, []
+                sequence = self._appended
+                closing = self._closed
+            error = None
+            if batch:
+                # 写盘和fsync在锁外进行，不阻塞采集线程追加
+                try:
+                    self._file.write(b''.join(batch))
+                    self._file.flush()
+                    os.fsync(self._file.fileno())
+                    self.commits += 1
+                except OSError as e:
+                    logger.error(f"运行日志写入失败: {self.path}: {e}")
+                    error = e
+            with self._cond:
+                self._synced = sequence
+                if error is not None:
+                    # 唤醒所有等待者，由 append/sync 抛出异常
+                    self._error = error
+                    self._synced = self._appended
+                    self._pending = []
+                self._cond.notify_all()
+                if error is not None or (closing and not self._pending):
+                    try:
+                        self._file.close()
+                    except OSError:
+                        pass
+                    self._file = None
+                    return
+
+
+def read_journal(path: str) -> List[Dict[str, Any]]:
+    """
+    读取运行日志，遇到截断或校验失败的记录即停止
+    :param path:
+    :return:
+    """
+    records = []
+    with open(path, 'rb') as f:
+        data = f.read()
+    offset = 0
+    while offset + _FRAME.size <= len(data):
+        length, crc = _FRAME.unpack_from(data, offset)
+        payload = data[offset + _FRAME.size:offset + _FRAME.size + length]
+        if len(payload) < length or zlib.crc32(payload) != crc:
+            logger.warning(f"运行日志尾部不完整，已忽略{len(data) - offset}字节: {path}")
+            break
+        records.append(json.loads(payload.decode('utf-8')))
+        offset += _FRAME.size + length
+    return records
+
+
+class RunRecorder:
+    """
+    带预写日志的测试运行记录
+    每条监控数据先追加到运行日志再交给SQLPersister批量入库；正常结束后删除运行日志，
+    进程中途退出时由 recover_runs 从运行日志补齐数据库并结束测试。
+    """
+
+    def __init__(self, persister: SQLPersister, device_id: Any, package_name: str, scenario_name: str,
+                 journal_dir: str = JOURNAL_DIR, **journal_kwargs):
+        """
+        :param persister:
+        :param device_id:
+        :param package_name:
+        :param scenario_name:
+        :param journal_dir: 运行日志目录
+        :param journal_kwargs: RunJournal的提交参数
+        """
+        self.persister = persister
+        self.device_id = device_id
+        self.package_name = package_name
+        self.scenario_name = scenario_name
+        self.journal_dir = journal_dir
+        self.journal_kwargs = journal_kwargs
+        self.test_run_id: Optional[int] = None
+        self.journal: Optional[RunJournal] = None
+
+    def start(self) -> int:
+        """
+        创建测试并打开运行日志
+        :return: 测试id
+        """
+        self.test_run_id = self.persister.start_test_run(self.device_id, self.package_name, self.scenario_name)
+        if self.test_run_id is None:
+            raise RuntimeError("创建测试失败")
+        self.journal = RunJournal(journal_path(self.test_run_id, self.journal_dir), **self.journal_kwargs)
+        self.journal.append({'type': 'start', 'run_id': self.test_run_id, 'start_ms': now_ms(),
+                             'device_id': self.device_id, 'package_name': self.package_name,
+                             'scenario_name': self.scenario_name}, wait=True)
+        return self.test_run_id
+
+    def record(self, cpu_usage: Any = None, cpu_freq: Any = None, mem: Any = None, fps: Any = None,
+               timestamp: Optional[int] = None):
+        """
+        记录一条监控数据
+        :param timestamp: 毫秒时间戳，默认当前时间
+        """
+        if self.journal is None:
+            return
+        sample = {'cpu_usage': cpu_usage, 'cpu_freq': cpu_freq, 'mem': mem, 'fps': fps,
+                  'timestamp': timestamp or now_ms()}
+        self.journal.append({'type': 'sample', **sample})
+        self.persister.save_monitor_data(test_run_id=self.test_run_id, **sample)
+
+    def finish(self):
+        """
+        结束测试：运行日志写入结束标记并落盘，数据库提交后删除运行日志
+        """
+        if self.journal is None:
+            return
+        end_ms = now_ms()
+        self.journal.append({'type': 'end', 'end_ms': end_ms}, wait=True)
+        self.persister.end_test_run(self.test_run_id, end_time=datetime.fromtimestamp(end_ms / 1000))
+        self.journal.close()
+        os.remove(self.journal.path)
+        self.journal = None
+
+
+def recover_journal(persister: SQLPersister, path: str) -> Optional[Dict[str, Any]]:
+    """
+    用一个运行日志补齐数据库：只重放晚于已入库最后一条采样的记录，结束时间取结束标记或最后一条采样
+    :param persister:
+    :param path:
+    :return: 恢复结果，日志无效时返回None
+    """
+    records = read_journal(path)
+    start = next((record for record in records if record.get('type') == 'start'), None)
+    if start is None:
+        logger.warning(f"运行日志缺少开始记录，跳过: {path}")
+        return None
+    test_run_id = start['run_id']
+    last_ms = persister.last_sample_timestamp(test_run_id)
+    end_ms = start['start_ms']
+    replayed = 0
+    for record in records:
+        if record.get('type') == 'sample':
+            timestamp = record['timestamp']
+            end_ms = max(end_ms, timestamp)
+            if last_ms is None or timestamp > last_ms:
+                persister.save_monitor_data(test_run_id=test_run_id,
+                                            **{name: record.get(name) for name in MONITOR_FIELDS},
+                                            timestamp=timestamp)
+                replayed += 1
+        elif record.get('type') == 'end':
+            end_ms = record['end_ms']
+    if last_ms is not None:
+        end_ms = max(end_ms, last_ms)
+    persister.end_test_run(test_run_id, end_time=datetime.fromtimestamp(end_ms / 1000))
+    os.remove(path)
+    return {'run_id': test_run_id, 'replayed': replayed, 'end_time': end_ms}
+
+
+def journal_in_use(path: str, live_seconds: float = LIVE_SECONDS) -> bool:
+    """
+    运行日志是否仍被某个进程写入：被RunJournal加锁，或最近 live_seconds 秒内有修改
+    :param path:
+    :param live_seconds:
+    :return:
+    """
+    try:
+        if time.time() - os.path.getmtime(path) < live_seconds:
+            return True
+        if fcntl is None:
+            return False
+        with open(path, 'rb') as f:
+            try:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                return True
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    except FileNotFoundError:
+        # 期间已被正常结束的测试删除
+        return True
+    return False
+
+
+def _journal_run_id(path: str) -> Optional[int]:
+    name = os.path.basename(path)[:-len(JOURNAL_SUFFIX)]
+    _, _, run_id = name.partition('_')
+    return int(run_id) if run_id.isdigit() else None
+
+
+def recover_runs(persister: SQLPersister, journal_dir: str = JOURNAL_DIR,
+                 live_seconds: float = LIVE_SECONDS) -> List[Dict[str, Any]]:
+    """
+    启动时恢复未正常结束的测试：先重放运行日志，再结束没有运行日志的残留测试（结束时间取最后一条采样）
+    仍在运行的测试不处理：运行日志被加锁或 live_seconds 秒内有写入，或没有运行日志但最近有采样/刚开始
+    :param persister:
+    :param journal_dir:
+    :param live_seconds:
+    :return: 每个测试的恢复结果
+    """
+    results = []
+    live: Set[int] = set()
+    for path in sorted(glob.glob(os.path.join(journal_dir, '*' + JOURNAL_SUFFIX))):
+        run_id = _journal_run_id(path)
+        if journal_in_use(path, live_seconds):
+            logger.info(f"运行日志仍在使用，跳过: {path}")
+            if run_id is not None:
+                live.add(run_id)
+            continue
+        result = recover_journal(persister, path)
+        if result is not None:
+            logger.info(f"已从运行日志恢复测试{result['run_id']}，重放{result['replayed']}条采样")
+            results.append(result)
+    for test_run_id in persister.unfinished_runs():
+        if test_run_id in live:
+            continue
+        last_ms = persister.last_sample_timestamp(test_run_id)
+        if last_ms is None:
+            # 没有采样，结束时间等于开始时间
+            end_time = persister.get_test_run(test_run_id)['start_time']
+        else:
+            end_time = datetime.fromtimestamp(last_ms / 1000)
+        if time.time() - end_time.timestamp() < live_seconds:
+            logger.info(f"测试{test_run_id}最近仍有采样，跳过")
+            continue
+        persister.end_test_run(test_run_id, end_time=end_time)
+        logger.info(f"已结束残留测试{test_run_id}")
+        results.append({'run_id': test_run_id, 'replayed': 0, 'end_time': int(end_time.timestamp() * 1000)})
+    return results
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description="恢复未正常结束的测试")
+    arg_parser.add_argument('--db', default=DB_PATH)
+    arg_parser.add_argument('--dir', default=JOURNAL_DIR, help="运行日志目录")
+    arg_parser.add_argument('--live-seconds', type=float, default=LIVE_SECONDS,
+                            help="最近多少秒内有写入的测试视为仍在运行")
+    args = arg_parser.parse_args()
+    sql_persister = SQLPersister(args.db)
+    for item in recover_runs(sql_persister, args.dir, args.live_seconds):
+        print(item)
+    sql_persister.close()
@@ -6,7 +6,7 @@
 @Author   : wieszheng
 @Software : PyCharm
 """
-from sqlalchemy import Column, Integer, Float, String, DateTime, JSON
+from sqlalchemy import Column, Integer, BigInteger, Float, String, DateTime, JSON, Index, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
 import datetime
 
@@ -44,7 +44,8 @@ class TestRuns(BaseModel):
     app_id = Column(Integer, nullable=False, index=True)
     scenario_name = Column(String, nullable=True)
     start_time = Column(DateTime, nullable=False)
-    end_time = Column(DateTime, default=datetime.datetime.now, nullable=True)
+    # 为空表示测试未结束（进程中途退出），由崩溃恢复补写
+    end_time = Column(DateTime, nullable=True)
     duration = Column(String, nullable=True)
     created_at = Column(DateTime, default=datetime.datetime.now)
 
@@ -58,3 +59,63 @@ class MonitorData(BaseModel):
     cpu_freq = Column(JSON, nullable=True)
     mem = Column(JSON, nullable=True)
     fps = Column(JSON, nullable=True)
+
+
+class MetricDef(BaseModel):
+    """
+    指标定义，group为采集来源（cpu_usage/cpu_freq/mem/fps），name为其中的键
+    """
+    __tablename__ = "metric_def"
+    __table_args__ = (UniqueConstraint('group', 'name', name='uq_metric_def_group_name'),)
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    group = Column(String, nullable=False)
+    name = Column(String, nullable=False)
+    unit = Column(String, nullable=True)
+
+
+class MetricSample(BaseModel):
+    """
+    窄表时间序列：一行一个指标的一次采样，时间戳为毫秒
+    """
+    __tablename__ = "metric_sample"
+    __table_args__ = (Index('ix_metric_sample_run_metric_ts', 'test_run_id', 'metric_id', 'timestamp'),)
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    test_run_id = Column(Integer, nullable=False)
+    metric_id = Column(Integer, nullable=False)
+    timestamp = Column(BigInteger, nullable=False)
+    value = Column(Float, nullable=False)
+
+
+class MetricRollup(BaseModel):
+    """
+    测试结束时预聚合的统计值，window_s为0表示整个测试，否则为固定窗口（按毫秒时间戳对齐）
+    """
+    __tablename__ = "metric_rollup"
+    __table_args__ = (Index('ix_metric_rollup_run_window_metric', 'test_run_id', 'window_s', 'metric_id',
+                            'window_start', unique=True),)
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    test_run_id = Column(Integer, nullable=False)
+    metric_id = Column(Integer, nullable=False)
+    window_s = Column(Integer, nullable=False)
+    window_start = Column(BigInteger, nullable=False)
+    count = Column(Integer, nullable=False)
+    min = Column(Float, nullable=True)
+    max = Column(Float, nullable=True)
+    mean = Column(Float, nullable=True)
+    p50 = Column(Float, nullable=True)
+    p90 = Column(Float, nullable=True)
+    p95 = Column(Float, nullable=True)
+    p99 = Column(Float, nullable=True)
+
+
+class MetricSampleCompact(BaseModel):
+    """
+    超出保留数量的旧测试降采样后的时间序列，结构与 metric_sample 相同
+    """
+    __tablename__ = "metric_sample_compact"
+    __table_args__ = (Index('ix_metric_sample_compact_run_metric_ts', 'test_run_id', 'metric_id', 'timestamp'),)
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    test_run_id = Column(Integer, nullable=False)
+    metric_id = Column(Integer, nullable=False)
+    timestamp = Column(BigInteger, nullable=False)
+    value = Column(Float, nullable=False)
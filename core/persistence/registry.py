@@ -0,0 +1,117 @@
+# !/usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+@Version  : Python 3.12
+@Time     : 2025/7/21 21:10
+@Author   : wieszheng
+@Software : PyCharm
+"""
+import os
+import threading
+from typing import Any, Dict, Optional, Set, Tuple
+
+from sqlalchemy import create_engine, event, MetaData
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import sessionmaker
+
+# WAL模式下读写互不阻塞；synchronous=NORMAL只在checkpoint时fsync，进程崩溃不丢已提交数据
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'temp_store': 'MEMORY',
+    'cache_size': -20000,
+    'mmap_size': 268435456,
+    'busy_timeout': 5000,
+}
+POOL_SIZE = 5
+MAX_OVERFLOW = 10
+
+_lock = threading.RLock()
+_engines: Dict[str, Engine] = {}
+_sessionmakers: Dict[str, sessionmaker] = {}
+_schemas: Set[Tuple[str, int]] = set()
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+
+def _key(db_path: str) -> str:
+    return os.path.abspath(db_path)
+
+
+def get_engine(db_path: str, metadata: Optional[MetaData] = None) -> Engine:
+    """
+    进程内每个数据库文件共用一个引擎和连接池，首次获取时设置pragma
+    :param db_path:
+    :param metadata: 需要的表结构，每个数据库只创建一次
+    :return:
+    """
+    key = _key(db_path)
+    with _lock:
+        engine = _engines.get(key)
+        if engine is None:
+            engine = create_engine(f'sqlite:///{key}', echo=False, future=True,
+                                   pool_size=POOL_SIZE, max_overflow=MAX_OVERFLOW,
+                                   connect_args={'check_same_thread': False, 'timeout': 30})
+            event.listen(engine, 'connect', _set_sqlite_pragmas)
+            _engines[key] = engine
+        if metadata is not None:
+            ensure_schema(engine, metadata)
+    return engine
+
+
+def ensure_schema(engine: Engine, metadata: MetaData):
+    """
+    创建缺失的表和索引；已存在的表也补建后来新增的索引
+    同一引擎和表结构只执行一次
+    """
+    key = (str(engine.url), id(metadata))
+    with _lock:
+        if key in _schemas:
+            return
+        with engine.begin() as conn:
+            metadata.create_all(conn)
+            for table in metadata.sorted_tables:
+                for index in table.indexes:
+                    index.create(conn, checkfirst=True)
+        _schemas.add(key)
+
+
+def get_sessionmaker(db_path: str, metadata: Optional[MetaData] = None) -> sessionmaker:
+    """
+    共用引擎上的Session工厂
+    """
+    engine = get_engine(db_path, metadata)
+    key = _key(db_path)
+    with _lock:
+        factory = _sessionmakers.get(key)
+        if factory is None:
+            factory = _sessionmakers[key] = sessionmaker(bind=engine, future=True)
+    return factory
+
+
+def dispose(db_path: Optional[str] = None):
+    """
+    关闭连接池，db_path为空时关闭全部；之后再获取会重新创建
+    """
+    with _lock:
+        keys = [_key(db_path)] if db_path is not None else list(_engines)
+        for key in keys:
+            engine = _engines.pop(key, None)
+            _sessionmakers.pop(key, None)
+            if engine is not None:
+                url = str(engine.url)
+                _schemas.difference_update({schema for schema in _schemas if schema[0] == url})
+                engine.dispose()
+
+
+def pool_status() -> Dict[str, Any]:
+    """
+    已创建的引擎及其连接池状态
+    """
+    with _lock:
+        return {key: engine.pool.status() for key, engine in _engines.items()}
@@ -0,0 +1,88 @@
+# !/usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+@Version  : Python 3.12
+@Time     : 2025/7/20 15:02
+@Author   : wieszheng
+@Software : PyCharm
+"""
+from typing import Any, Dict, List, Sequence
+
+import numpy as np
+
+# 预聚合的百分位，与 MetricRollup 的列对应
+ROLLUP_PERCENTILES = (50, 90, 95, 99)
+# 默认窗口（秒），0为整个测试
+DEFAULT_ROLLUP_WINDOWS = (0, 10, 60)
+
+
+def rollup_rows(test_run_id: int, metric_ids: np.ndarray, timestamps: np.ndarray, values: np.ndarray,
+                window_s: int) -> List[Dict[str, Any]]:
+    """
+    按 (指标, 窗口) 分组计算 count/min/max/mean 和最近秩法百分位，全部向量化
+    按指标、窗口起点、数值排序后，每组是连续的一段，最小值、最大值和百分位都按下标直接取
+    :param test_run_id:
+    :param metric_ids: 每条采样的指标id
+    :param timestamps: 每条采样的毫秒时间戳
+    :param values: 每条采样的数值
+    :param window_s: 窗口长度（秒），0为整个测试
+    :return: MetricRollup 的行
+    """
+    if not len(values):
+        return []
+    if window_s:
+        window_ms = window_s * 1000
+        starts = timestamps - timestamps % window_ms
+    else:
+        starts = np.zeros_like(timestamps)
+    order = np.lexsort((values, starts, metric_ids))
+    metric_ids, starts, values, timestamps = metric_ids[order], starts[order], values[order], timestamps[order]
+
+    boundary = np.flatnonzero((np.diff(metric_ids) != 0) | (np.diff(starts) != 0)) + 1
+    first = np.concatenate(([0], boundary))
+    counts = np.diff(np.append(first, len(values)))
+    last = first + counts - 1
+    if window_s:
+        window_start = starts[first]
+    else:
+        window_start = np.minimum.reduceat(timestamps, first)
+    columns = {
+        'metric_id': metric_ids[first],
+        'window_start': window_start,
+        'count': counts,
+        'min': values[first],
+        'max': values[last],
+        'mean': np.add.reduceat(values, first) / counts,
+    }
+    for percentile in ROLLUP_PERCENTILES:
+        rank = np.clip(np.ceil(percentile / 100 * counts).astype(np.int64) - 1, 0, counts - 1)
+        columns[f"p{percentile}"] = values[first + rank]
+
+    names = list(columns)
+    rows = []
+    for group in zip(*(columns[name].tolist() for name in names)):
+        row = dict(zip(names, group))
+        row['test_run_id'] = test_run_id
+        row['window_s'] = window_s
+        rows.append(row)
+    return rows
+
+
+def compute_rollups(test_run_id: int, samples: Sequence[Sequence[Any]],
+                    windows: Sequence[int] = DEFAULT_ROLLUP_WINDOWS) -> List[Dict[str, Any]]:
+    """
+    一次测试全部采样的预聚合
+    :param test_run_id:
+    :param samples: [(指标id, 毫秒时间戳, 数值)]
+    :param windows: 窗口长度（秒）
+    :return:
+    """
+    if not samples:
+        return []
+    metric_ids = np.fromiter((row[0] for row in samples), dtype=np.int64, count=len(samples))
+    timestamps = np.fromiter((row[1] for row in samples), dtype=np.int64, count=len(samples))
+    values = np.fromiter((row[2] for row in samples), dtype=np.float64, count=len(samples))
+    rows = []
+    for window_s in windows:
+        rows.extend(rollup_rows(test_run_id, metric_ids, timestamps, values, window_s))
+    return rows
@@ -0,0 +1,195 @@
+# !/usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+@Version  : Python 3.12
+@Time     : 2025/7/20 10:36
+@Author   : wieszheng
+@Software : PyCharm
+"""
+import argparse
+import json
+import math
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from sqlalchemy import select, func, insert, delete
+
+from core.metric_schema import SP_DAEMON_SCHEMA
+from core.persistence.models import MonitorData, MetricSample, MetricSampleCompact
+
+# save_monitor_data 的参数即指标分组
+MONITOR_GROUPS = ('cpu_usage', 'cpu_freq', 'mem', 'fps')
+DEFAULT_PERCENTILES = (50, 90, 95, 99)
+
+
+def to_float(value: Any) -> Optional[float]:
+    """
+    转换为数值，None、NA和非数值返回None
+    :param value:
+    :return:
+    """
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return None if math.isnan(value) else float(value)
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if math.isnan(number) else number
+
+
+def to_epoch_ms(timestamp: Any) -> int:
+    """
+    时间戳统一为整数毫秒
+    :param timestamp:
+    :return:
+    """
+    return int(float(timestamp))
+
+
+def flatten_monitor_data(cpu_usage: Any = None, cpu_freq: Any = None, mem: Any = None,
+                         fps: Any = None) -> Iterator[Tuple[str, str, float]]:
+    """
+    将一条监控数据展开为 (分组, 指标名, 数值)；字典按键展开，单个数值以分组名为指标名
+    """
+    for group, data in zip(MONITOR_GROUPS, (cpu_usage, cpu_freq, mem, fps)):
+        if isinstance(data, str):
+            try:
+                data = json.loads(data)
+            except ValueError:
+                pass
+        if isinstance(data, dict):
+            for name, value in data.items():
+                number = to_float(value)
+                if number is not None:
+                    yield group, str(name), number
+        else:
+            number = to_float(data)
+            if number is not None:
+                yield group, group, number
+
+
+def metric_unit(name: str) -> str:
+    """
+    指标单位，取自SP_daemon指标表，未知指标为空
+    """
+    metric = SP_DAEMON_SCHEMA.lookup(name)
+    return metric.unit if metric is not None else ''
+
+
+def nearest_rank(count: int, percentile: float) -> int:
+    """
+    最近秩法的百分位在升序中的下标
+    :param count:
+    :param percentile: 0~100
+    :return:
+    """
+    return min(count - 1, max(0, math.ceil(percentile / 100 * count) - 1))
+
+
+def percentile_key(percentile: float) -> str:
+    return f"p{percentile:g}"
+
+
+def sample_filter(query: Any, test_run_id: Optional[int], metric_ids: Sequence[int],
+                  start_ms: Optional[int] = None, end_ms: Optional[int] = None, table: Any = MetricSample) -> Any:
+    """
+    按测试、指标和时间范围[start_ms, end_ms)过滤，条件顺序与复合索引一致
+    :param table: MetricSample 或结构相同的降采样表
+    """
+    if test_run_id is not None:
+        query = query.where(table.test_run_id == test_run_id)
+    query = query.where(table.metric_id.in_(metric_ids))
+    if start_ms is not None:
+        query = query.where(table.timestamp >= start_ms)
+    if end_ms is not None:
+        query = query.where(table.timestamp < end_ms)
+    return query
+
+
+def query_stats(conn: Any, test_run_id: Optional[int], metric_ids: Sequence[int],
+                start_ms: Optional[int] = None, end_ms: Optional[int] = None,
+                percentiles: Sequence[float] = DEFAULT_PERCENTILES) -> Dict[str, Any]:
+    """
+    在SQL中计算统计值：count/avg/min/max用聚合函数，百分位用排序后按偏移取值
+    :return: 没有数据时count为0，其余为None
+    """
+    row = conn.execute(sample_filter(
+        select(func.count(MetricSample.value), func.avg(MetricSample.value),
+               func.min(MetricSample.value), func.max(MetricSample.value)),
+        test_run_id, metric_ids, start_ms, end_ms)).one()
+    count = row[0]
+    stats: Dict[str, Any] = {'count': count, 'avg': row[1], 'min': row[2], 'max': row[3]}
+    for percentile in percentiles:
+        value = None
+        if count:
+            value = conn.execute(sample_filter(
+                select(MetricSample.value), test_run_id, metric_ids, start_ms, end_ms)
+                .order_by(MetricSample.value).limit(1).offset(nearest_rank(count, percentile))).scalar()
+        stats[percentile_key(percentile)] = value
+    return stats
+
+
+def migrate_monitor_data(engine: Any, metric_id: Callable[[str, str], int], batch_size: int = 1000,
+                         drop: bool = False) -> int:
+    """
+    将monitor_data中的JSON记录迁移到metric_sample窄表
+    每个测试先读取展开，再在一个事务内写入（drop时同时删除该测试已迁移的JSON记录），中断后重新执行会从未完成的测试继续；
+    已有窄表数据（含已压缩）的测试跳过，时间戳无法解析的记录保留在原表
+    :param engine:
+    :param metric_id: (分组, 指标名) -> 指标id
+    :param batch_size: 每批读取的JSON记录数
+    :param drop: 迁移后删除已迁移的JSON记录
+    :return: 写入的采样数
+    """
+    table = MonitorData.__table__
+    with engine.connect() as conn:
+        migrated = set(conn.execute(select(MetricSample.test_run_id).distinct()).scalars())
+        migrated.update(conn.execute(select(MetricSampleCompact.test_run_id).distinct()).scalars())
+        run_ids = conn.execute(select(table.c.test_run_id).distinct().order_by(table.c.test_run_id)).scalars().all()
+    written = 0
+    for test_run_id in run_ids:
+        if test_run_id in migrated:
+            continue
+        # 先在只读连接上展开并取得全部指标id（可能新建指标并提交），再开启写事务，
+        # 避免写事务持有锁时另一个连接创建指标而等待超时
+        samples: List[Dict[str, Any]] = []
+        done_ids: List[int] = []
+        last_id = 0
+        with engine.connect() as conn:
+            while True:
+                rows = conn.execute(select(table).where(table.c.test_run_id == test_run_id, table.c.id > last_id)
+                                    .order_by(table.c.id).limit(batch_size)).mappings().all()
+                if not rows:
+                    break
+                last_id = rows[-1]['id']
+                for row in rows:
+                    try:
+                        timestamp = to_epoch_ms(row['timestamp'])
+                    except (TypeError, ValueError):
+                        continue
+                    for group, name, value in flatten_monitor_data(row['cpu_usage'], row['cpu_freq'],
+                                                                   row['mem'], row['fps']):
+                        samples.append({'test_run_id': test_run_id, 'metric_id': metric_id(group, name),
+                                        'timestamp': timestamp, 'value': value})
+                    done_ids.append(row['id'])
+        with engine.begin() as conn:
+            for i in range(0, len(samples), batch_size):
+                conn.execute(insert(MetricSample.__table__), samples[i:i + batch_size])
+            if drop:
+                for i in range(0, len(done_ids), batch_size):
+                    conn.execute(delete(table).where(table.c.id.in_(done_ids[i:i + batch_size])))
+        written += len(samples)
+    return written
+
+
+if __name__ == '__main__':
+    from core.persistence.db import DB_PATH, SQLPersister
+
+    arg_parser = argparse.ArgumentParser(description="monitor_data JSON记录迁移到metric_sample窄表")
+    arg_parser.add_argument('--db', default=DB_PATH)
+    arg_parser.add_argument('--drop', action='store_true', help="迁移后删除已迁移的JSON记录")
+    args = arg_parser.parse_args()
+    persister = SQLPersister(args.db)
+    print(f"迁移完成: {persister.migrate_monitor_data(drop=args.drop)}条采样")
+    persister.close()
@@ -0,0 +1,245 @@
+# !/usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+@Version  : Python 3.12
+@Time     : 2025/7/8 21:15
+@Author   : wieszheng
+@Software : PyCharm
+"""
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+from loguru import logger
+
+from core.hdc import HDC
+from hmdriver2.driver import Driver
+
+
+@dataclass
+class ProcessInfo:
+    """
+    应用的一个进程
+    """
+    pid: str
+    ppid: str
+    name: str
+    role: str
+    start_time: str = ''
+
+
+@dataclass
+class AppProcesses:
+    """
+    应用的全部进程：主进程 + render/extension/webview等子进程
+    """
+    package_name: str
+    processes: List[ProcessInfo] = field(default_factory=list)
+    resolved_at: float = 0.0
+
+    @property
+    def main(self) -> Optional[ProcessInfo]:
+        return next((p for p in self.processes if p.role == 'main'), None)
+
+    @property
+    def pids(self) -> List[str]:
+        return [p.pid for p in self.processes]
+
+
+@dataclass
+class ProcessEvent:
+    """
+    进程变化事件：start 首次发现，restart 主进程pid或启动时间变化（重启/崩溃拉起），exit 进程消失
+    """
+    kind: str
+    package_name: str
+    old_pid: Optional[str]
+    new_pid: Optional[str]
+    timestamp: int
+
+
+def is_app_process(package_name: str, name: str) -> bool:
+    """
+    进程名是否属于应用：主进程与包名相同，子进程为 包名:后缀；com.foo.bar 不属于 com.foo
+    :param package_name:
+    :param name:
+    :return:
+    """
+    return name == package_name or name.startswith(package_name + ':')
+
+
+def process_role(package_name: str, name: str) -> str:
+    """
+    根据进程名判断进程角色
+    :param package_name:
+    :param name:
+    :return:
+    """
+    if name == package_name:
+        return 'main'
+    lowered = name.lower()
+    if 'web' in lowered:
+        return 'webview'
+    if 'render' in lowered:
+        return 'render'
+    if is_app_process(package_name, name):
+        return 'extension'
+    return 'child'
+
+
+class ProcessResolver:
+    """
+    包名到进程的解析缓存
+    首次解析执行一次 ps -ef；之后只读取缓存进程的 /proc/<pid>/stat 启动时间做校验，
+    pid消失或启动时间变化时才重新执行 ps，并产生 restart/exit 事件。
+    子进程可能在运行中新增，因此每隔 rediscover_interval 秒仍会完整扫描一次；
+    应用未运行（缓存为空）时每隔 revalidate_interval 秒重新扫描，尽快发现应用启动。
+    """
+
+    def __init__(self, device, revalidate_interval: float = 1.0, rediscover_interval: float = 30.0):
+        self.device: Driver = device
+        self.revalidate_interval = revalidate_interval
+        self.rediscover_interval = rediscover_interval
+        self.events: List[ProcessEvent] = []
+        self.listeners: List[Callable[[ProcessEvent], None]] = []
+        self._cache: Dict[str, AppProcesses] = {}
+        self._validated_at: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def resolve(self, package_name: str, refresh: bool = False) -> AppProcesses:
+        """
+        获取应用的全部进程
+        :param package_name:
+        :param refresh: 强制重新执行ps
+        :return:
+        """
+        with self._lock:
+            now = time.monotonic()
+            cached = self._cache.get(package_name)
+            if cached is None or refresh or now - cached.resolved_at >= self.rediscover_interval:
+                return self._discover(package_name)
+            if now - self._validated_at.get(package_name, 0) < self.revalidate_interval:
+                return cached
+            if not cached.processes or not self._is_valid(cached):
+                return self._discover(package_name)
+            self._validated_at[package_name] = now
+            return cached
+
+    def pids(self, package_name: str) -> List[str]:
+        return self.resolve(package_name).pids
+
+    def main_pid(self, package_name: str) -> Optional[str]:
+        main = self.resolve(package_name).main
+        return main.pid if main else None
+
+    def invalidate(self, package_name: Optional[str] = None):
+        """
+        清除缓存，如主动重启应用之后
+        :param package_name: 为空时清除全部
+        :return:
+        """
+        with self._lock:
+            if package_name is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(package_name, None)
+
+    def _discover(self, package_name: str) -> AppProcesses:
+        """
+        执行ps获取应用进程，并与缓存对比产生事件
+        :param package_name:
+        :return:
+        """
+        out = self.device.shell("ps -ef").output
+        rows = []
+        for line in out.splitlines():
+            parts = line.split()
+            # UID PID PPID C STIME TTY TIME CMD
+            if len(parts) < 8 or not parts[1].isdigit():
+                continue
+            rows.append((parts[1], parts[2], parts[7]))
+
+        main_pids = {pid for pid, _, name in rows if name == package_name}
+        processes = [
+            ProcessInfo(pid=pid, ppid=ppid, name=name, role=process_role(package_name, name))
+            for pid, ppid, name in rows
+            if is_app_process(package_name, name) or ppid in main_pids
+        ]
+        app = AppProcesses(package_name=package_name, processes=processes, resolved_at=time.monotonic())
+        start_times = self._read_start_times(app.pids)
+        for proc in processes:
+            proc.start_time = start_times.get(proc.pid, '')
+
+        self._emit_changes(self._cache.get(package_name), app)
+        self._cache[package_name] = app
+        self._validated_at[package_name] = app.resolved_at
+        return app
+
+    def _is_valid(self, app: AppProcesses) -> bool:
+        """
+        一次shell调用校验所有缓存进程的启动时间
+        :param app:
+        :return:
+        """
+        start_times = self._read_start_times(app.pids)
+        return all(start_times.get(p.pid) == p.start_time for p in app.processes)
+
+    def _read_start_times(self, pids: List[str]) -> Dict[str, str]:
+        """
+        读取 /proc/<pid>/stat 的第22个字段（进程启动时间，单位为时钟节拍）
+        :param pids:
+        :return:
+        """
+        if not pids:
+            return {}
+        paths = " ".join(f"/proc/{pid}/stat" for pid in pids)
+        out = self.device.shell(f"cat {paths} 2>/dev/null").output
+        start_times = {}
+        for line in out.splitlines():
+            pid, _, rest = line.partition(' ')
+            # comm字段可能包含空格，取最后一个 ) 之后的字段，从第3个字段state开始
+            fields = rest[rest.rfind(')') + 1:].split()
+            if pid.isdigit() and len(fields) > 19:
+                start_times[pid] = fields[19]
+        return start_times
+
+    def _emit_changes(self, old: Optional[AppProcesses], new: AppProcesses):
+        old_main = old.main if old else None
+        new_main = new.main
+        if old_main is None and new_main is not None:
+            kind = 'start'
+        elif old_main is not None and new_main is None:
+            kind = 'exit'
+        elif old_main is not None and (old_main.pid, old_main.start_time) != (new_main.pid, new_main.start_time):
+            kind = 'restart'
+        else:
+            return
+        event = ProcessEvent(kind=kind, package_name=new.package_name,
+                             old_pid=old_main.pid if old_main else None,
+                             new_pid=new_main.pid if new_main else None,
+                             timestamp=int(time.time() * 1000))
+        logger.info(f"进程事件: {event}")
+        self.events.append(event)
+        for listener in self.listeners:
+            listener(event)
+
+    @staticmethod
+    def aggregate(per_pid: Dict[str, Dict[str, Any]]) -> Dict[str, float]:
+        """
+        将各进程的同名数值指标求和，得到应用总量
+        :param per_pid: pid -> 指标字典
+        :return:
+        """
+        totals: Dict[str, float] = {}
+        for metrics in per_pid.values():
+            for key, value in metrics.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    totals[key] = totals.get(key, 0) + value
+        return totals
+
+
+if __name__ == '__main__':
+    hdc = HDC()
+    resolver = ProcessResolver(hdc.driver)
+    print(resolver.resolve("com.baidu.yiyan.ent"))
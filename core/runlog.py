@@ -0,0 +1,210 @@
+# !/usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+@Version  : Python 3.12
+@Time     : 2025/7/19 20:12
+@Author   : wieszheng
+@Software : PyCharm
+"""
+import argparse
+import csv
+import json
+import os
+import struct
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+MAGIC = b'PERFLOG1'
+_LENGTH = struct.Struct('<I')
+_ALIGN = 8
+# 支持的列类型，统一按小端存储
+DTYPES = {'f8': '<f8', 'i8': '<i8'}
+
+
+def column_dtype(name: str) -> str:
+    """
+    列的默认存储类型：时间戳为int64，其余为float64
+    :param name:
+    :return:
+    """
+    return 'i8' if name == 'timestamp' else 'f8'
+
+
+def record_dtype(columns: Sequence[Tuple[str, str]]) -> np.dtype:
+    return np.dtype([(name, DTYPES[dtype]) for name, dtype in columns])
+
+
+class RunLogWriter:
+    """
+    二进制列式运行日志的追加写入
+    文件结构：MAGIC | 表头长度(uint32) | 表头JSON（列定义和元信息，按8字节对齐） | 定长记录...
+    记录先在内存中按块累积，写满一块或调用flush时一次追加；进程异常退出时最多丢失未flush的块，
+    末尾写了一半的记录在读取时会被忽略。
+    """
+
+    def __init__(self, path: str, columns: Sequence[Tuple[str, str]], meta: Optional[Dict[str, Any]] = None,
+                 chunk_size: int = 256):
+        """
+        :param path:
+        :param columns: [(列名, 'f8'|'i8')]
+        :param meta: 写入表头的元信息，如包名、单位
+        :param chunk_size: 每块的记录数
+        """
+        self.path = path
+        self.columns = [(name, dtype) for name, dtype in columns]
+        self.dtype = record_dtype(self.columns)
+        self.chunk_size = chunk_size
+        self._chunk = np.zeros(chunk_size, dtype=self.dtype)
+        self._pending = 0
+        self.count = 0
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            header = read_header(path)[0]
+            existing = [(c['name'], c['dtype']) for c in header['columns']]
+            if existing != self.columns:
+                raise ValueError(f"运行日志的列定义不一致: {path}")
+            self._file = open(path, 'ab')
+            self._truncate_partial(header)
+        else:
+            self._file = open(path, 'wb')
+            self._write_header(meta or {})
+
+    def _write_header(self, meta: Dict[str, Any]):
+        header = {
+            'version': 1,
+            'columns': [{'name': name, 'dtype': dtype} for name, dtype in self.columns],
+            'meta': meta,
+        }
+        body = json.dumps(header, ensure_ascii=False).encode('utf-8')
+        size = len(MAGIC) + _LENGTH.size + len(body)
+        body += b' ' * (-size % _ALIGN)
+        self._file.write(MAGIC + _LENGTH.pack(len(body)) + body)
+        self._file.flush()
+
+    def _truncate_partial(self, header: Dict[str, Any]):
+        """
+        追加前截掉末尾写了一半的记录，保证之后的记录对齐
+        """
+        offset = header['offset']
+        size = os.path.getsize(self.path)
+        extra = (size - offset) % self.dtype.itemsize
+        if extra:
+            self._file.truncate(size - extra)
+
+    def append(self, values: Mapping[str, Any]):
+        """
+        追加一条记录，缺失的float列记为NaN，int列记为0
+        :param values: 列名 -> 数值
+        :return:
+        """
+        record = self._chunk[self._pending]
+        for name, dtype in self.columns:
+            value = values.get(name)
+            if value is None or value == '':
+                record[name] = np.nan if dtype == 'f8' else 0
+            else:
+                try:
+                    record[name] = value
+                except (TypeError, ValueError):
+                    record[name] = np.nan if dtype == 'f8' else 0
+        self._pending += 1
+        self.count += 1
+        if self._pending >= self.chunk_size:
+            self.flush()
+
+    def append_row(self, row: Sequence[Any]):
+        """
+        按列顺序追加一条记录，调用方保证取值与列类型一致
+        :param row:
+        :return:
+        """
+        self._chunk[self._pending] = tuple(row)
+        self._pending += 1
+        self.count += 1
+        if self._pending >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if self._pending and self._file is not None:
+            self._file.write(self._chunk[:self._pending].tobytes())
+            self._file.flush()
+            self._pending = 0
+
+    def close(self):
+        if self._file is not None:
+            self.flush()
+            self._file.close()
+            self._file = None
+
+    def __enter__(self) -> "RunLogWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def read_header(path: str) -> Tuple[Dict[str, Any], int]:
+    """
+    读取表头
+    :param path:
+    :return: (表头, 记录区起始偏移)
+    """
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"不是运行日志文件: {path}")
+        (length,) = _LENGTH.unpack(f.read(_LENGTH.size))
+        header = json.loads(f.read(length).decode('utf-8'))
+    offset = len(MAGIC) + _LENGTH.size + length
+    header['offset'] = offset
+    return header, offset
+
+
+class RunLog:
+    """
+    运行日志的只读视图，记录区以 np.memmap 映射，按列读取不复制数据
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.header, offset = read_header(path)
+        self.columns: List[str] = [c['name'] for c in self.header['columns']]
+        self.meta: Dict[str, Any] = self.header.get('meta', {})
+        self.dtype = record_dtype([(c['name'], c['dtype']) for c in self.header['columns']])
+        count = (os.path.getsize(path) - offset) // self.dtype.itemsize
+        if count:
+            self.records = np.memmap(path, dtype=self.dtype, mode='r', offset=offset, shape=(count,))
+        else:
+            self.records = np.zeros(0, dtype=self.dtype)
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def column(self, name: str) -> np.ndarray:
+        return self.records[name]
+
+    def to_csv(self, csv_path: Optional[str] = None) -> str:
+        """
+        转换为CSV，便于人工查看
+        :param csv_path: 默认与日志同名的 .csv
+        :return:
+        """
+        csv_path = csv_path or os.path.splitext(self.path)[0] + '.csv'
+        with open(csv_path, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(self.columns)
+            step = 10000
+            for start in range(0, len(self.records), step):
+                writer.writerows(self.records[start:start + step].tolist())
+        return csv_path
+
+
+def open_runlog(path: str) -> RunLog:
+    return RunLog(path)
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description="运行日志转换为CSV")
+    arg_parser.add_argument('paths', nargs='+', help="运行日志(.bin)")
+    args = arg_parser.parse_args()
+    for log_path in args.paths:
+        print(open_runlog(log_path).to_csv())
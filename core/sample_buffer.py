@@ -0,0 +1,227 @@
+# !/usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+@Version  : Python 3.12
+@Time     : 2025/7/12 14:27
+@Author   : wieszheng
+@Software : PyCharm
+"""
+import threading
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+from core.metric_schema import SP_DAEMON_SCHEMA
+
+CPU_METRICS = ["Frequency", "Usage", "idleUsage", "systemUsage", "userUsage", "irqUsage"]
+PROCESS_METRICS = ["ProcCpuLoad", "ProcCpuUsage", "ProcSCpuUsage", "ProcUCpuUsage"]
+SYSTEM_METRICS = ["TotalcpuUsage", "TotalcpuidleUsage", "TotalcpusystemUsage", "TotalcpuuserUsage"]
+MEMORY_METRICS = ["pss", "nativeHeapPss", "arktsHeapPss", "gpuPss", "graphicPss", "stackPss", "swapPss"]
+
+
+def sp_daemon_columns(core_count: int = 8, cpu: bool = True, memory: bool = True) -> List[str]:
+    """
+    SP_daemon采样对应的列定义
+    :param core_count: CPU核心数
+    :param cpu:
+    :param memory:
+    :return:
+    """
+    columns = ["timestamp"]
+    if cpu:
+        columns += PROCESS_METRICS + SYSTEM_METRICS
+        columns += [f"cpu{core}{metric}" for core in range(core_count) for metric in CPU_METRICS]
+    if memory:
+        columns += MEMORY_METRICS
+    return columns
+
+
+def sample_columns(fields: Mapping[str, str]) -> List[str]:
+    """
+    一个SP_daemon采样块中的数值列，timestamp为第一列
+    :param fields: 一个采样块的 key -> value 字符串
+    :return:
+    """
+    columns = ["timestamp"]
+    for key in fields:
+        metric = SP_DAEMON_SCHEMA.lookup(key)
+        if key != "timestamp" and metric is not None and metric.is_numeric:
+            columns.append(key)
+    return columns
+
+
+class SampleRecord:
+    """
+    缓冲区中一行数据的只读视图，不复制数据
+    """
+    __slots__ = ('_buffer', '_pos')
+
+    def __init__(self, buffer: "SampleBuffer", pos: int):
+        self._buffer = buffer
+        self._pos = pos
+
+    def __getitem__(self, name: str) -> float:
+        return float(self._buffer.data[self._buffer.index[name], self._pos])
+
+    def get(self, name: str, default: Optional[float] = None) -> Optional[float]:
+        idx = self._buffer.index.get(name)
+        return default if idx is None else float(self._buffer.data[idx, self._pos])
+
+    def to_dict(self) -> Dict[str, float]:
+        return dict(zip(self._buffer.columns, self._buffer.data[:, self._pos].tolist()))
+
+
+class SampleBuffer:
+    """
+    固定列的环形列式缓冲区
+    每一列是一段连续的 float64 数组，采集端直接按列写入，分析/写入/渲染端按列读取视图；
+    容量写满后覆盖最旧的数据，长时间运行内存占用恒定。缺失值为 NaN。
+    """
+
+    def __init__(self, columns: Sequence[str], capacity: int = 86400):
+        """
+        :param columns: 列名，通常第一列为 timestamp
+        :param capacity: 最多保留的行数
+        """
+        if capacity <= 0:
+            raise ValueError("缓冲区容量必须大于0")
+        self.columns = list(columns)
+        self.index: Dict[str, int] = {name: i for i, name in enumerate(self.columns)}
+        self.capacity = capacity
+        self.data = np.full((len(self.columns), capacity), np.nan, dtype=np.float64)
+        self._head = 0
+        self._size = 0
+        self._row = np.empty(len(self.columns), dtype=np.float64)
+        # SP_daemon原始值写入时的单位换算，与指标表一致
+        self._scales = [getattr(SP_DAEMON_SCHEMA.lookup(name), 'scale', 1.0) for name in self.columns]
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def nbytes(self) -> int:
+        return self.data.nbytes
+
+    @property
+    def wrapped(self) -> bool:
+        return self._size == self.capacity and self._head != 0
+
+    def append_row(self, row: Sequence[float]):
+        """
+        按列顺序追加一行
+        :param row:
+        :return:
+        """
+        with self._lock:
+            self._write(row)
+
+    def append(self, values: Mapping[str, float]):
+        """
+        追加一行，未出现在values中的列记为NaN，未定义的键忽略
+        :param values: 列名 -> 数值
+        :return:
+        """
+        with self._lock:
+            row = self._row
+            row.fill(np.nan)
+            index = self.index
+            for key, value in values.items():
+                idx = index.get(key)
+                if idx is not None and value is not None:
+                    row[idx] = value
+            self._write(row)
+
+    def append_fields(self, fields: Mapping[str, str]):
+        """
+        直接追加SP_daemon的原始键值对（字符串），按指标表换算单位，NA或非数值记为NaN
+        :param fields:
+        :return:
+        """
+        with self._lock:
+            row = self._row
+            row.fill(np.nan)
+            index = self.index
+            scales = self._scales
+            for key, value in fields.items():
+                idx = index.get(key)
+                if idx is None:
+                    continue
+                try:
+                    row[idx] = float(value) * scales[idx]
+                except (TypeError, ValueError):
+                    pass
+            self._write(row)
+
+    def _write(self, row: Sequence[float]):
+        self.data[:, self._head] = row
+        self._head = (self._head + 1) % self.capacity
+        if self._size < self.capacity:
+            self._size += 1
+
+    def column_segments(self, name: str) -> Tuple[np.ndarray, ...]:
+        """
+        按时间顺序返回一列的视图片段（零拷贝），未回绕时只有一段
+        :param name:
+        :return:
+        """
+        col = self.data[self.index[name]]
+        if self._size < self.capacity:
+            return (col[:self._size],)
+        if self._head == 0:
+            return (col,)
+        return col[self._head:], col[:self._head]
+
+    def column(self, name: str) -> np.ndarray:
+        """
+        按时间顺序返回一列；未回绕时为零拷贝视图，回绕后拼接为新数组
+        :param name:
+        :return:
+        """
+        segments = self.column_segments(name)
+        return segments[0] if len(segments) == 1 else np.concatenate(segments)
+
+    def latest(self, indices: Optional[Sequence[int]] = None) -> np.ndarray:
+        """
+        最新一行（复制），indices为列下标时只取这些列
+        :param indices:
+        :return:
+        """
+        with self._lock:
+            if not self._size:
+                raise IndexError("缓冲区为空")
+            pos = (self._head - 1) % self.capacity
+            return self.data[:, pos].copy() if indices is None else self.data[indices, pos]
+
+    def record(self, i: int) -> SampleRecord:
+        """
+        第i行（按时间顺序，支持负数索引）的只读视图
+        :param i:
+        :return:
+        """
+        if not -self._size <= i < self._size:
+            raise IndexError(i)
+        i %= self._size
+        start = self._head if self._size == self.capacity else 0
+        return SampleRecord(self, (start + i) % self.capacity)
+
+    def stats(self, name: str) -> Dict[str, float]:
+        """
+        一列的平均值/最大值/最小值，忽略NaN
+        :param name:
+        :return:
+        """
+        col = self.column(name)
+        if not len(col) or np.isnan(col).all():
+            return {'avg': 0.0, 'max': 0.0, 'min': 0.0}
+        return {
+            'avg': round(float(np.nanmean(col)), 2),
+            'max': round(float(np.nanmax(col)), 2),
+            'min': round(float(np.nanmin(col)), 2),
+        }
+
+    def clear(self):
+        with self._lock:
+            self.data.fill(np.nan)
+            self._head = 0
+            self._size = 0
@@ -0,0 +1,171 @@
+# !/usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+@Version  : Python 3.12
+@Time     : 2025/7/6 10:32
+@Author   : wieszheng
+@Software : PyCharm
+"""
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable, Dict, Any, Optional
+
+from loguru import logger
+
+
+@dataclass
+class SampleTiming:
+    """
+    一次采样的调度信息，时间均为 time.monotonic() 秒
+    """
+    index: int
+    scheduled: float
+    started: float
+    finished: float = 0.0
+    missed: int = 0
+    timestamp: int = 0
+    interval: float = 0.0
+
+    @property
+    def jitter_ms(self) -> float:
+        """实际触发时间相对栅格时间的偏差"""
+        return round((self.started - self.scheduled) * 1000, 3)
+
+    @property
+    def latency_ms(self) -> float:
+        """采集耗时"""
+        return round((self.finished - self.started) * 1000, 3)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'timestamp': self.timestamp,
+            'jitter_ms': self.jitter_ms,
+            'latency_ms': self.latency_ms,
+            'missed': self.missed,
+            'rate_hz': round(1 / self.interval, 3) if self.interval else 0,
+        }
+
+
+class TimingStats:
+    """
+    调度抖动和采集耗时的统计
+    """
+
+    def __init__(self, window: int = 1000):
+        self.count = 0
+        self.missed = 0
+        self.jitter_sum = 0.0
+        self.jitter_max = 0.0
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+        self._jitters = deque(maxlen=window)
+        self._latencies = deque(maxlen=window)
+
+    def add(self, timing: SampleTiming):
+        jitter, latency = timing.jitter_ms, timing.latency_ms
+        self.count += 1
+        self.missed += timing.missed
+        self.jitter_sum += jitter
+        self.jitter_max = max(self.jitter_max, jitter)
+        self.latency_sum += latency
+        self.latency_max = max(self.latency_max, latency)
+        self._jitters.append(jitter)
+        self._latencies.append(latency)
+
+    @staticmethod
+    def _percentile(values, q: float) -> float:
+        if not values:
+            return 0.0
+        ordered = sorted(values)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def to_dict(self) -> Dict[str, Any]:
+        count = self.count or 1
+        return {
+            'count': self.count,
+            'missed': self.missed,
+            'jitter_avg_ms': round(self.jitter_sum / count, 3),
+            'jitter_max_ms': round(self.jitter_max, 3),
+            'jitter_p95_ms': self._percentile(self._jitters, 0.95),
+            'latency_avg_ms': round(self.latency_sum / count, 3),
+            'latency_max_ms': round(self.latency_max, 3),
+            'latency_p95_ms': self._percentile(self._latencies, 0.95),
+        }
+
+
+class FixedRateScheduler:
+    """
+    固定频率调度器
+    采样时间点固定在 start + k * interval 的单调时钟栅格上，单次采集超时不会累积漂移；
+    错过的栅格点按 missed 策略处理：
+      skip     丢弃错过的点，等待下一个栅格点
+      coalesce 错过的点合并为一次立即采集，之后回到栅格
+    """
+
+    def __init__(self, interval: float = 1.0, missed: str = 'skip'):
+        if interval <= 0:
+            raise ValueError("采样间隔必须大于0")
+        if missed not in ('skip', 'coalesce'):
+            raise ValueError(f"不支持的错过策略: {missed}")
+        self.interval = interval
+        self.missed = missed
+        self.stats = TimingStats()
+        self.stop_event = threading.Event()
+        self._next_interval: Optional[float] = None
+
+    def stop(self):
+        self.stop_event.set()
+
+    def set_interval(self, interval: float):
+        """
+        修改采样间隔，从下一个采样点开始以当前采样点为起点重建栅格
+        :param interval:
+        :return:
+        """
+        if interval <= 0:
+            raise ValueError("采样间隔必须大于0")
+        self._next_interval = interval if interval != self.interval else None
+
+    def run(self, collect: Callable[[SampleTiming], None], max_samples: Optional[int] = None):
+        """
+        按固定频率循环调用collect，直到stop()或达到max_samples
+        :param collect: 采集函数，参数为本次的调度信息，返回后记录耗时
+        :param max_samples:
+        :return:
+        """
+        start = time.monotonic()
+        index = 0
+        missed = 0
+        samples = 0
+        while not self.stop_event.is_set():
+            scheduled = start + index * self.interval
+            delay = scheduled - time.monotonic()
+            if delay > 0 and self.stop_event.wait(delay):
+                break
+
+            timing = SampleTiming(index=index, scheduled=scheduled, started=time.monotonic(),
+                                  missed=missed, timestamp=int(time.time() * 1000), interval=self.interval)
+            try:
+                collect(timing)
+            except Exception as e:
+                logger.error(f"采集失败: {e}")
+            timing.finished = time.monotonic()
+            self.stats.add(timing)
+            samples += 1
+            if max_samples is not None and samples >= max_samples:
+                break
+
+            if self._next_interval is not None:
+                start, index = scheduled, 0
+                self.interval, self._next_interval = self._next_interval, None
+
+            # 计算下一个栅格点，超时时跳过或合并错过的点
+            next_index = int((timing.finished - start) // self.interval) + 1
+            missed = max(0, next_index - index - 1)
+            if missed and self.missed == 'coalesce':
+                next_index -= 1
+            if missed:
+                logger.debug(f"采集超时，错过{missed}个采样点")
+            index = max(next_index, index + 1)
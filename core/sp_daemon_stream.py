@@ -0,0 +1,152 @@
+# !/usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+@Version  : Python 3.12
+@Time     : 2025/7/5 21:10
+@Author   : wieszheng
+@Software : PyCharm
+"""
+import codecs
+import subprocess
+from typing import Dict, List, Iterator, Optional, Sequence
+
+from loguru import logger
+
+from core.hdc import open_shell_stream
+from core.sp_parser import TOKEN_PATTERN as ORDER_PATTERN
+from hmdriver2.driver import Driver
+
+
+class SpDaemonBlockParser:
+    """
+    SP_daemon输出的增量解析器
+    输入任意切分的stdout文本块，按 order:N key=value 还原出每一次采样的键值对
+    order序号回绕（通常回到order:0）即表示上一个采样块结束
+    """
+
+    def __init__(self):
+        self._pending = ''
+        self._block: Dict[str, str] = {}
+        self._last_order = -1
+        self._block_size: Optional[int] = None
+
+    def feed(self, chunk: str) -> List[Dict[str, str]]:
+        """
+        输入一段输出文本，返回其中已完整的采样块
+        末尾不完整的行会缓存到下一次调用
+        :param chunk:
+        :return:
+        """
+        lines = (self._pending + chunk).split('\n')
+        self._pending = lines.pop()
+        blocks = []
+        for line in lines:
+            blocks.extend(self._feed_line(line))
+        return blocks
+
+    def close(self) -> List[Dict[str, str]]:
+        """
+        输入结束，返回剩余的采样块
+        :return:
+        """
+        blocks = self._feed_line(self._pending)
+        self._pending = ''
+        if self._block:
+            blocks.append(self._block)
+            self._block = {}
+        self._last_order = -1
+        return blocks
+
+    def _feed_line(self, line: str) -> List[Dict[str, str]]:
+        match = ORDER_PATTERN.search(line)
+        if not match:
+            return []
+        order = int(match.group(1))
+        blocks = []
+        if order <= self._last_order and self._block:
+            # 序号回绕，上一个块结束；记录块大小以便之后的块可以立即输出
+            if self._block_size is None:
+                self._block_size = self._last_order
+            blocks.append(self._block)
+            self._block = {}
+        self._block[match.group(2)] = match.group(3)
+        self._last_order = order
+        if order == self._block_size:
+            blocks.append(self._block)
+            self._block = {}
+            self._last_order = -1
+        return blocks
+
+
+class SpDaemonStream:
+    """
+    长驻的SP_daemon采集流
+    每个会话只启动一次 SP_daemon -N <count>，从stdout持续读取并逐个产出采样块
+    """
+
+    def __init__(self, device: Driver, package_name: str, items: Sequence[str] = ("c", "r"),
+                 count: int = 3600):
+        """
+        :param device:
+        :param package_name:
+        :param items: SP_daemon采集项，如 c(cpu)、r(内存)、f(fps)
+        :param count: 采样次数
+        """
+        self.device = device
+        self.package_name = package_name
+        self.items = list(items)
+        self.count = count
+        self.process: Optional[subprocess.Popen] = None
+        self.parser = SpDaemonBlockParser()
+
+    def build_command(self) -> str:
+        """
+        构造设备端的SP_daemon命令
+        :return:
+        """
+        flags = " ".join(f"-{item}" for item in self.items)
+        return f"SP_daemon -PKG {self.package_name} -N {self.count} {flags}"
+
+    def start(self):
+        """
+        启动SP_daemon进程
+        :return:
+        """
+        if self.process is None:
+            self.process = open_shell_stream(self.device, self.build_command())
+
+    def stop(self):
+        """
+        停止SP_daemon进程，正在阻塞读取的迭代会随之结束
+        :return:
+        """
+        if self.process is None:
+            return
+        if self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        self.process = None
+
+    def __iter__(self) -> Iterator[Dict[str, str]]:
+        self.start()
+        process = self.process
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        while True:
+            chunk = process.stdout.read1(4096)
+            if not chunk:
+                break
+            for block in self.parser.feed(decoder.decode(chunk)):
+                yield block
+        for block in self.parser.feed(decoder.decode(b'', final=True)) + self.parser.close():
+            yield block
+        logger.debug(f"SP_daemon流结束: {self.package_name}")
+
+    def __enter__(self) -> "SpDaemonStream":
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
@@ -0,0 +1,22 @@
+# !/usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+@Version  : Python 3.12
+@Time     : 2025/7/14 20:52
+@Author   : wieszheng
+@Software : PyCharm
+"""
+import re
+from typing import Dict
+
+# order:N key=value，一次 findall 扫描整段输出
+TOKEN_PATTERN = re.compile(r'order:(\d+)\s+([^=\s]+)=(\S*)')
+
+
+def parse_fields(out: str) -> Dict[str, str]:
+    """
+    单次扫描解析SP_daemon输出为 key -> value 字符串，多个采样块时后出现的覆盖先出现的
+    :param out:
+    :return:
+    """
+    return {key: value for _, key, value in TOKEN_PATTERN.findall(out)}
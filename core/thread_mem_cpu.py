@@ -6,51 +6,344 @@
 @Author   : wieszheng
 @Software : PyCharm
 """
+import asyncio
 import os
 import threading
+import time
+from functools import lru_cache
 
-from typing import Any
+from typing import Any, List, Mapping, Optional, Sequence, Tuple
 
+import numpy as np
 from loguru import logger
 
-from core.cpu import CpuMonitor
-from core.memory import MemoryMonitor
+from core.adaptive import AdaptiveRatePolicy
+from core.async_collector import AsyncCollector, MetricSource, Sample
+from core.capture import CaptureDriver, CaptureWriter
+from core.cpu import CORE_KEY_PATTERN, CpuMonitor
+from core.device_agent import AgentSample, DeviceAgent
+from core.memory import HIDUMPER_MEM_ROWS, MEMORY_FIELDS, MemoryMonitor
+from core.persistence.journal import RunRecorder
+from core.process import ProcessEvent, ProcessResolver
+from core.sample_buffer import SampleBuffer, sample_columns
+from core.scheduler import FixedRateScheduler, SampleTiming
+from core.runlog import column_dtype
+from core.writer import LogWriter, format_header, format_line
+from core.sp_daemon_stream import SpDaemonStream
 from utils.render.render_chart import ChartRenderer
 
 
+# hidumper --cpuusage 中按进程求和的列
+HIDUMPER_CPU_COLUMNS = ('Total Usage', 'User Space', 'Kernel Space')
+
+
+def _percent(value: Optional[str]) -> Optional[float]:
+    try:
+        return float(value.rstrip('%'))
+    except (AttributeError, ValueError):
+        return None
+
+
+@lru_cache(maxsize=None)
+def _log_columns(names: Tuple[str, ...]) -> Tuple[Tuple[Tuple[str, str], ...], str]:
+    """
+    一组列名对应的二进制日志列定义和文本日志表头
+    """
+    return tuple((name, column_dtype(name)) for name in names), format_header(names)
+
+
+class _BufferLayout:
+    """
+    缓冲区的列到CPU/内存日志、运行记录和自适应指标的下标映射，按缓冲区的列一次算好；
+    每次采样只取最新一行按下标切片。缓冲区中没有的列指向行尾追加的NaN
+    """
+
+    def __init__(self, buffer: SampleBuffer):
+        self.buffer = buffer
+        index = buffer.index
+        missing = len(buffer.columns)
+        self.cores = sorted({match.group(1) for match in map(CORE_KEY_PATTERN.match, buffer.columns) if match},
+                            key=lambda core: int(core[3:]))
+        self.timestamp = index.get('timestamp', missing)
+        self.usage = [index.get(f'{core}Usage', missing) for core in self.cores]
+        self.frequency = [index.get(f'{core}Frequency', missing) for core in self.cores]
+        self.memory = [index.get(key, missing) for key in MEMORY_FIELDS.values()]
+        self.proc_cpu, self.total_cpu, self.fps = (index.get(key, missing)
+                                                   for key in ('ProcCpuUsage', 'TotalcpuUsage', 'fps'))
+        self.cpu_names = ('timestamp', *self.cores)
+        self.mem_names = (*MEMORY_FIELDS, 'timestamp')
+
+    def latest(self) -> np.ndarray:
+        """
+        最新一行，行尾追加缺失列使用的NaN
+        """
+        return np.append(self.buffer.latest(), np.nan)
+
+
 class ThreadMemCPU:
     def __init__(self, hdc: Any, log_mem_dir: str, log_cpu_dir: str, log_view_dir: str,
-                 package_name: str = 'com.baidu.yiyan.ent'):
+                 package_name: str = 'com.baidu.yiyan.ent', backend: str = 'shell', sample_count: int = 3600,
+                 interval: float = 1.0, log_sched_dir: str = None, adaptive: AdaptiveRatePolicy = None,
+                 buffer: SampleBuffer = None, capture_path: str = None, log_format: str = 'binary',
+                 recorder: RunRecorder = None, agent_pull_interval: float = 5.0, app_totals: bool = False):
+        """
+        :param hdc:
+        :param log_mem_dir:
+        :param log_cpu_dir:
+        :param log_view_dir:
+        :param package_name:
+        :param backend: shell 每次采样执行一次SP_daemon；stream 整个会话只启动一次SP_daemon；
+                        async CPU和内存各自按间隔并发采集；agent 推送设备端采样脚本，按间隔在设备上采样，
+                        主机每 agent_pull_interval 秒批量拉取
+        :param sample_count: stream模式下SP_daemon的采样次数
+        :param interval: shell/async/agent模式下的采样间隔（秒）
+        :param log_sched_dir: 调度抖动/采集耗时日志目录，默认与mem、cpu目录同级的sched
+        :param adaptive: shell模式下的自适应采样策略，为空时固定间隔；CPU采样同时附带 -f 采集FPS，供FPS下降判断
+        :param buffer: 列式缓冲区，shell/stream模式下采样的主存储：原始采样直接写入，CPU/内存日志和运行记录
+                       从最新一行按列生成；为空时按第一次采样的列创建（容量为sample_count）
+        :param capture_path: 记录所有shell原始输出（包括stream模式的持续输出）的采集文件，为空时不记录
+        :param log_format: binary 二进制列式运行日志(.bin)，可用 python -m core.runlog 转换为CSV；
+                           text 逗号分隔的文本日志(.txt)
+        :param recorder: 带预写日志的测试运行记录，每次采样同时入库，停止时结束测试；需已调用start
+        :param agent_pull_interval: agent模式下主机拉取设备端样本的间隔（秒）
+        :param app_totals: 每次采样用批量hidumper（内存、CPU各一次shell调用）获取应用全部进程（主进程及子进程）
+                           的数据并求和，写入 mem_app_<包名>_log 和 cpu_app_<包名>_log；进程列表取自ProcessResolver的缓存
+        """
+        if log_format not in ('binary', 'text'):
+            raise ValueError(f"不支持的日志格式: {log_format}")
         self.hdc = hdc
-        self.cpu_monitor = CpuMonitor(self.hdc.driver)
-        self.mem_monitor = MemoryMonitor(self.hdc.driver)
+        self.capture: Optional[CaptureWriter] = None
+        device = self.hdc.driver
+        if capture_path:
+            self.capture = CaptureWriter(capture_path)
+            device = CaptureDriver(device, self.capture)
+        self.device = device
+        self.resolver = ProcessResolver(device)
+        self.resolver.listeners.append(self._on_process_event)
+        self._process_events: List[ProcessEvent] = []
+        self.app_totals = app_totals
+        self.cpu_monitor = CpuMonitor(device, self.resolver)
+        self.mem_monitor = MemoryMonitor(device)
         self.thread_flag = True
         self.log_mem_dir = log_mem_dir
         self.log_cpu_dir = log_cpu_dir
         self.log_view_dir = log_view_dir
         self.package_name = package_name
+        self.backend = backend
+        self.sample_count = sample_count
+        self.stream: Optional[SpDaemonStream] = None
+        self.adaptive = adaptive
+        self.cpu_items = ("c", "f") if adaptive else ("c",)
+        self.buffer = buffer
+        self._layout: Optional[_BufferLayout] = None
+        self.scheduler = FixedRateScheduler(adaptive.interval if adaptive else interval)
+        self.collector: Optional[AsyncCollector] = None
+        self.agent: Optional[DeviceAgent] = None
+        self.agent_pull_interval = agent_pull_interval
+        self.log_sched_dir = log_sched_dir or os.path.join(os.path.dirname(os.path.abspath(log_mem_dir)), 'sched')
+        os.makedirs(self.log_sched_dir, exist_ok=True)
+        self.thread: Optional[threading.Thread] = None
+        self.writer = LogWriter()
+        self.log_format = log_format
+        self.recorder = recorder
 
     def _thread_mem_cpu(self):
         """
         线程函数，用于监控内存和CPU使用率
         :return:
         """
-        while self.thread_flag:
-            package_name = "com.baidu.yiyan.ent"
-            cpu_info = self.cpu_monitor.get_sp_daemon_cpu(package_name)
-            mem_info = self.mem_monitor.get_sp_daemon_memory(package_name)
-            self.write_mem_info(mem_info, package_name)
-            self.write_cpu_info(cpu_info, package_name)
-            logger.debug(f"CPU使用率: {cpu_info}")
-            logger.debug(f"内存使用情况: {mem_info}")
+        if self.backend == 'stream':
+            self._thread_mem_cpu_stream()
+            return
+        if self.backend == 'async':
+            self._thread_mem_cpu_async()
+            return
+        if self.backend == 'agent':
+            self._thread_mem_cpu_agent()
+            return
+
+        self.scheduler.run(self._collect_once)
+        logger.info(f"采样调度统计: {self.scheduler.stats.to_dict()}")
+
+    def _collect_once(self, timing: SampleTiming):
+        """
+        调度器回调，执行一次CPU和内存采集
+        :param timing:
+        :return:
+        """
+        cpu_fields = self.cpu_monitor.get_sp_daemon_fields(self.package_name, self.cpu_items)
+        mem_fields = self.mem_monitor.get_sp_daemon_fields(self.package_name)
+        timing.finished = time.monotonic()
+        self.write_sched_info(timing.to_dict(), self.package_name)
+        row = self._handle_fields({**mem_fields, **cpu_fields})
+        if self.adaptive is not None:
+            layout = self._layout
+            proc_cpu = row[layout.proc_cpu]
+            metrics = {
+                'cpu': proc_cpu if proc_cpu > 0 else row[layout.total_cpu],
+                'pss': row[layout.memory[0]],
+                'fps': row[layout.fps],
+            }
+            interval = self.adaptive.observe({key: float(value) for key, value in metrics.items()
+                                              if not np.isnan(value)})
+            self.scheduler.set_interval(interval)
+
+    def _thread_mem_cpu_stream(self):
+        """
+        流式采集：一个SP_daemon进程同时输出CPU和内存数据
+        :return:
+        """
+        self.stream = SpDaemonStream(self.device, self.package_name, items=("c", "r"), count=self.sample_count)
+        try:
+            for fields in self.stream:
+                if not self.thread_flag:
+                    break
+                self._handle_fields(fields)
+        finally:
+            self.stream.stop()
+
+    def _thread_mem_cpu_async(self):
+        """
+        asyncio采集：CPU和内存的shell调用并发执行，互不拉长对方的采样周期
+        :return:
+        """
+        interval = self.scheduler.interval
+        self.collector = AsyncCollector([
+            MetricSource('cpu', interval, lambda: self.cpu_monitor.get_sp_daemon_cpu(self.package_name)),
+            MetricSource('memory', interval, lambda: self.mem_monitor.get_sp_daemon_memory(self.package_name)),
+        ])
+        if not self.thread_flag:
+            return
+        try:
+            asyncio.run(self.collector.run(self._handle_async_sample))
+        finally:
+            self.collector.close()
+
+    def _thread_mem_cpu_agent(self):
+        """
+        设备端agent采集：设备上按间隔采样写入环形段文件，主机批量拉取后逐条处理
+        :return:
+        """
+        self.agent = DeviceAgent(self.device, self.package_name, interval=self.scheduler.interval,
+                                 sp_daemon_items=("c", "r"))
+        if not self.thread_flag:
+            return
+        self.agent.run(self._handle_agent_samples, pull_interval=self.agent_pull_interval)
+
+    def _handle_agent_samples(self, samples: List[AgentSample]):
+        """
+        处理agent拉取的一批样本；SP_daemon没有给出进程CPU时使用agent按节拍差计算的值，时间戳取agent修正后的时间
+        :param samples:
+        :return:
+        """
+        for sample in samples:
+            self._handle_fields({'ProcCpuUsage': str(sample.cpu_usage), **sample.sp_fields,
+                                 'timestamp': str(sample.timestamp)})
+
+    def _handle_async_sample(self, sample: Sample):
+        """
+        处理asyncio采集引擎产出的一条采样
+        :param sample:
+        :return:
+        """
+        if sample.source == 'cpu':
+            self.write_cpu_info(sample.data, self.package_name)
+            self._record(cpu_info=sample.data)
+        elif sample.source == 'memory':
+            self.write_mem_info(sample.data, self.package_name)
+            self._record(mem_info=sample.data)
+        logger.debug(f"{sample.source}: {sample.data}")
+
+    def _handle_fields(self, fields: Mapping[str, str]) -> np.ndarray:
+        """
+        处理一次SP_daemon采样：原始键值对写入缓冲区，CPU/内存日志和运行记录由最新一行按列切片生成
+        :param fields: 一个采样块的 key -> value 字符串
+        :return: 缓冲区最新一行（含行尾的NaN），缺失值为NaN
+        """
+        if self.buffer is None:
+            self.buffer = SampleBuffer(sample_columns(fields), capacity=self.sample_count)
+        self.buffer.append_fields(fields)
+        layout = self._layout
+        if layout is None or layout.buffer is not self.buffer:
+            layout = self._layout = _BufferLayout(self.buffer)
+        row = layout.latest()
+        timestamp = int(np.nan_to_num(row[layout.timestamp]))
+        usage = np.nan_to_num(row[layout.usage]).tolist()
+        memory = np.round(np.nan_to_num(row[layout.memory]), 2).tolist()
+        self._write_row(self.log_cpu_dir, 'cpu_cpus_{}_log'.format(self.package_name), layout.cpu_names,
+                        [timestamp, *usage])
+        self._write_row(self.log_mem_dir, 'mem_{}_log'.format(self.package_name), layout.mem_names,
+                        [*memory, timestamp])
+        if self.recorder is not None:
+            frequency = np.round(np.nan_to_num(row[layout.frequency]), 2).tolist()
+            self.recorder.record(cpu_usage=dict(zip(layout.cores, usage)) or None,
+                                 cpu_freq=dict(zip(layout.cores, frequency)) or None,
+                                 mem=dict(zip(MEMORY_FIELDS, memory)), timestamp=timestamp or None)
+        self._poll_processes(timestamp)
+        logger.debug(f"CPU使用率: {usage}")
+        logger.debug(f"内存使用情况: {memory}")
+        return row
+
+    def _on_process_event(self, event: ProcessEvent):
+        self._process_events.append(event)
+
+    def _poll_processes(self, timestamp: int):
+        """
+        每次采样轮询一次进程缓存（通常只校验进程启动时间），进程启动/重启/退出事件作为该采样的标注
+        写入 process_events_<包名>.txt；开启app_totals时按缓存的全部pid汇总应用内存
+        :param timestamp: 当前采样的时间戳
+        :return:
+        """
+        app = self.resolver.resolve(self.package_name)
+        events, self._process_events = self._process_events, []
+        for event in events:
+            if event.kind != 'start':
+                logger.warning(f"应用进程{event.kind}: {event.old_pid} -> {event.new_pid}")
+            self.writer.write(
+                os.path.join(os.path.dirname(os.path.abspath(self.log_mem_dir)),
+                             'process_events_{}.txt'.format(self.package_name)),
+                format_header(('timestamp', 'event_time', 'kind', 'old_pid', 'new_pid')),
+                format_line((timestamp, event.timestamp, event.kind, event.old_pid or '', event.new_pid or '')))
+        if self.app_totals and app.pids:
+            totals = ProcessResolver.aggregate(self.mem_monitor.get_hidumper_memory_batch(app.pids))
+            # hidumper的单位为KB，与内存日志一致换算为MB
+            self._write_row(self.log_mem_dir, 'mem_app_{}_log'.format(self.package_name),
+                            ('timestamp', 'processes', *HIDUMPER_MEM_ROWS, 'Total'),
+                            [timestamp, len(app.pids),
+                             *(round(totals.get(name, 0) / 1024, 2) for name in (*HIDUMPER_MEM_ROWS, 'Total'))])
+            cpu_totals = ProcessResolver.aggregate({
+                pid: {name: _percent(usage.get(name)) for name in HIDUMPER_CPU_COLUMNS}
+                for pid, usage in self.cpu_monitor.get_cpu_usage_batch(app.pids).items()
+            })
+            self._write_row(self.log_cpu_dir, 'cpu_app_{}_log'.format(self.package_name),
+                            ('timestamp', 'processes', *HIDUMPER_CPU_COLUMNS),
+                            [timestamp, len(app.pids), *(round(cpu_totals.get(name, 0), 2)
+                                                         for name in HIDUMPER_CPU_COLUMNS)])
+
+    def _record(self, cpu_info: dict = None, mem_info: dict = None):
+        """
+        采样写入运行记录
+        :param cpu_info:
+        :param mem_info:
+        :return:
+        """
+        if self.recorder is None:
+            return
+        cpus = (cpu_info or {}).get('cpus', {})
+        self.recorder.record(
+            cpu_usage={core_name: cpu_data['usage'] for core_name, cpu_data in cpus.items()} or None,
+            cpu_freq={core_name: cpu_data['frequency'] for core_name, cpu_data in cpus.items()} or None,
+            mem={key: value for key, value in (mem_info or {}).items() if key != 'timestamp'} or None,
+            timestamp=(cpu_info or {}).get('timestamp') or (mem_info or {}).get('timestamp') or None,
+        )
 
     def start_mem_cpu_thread(self):
         """
         启动线程，用于监控内存和CPU使用率
         :return:
         """
-        thread = threading.Thread(target=self._thread_mem_cpu)
-        thread.start()
+        self.thread = threading.Thread(target=self._thread_mem_cpu)
+        self.thread.start()
 
     def stop_mem_cpu_thread(self):
         """
@@ -58,10 +351,26 @@ class ThreadMemCPU:
         :return:
         """
         self.thread_flag = False
+        self.scheduler.stop()
+        if self.collector is not None:
+            self.collector.stop()
+        if self.agent is not None:
+            self.agent.stop()
+        if self.stream is not None:
+            self.stream.stop()
+        if self.thread is not None:
+            self.thread.join(timeout=30)
+        self.writer.close()
+        if self.capture is not None:
+            self.capture.close()
+        if self.recorder is not None:
+            self.recorder.finish()
 
         chart_configs = [
             {'log_dir': self.log_mem_dir, 'chart_type': 'mem', 'title': '内存', 'decs': '内存使用率', 'unit': 'MB'},
-            {'log_dir': self.log_cpu_dir, 'chart_type': 'cpu', 'title': 'CPU', 'decs': 'CPU使用率', 'unit': '%'}
+            {'log_dir': self.log_cpu_dir, 'chart_type': 'cpu', 'title': 'CPU', 'decs': 'CPU使用率', 'unit': '%'},
+            {'log_dir': self.log_sched_dir, 'chart_type': 'sched', 'title': '采样调度', 'decs': '调度抖动与采集耗时',
+             'unit': 'ms'}
         ]
 
         for cfg in chart_configs:
@@ -74,50 +383,54 @@ class ThreadMemCPU:
         :param package_name:
         :return:
         """
-        file_path = os.path.join(self.log_mem_dir, 'mem_{}_log.txt'.format(package_name))
-
-        begin_line = ''
-        mem_line = ''
-        for mem_name, mem_data in mem_detail.items():
-            begin_line = begin_line + mem_name.replace(' ', '') + ','
-            mem_line = mem_line + str(mem_data) + ','
+        self._write_log(self.log_mem_dir, 'mem_{}_log'.format(package_name), mem_detail)
 
-        if not os.path.exists(file_path):
-            mem_log = open(file_path, 'a+')
-            mem_log.write(begin_line + '\n')
-            mem_log.write(mem_line + '\n')
-            # self.mem_log_all_path.append([file_name, os.path.abspath(file_path)])
-        else:
-            mem_log = open(file_path, 'a+')
-            mem_log.write(mem_line + '\n')
-        mem_log.close()
+    def write_sched_info(self, sched_detail: dict, package_name: str):
+        """
+        写入采样调度信息：调度抖动、采集耗时、错过的采样点数
+        :param sched_detail:
+        :param package_name:
+        :return:
+        """
+        self._write_log(self.log_sched_dir, 'sched_{}_log'.format(package_name), sched_detail)
 
     def write_cpu_info(self, cpu_detail: dict, package_name: str):
         """
-        写入CPU使用情况
+        写入CPU使用情况，每个核心一列
         :param cpu_detail:
         :param package_name:
         :return:
         """
-        begin_line = 'timestamp,'
-        cpu_line = ''
-        for cpu_name, detail_info in cpu_detail.items():
-            file_path = os.path.join(self.log_cpu_dir, 'cpu_{}_{}_log.txt'.format(cpu_name, package_name))
-            if cpu_name == 'timestamp':
-                cpu_line = str(detail_info) + ','
-            if cpu_name == 'cpus':
-                for core_name, cpu_data in detail_info.items():
-                    # total = sum([float(i) for i in cpu_data.values()])
-                    begin_line = begin_line + core_name.replace(' ', '') + ','
-                    cpu_line = cpu_line + str(cpu_data['usage']) + ','
-                if not os.path.exists(file_path):
-                    cpu_log = open(file_path, 'a+')
-                    cpu_log.write(begin_line + '\n')
-                    cpu_log.write(cpu_line + '\n')
-                else:
-                    cpu_log = open(file_path, 'a+')
-                    cpu_log.write(cpu_line + '\n')
-                cpu_log.close()
+        usage = {'timestamp': cpu_detail.get('timestamp', 0)}
+        for core_name, cpu_data in cpu_detail.get('cpus', {}).items():
+            usage[core_name] = cpu_data['usage']
+        self._write_log(self.log_cpu_dir, 'cpu_cpus_{}_log'.format(package_name), usage)
+
+    def _write_log(self, log_dir: str, name: str, detail: dict):
+        """
+        按日志格式写入一行
+        :param log_dir:
+        :param name: 不含扩展名的文件名
+        :param detail:
+        :return:
+        """
+        self._write_row(log_dir, name, tuple(detail), list(detail.values()))
+
+    def _write_row(self, log_dir: str, name: str, names: Tuple[str, ...], values: Sequence[Any]):
+        """
+        按日志格式写入一行
+        :param log_dir:
+        :param name: 不含扩展名的文件名
+        :param names: 列名
+        :param values: 按列名顺序的数值
+        :return:
+        """
+        columns, header = _log_columns(names)
+        if self.log_format == 'binary':
+            self.writer.write_record(os.path.join(log_dir, name + '.bin'), columns, values,
+                                     meta={'package_name': self.package_name})
+        else:
+            self.writer.write(os.path.join(log_dir, name + '.txt'), header, format_line(values))
 
     def generate_charts(self, log_dir: str, chart_type: str, title: str, decs: str, **kwargs):
         """
@@ -128,10 +441,10 @@ class ThreadMemCPU:
         :param decs: 图表描述
         :param kwargs: 其他参数
         """
-        file_list = [f for f in os.listdir(log_dir) if f.endswith('.txt')]
+        file_list = [f for f in os.listdir(log_dir) if f.endswith(('.txt', '.bin'))]
         for file_name in file_list:
             data_file_path = os.path.join(log_dir, file_name)
-            output_title = file_name.replace('.txt', '')
+            output_title = os.path.splitext(file_name)[0]
             config = {
                 'data_file': data_file_path,
                 'title': title,
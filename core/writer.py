@@ -0,0 +1,357 @@
+# !/usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+@Version  : Python 3.12
+@Time     : 2025/7/13 11:48
+@Author   : wieszheng
+@Software : PyCharm
+"""
+import csv
+import os
+import queue
+import re
+import threading
+import time
+from typing import Dict, IO, Any, Iterable, List, Mapping, Optional, Sequence, Tuple, Union
+
+from loguru import logger
+
+from core.runlog import RunLogWriter
+
+
+class LogWriter:
+    """
+    采集与写盘解耦的日志写入器
+    采集线程把行放入有界队列后立即返回，独立的写入线程批量取出、保持文件句柄常开，
+    按行数或时间阈值flush；写入跟不上导致队列满时丢弃新样本并计数。
+    同时支持逗号分隔的文本日志（write）和二进制列式运行日志（write_record）。
+    """
+
+    _STOP = object()
+
+    def __init__(self, max_queue: int = 10000, batch_size: int = 200, flush_interval: float = 1.0):
+        """
+        :param max_queue: 队列容量
+        :param batch_size: 累计多少行flush一次
+        :param flush_interval: 距上次flush超过多少秒flush一次
+        """
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue: "queue.Queue[Any]" = queue.Queue(maxsize=max_queue)
+        self.dropped = 0
+        self.written = 0
+        self.max_depth = 0
+        self._files: Dict[str, IO[str]] = {}
+        self._runlogs: Dict[str, RunLogWriter] = {}
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='log-writer', daemon=True)
+            self._thread.start()
+
+    def write(self, path: str, header: str, line: str) -> bool:
+        """
+        写入一行，文件为空时先写表头；不阻塞采集线程
+        :param path:
+        :param header:
+        :param line:
+        :return: 队列已满被丢弃时返回False
+        """
+        return self._put((path, header, line))
+
+    def write_record(self, path: str, columns: Sequence[Tuple[str, str]],
+                     values: Union[Mapping[str, Any], Sequence[Any]], meta: Optional[Dict[str, Any]] = None) -> bool:
+        """
+        写入一条二进制运行日志记录，文件不存在时按columns创建
+        :param path:
+        :param columns: [(列名, 'f8'|'i8')]
+        :param values: 列名 -> 数值，或按columns顺序的一行数值
+        :param meta: 新建文件时写入表头的元信息
+        :return: 队列已满被丢弃时返回False
+        """
+        return self._put((path, _RecordSpec(tuple(columns), meta), values))
+
+    def _put(self, entry: Tuple[str, Any, Any]) -> bool:
+        self.start()
+        try:
+            self.queue.put_nowait(entry)
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped == 1 or self.dropped % 100 == 0:
+                logger.warning(f"写入队列已满，已丢弃{self.dropped}条样本")
+            return False
+        self.max_depth = max(self.max_depth, self.queue.qsize())
+        return True
+
+    def close(self):
+        """
+        写完队列中剩余的行并关闭所有文件
+        :return:
+        """
+        if self._thread is not None:
+            self.queue.put(self._STOP)
+            self._thread.join()
+            self._thread = None
+        logger.info(f"日志写入统计: {self.stats()}")
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'queue_depth': self.queue.qsize(),
+            'max_depth': self.max_depth,
+            'written': self.written,
+            'dropped': self.dropped,
+        }
+
+    def _runlog(self, path: str, spec: "_RecordSpec") -> RunLogWriter:
+        writer = self._runlogs.get(path)
+        if writer is None:
+            writer = self._runlogs[path] = RunLogWriter(path, spec.columns, spec.meta)
+        return writer
+
+    def _file(self, path: str, header: str) -> IO[str]:
+        f = self._files.get(path)
+        if f is None:
+            truncate_partial_line(path)
+            f = open(path, 'a+', encoding='utf-8')
+            if f.tell() == 0:
+                f.write(header + '\n')
+            self._files[path] = f
+        return f
+
+    def _run(self):
+        pending = 0
+        last_flush = time.monotonic()
+        stopping = False
+        while not stopping:
+            timeout = max(0.0, self.flush_interval - (time.monotonic() - last_flush))
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+            # 一次取出队列中已有的全部行
+            batch = [] if item is None else [item]
+            while True:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            for entry in batch:
+                if entry is self._STOP:
+                    stopping = True
+                    continue
+                path, header, line = entry
+                try:
+                    if isinstance(header, _RecordSpec):
+                        runlog = self._runlog(path, header)
+                        if isinstance(line, Mapping):
+                            runlog.append(line)
+                        else:
+                            runlog.append_row(line)
+                    else:
+                        self._file(path, header).write(line + '\n')
+                    pending += 1
+                    self.written += 1
+                except (OSError, ValueError) as e:
+                    logger.error(f"写入{path}失败: {e}")
+            if pending and (stopping or pending >= self.batch_size
+                            or time.monotonic() - last_flush >= self.flush_interval):
+                self._flush()
+                pending = 0
+            if not pending:
+                last_flush = time.monotonic()
+        self._close_files()
+
+    def _flush(self):
+        for f in self._files.values():
+            f.flush()
+        for writer in self._runlogs.values():
+            writer.flush()
+
+    def _close_files(self):
+        for f in self._files.values():
+            f.close()
+        self._files.clear()
+        for writer in self._runlogs.values():
+            writer.close()
+        self._runlogs.clear()
+
+
+class _RecordSpec:
+    """
+    二进制运行日志的列定义和元信息，随记录一起放入队列
+    """
+    __slots__ = ('columns', 'meta')
+
+    def __init__(self, columns: Tuple[Tuple[str, str], ...], meta: Optional[Dict[str, Any]]):
+        self.columns = columns
+        self.meta = meta
+
+
+class CsvBatchWriter:
+    """
+    常开文件的CSV批量写入器
+    列顺序在第一条样本时确定，之后按固定顺序输出，缺失的列留空；样本中出现新列（如新增核心、指标）时
+    不改写已有内容，而是开启新的分段文件 name.1.csv、name.2.csv…，新分段的列为原有列加新列，
+    读取时用 csv_segments 按顺序拼接。行先缓存在内存中，按行数或时间阈值写盘。
+    """
+
+    def __init__(self, path: str, flush_rows: int = 100, flush_interval: float = 1.0):
+        """
+        :param path:
+        :param flush_rows: 缓存多少行写盘一次
+        :param flush_interval: 距上次写盘超过多少秒写盘一次
+        """
+        self.path = path
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.columns: List[str] = []
+        self.written = 0
+        self._rows: List[List[Any]] = []
+        self._file: Optional[IO[str]] = None
+        self._writer: Any = None
+        self._segment = 0
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        self._resume()
+
+    def _resume(self):
+        """
+        文件已存在时续写最后一个分段，沿用其表头
+        """
+        segments = csv_segments(self.path)
+        if not segments:
+            return
+        last = segments[-1]
+        with open(last, encoding='utf-8', newline='') as f:
+            header = next(csv.reader(f), None)
+        if header:
+            self._segment = len(segments) - 1
+            self._open(last, header, write_header=False)
+
+    def _open(self, path: str, columns: List[str], write_header: bool = True):
+        self._file = open(path, 'a', encoding='utf-8', newline='')
+        self._writer = csv.writer(self._file)
+        self.columns = columns
+        if write_header:
+            self._writer.writerow(columns)
+
+    def _segment_path(self, index: int) -> str:
+        if index == 0:
+            return self.path
+        base, ext = os.path.splitext(self.path)
+        return f"{base}.{index}{ext}"
+
+    def write(self, data: Mapping[str, Any]):
+        """
+        写入一条样本
+        :param data: 列名 -> 取值，None记为空
+        :return:
+        """
+        with self._lock:
+            if self._file is None and not self.columns:
+                self._open(self.path, list(data))
+            elif self._file is None:
+                raise ValueError(f"CSV写入器已关闭: {self.path}")
+            else:
+                new_columns = [key for key in data if key not in self.columns]
+                if new_columns:
+                    self._rotate(self.columns + new_columns)
+            self._rows.append(['' if (value := data.get(name)) is None else value for name in self.columns])
+            if len(self._rows) >= self.flush_rows or time.monotonic() - self._last_flush >= self.flush_interval:
+                self._flush()
+
+    def _rotate(self, columns: List[str]):
+        self._flush()
+        self._file.close()
+        self._segment += 1
+        path = self._segment_path(self._segment)
+        logger.info(f"CSV列发生变化，新分段: {path}")
+        self._open(path, columns)
+
+    def _flush(self):
+        if self._rows:
+            self._writer.writerows(self._rows)
+            self.written += len(self._rows)
+            self._rows.clear()
+        if self._file is not None:
+            self._file.flush()
+        self._last_flush = time.monotonic()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._flush()
+                self._file.close()
+                self._file = None
+
+    def __enter__(self) -> "CsvBatchWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def csv_segments(path: str) -> List[str]:
+    """
+    CsvBatchWriter写出的全部分段文件，按写入顺序排列
+    :param path: 第一个分段的路径
+    :return:
+    """
+    if not os.path.isfile(path):
+        return []
+    base, ext = os.path.splitext(path)
+    directory = os.path.dirname(path) or '.'
+    pattern = re.compile(re.escape(os.path.basename(base)) + r'\.(\d+)' + re.escape(ext) + '$')
+    indexed = []
+    for name in os.listdir(directory):
+        match = pattern.match(name)
+        if match:
+            indexed.append((int(match.group(1)), os.path.join(os.path.dirname(path), name)))
+    return [path] + [name for _, name in sorted(indexed)]
+
+
+def truncate_partial_line(path: str, block_size: int = 4096):
+    """
+    截掉文本日志末尾没写完的一行（进程异常退出时留下），之后追加的行不会与其拼接
+    :param path:
+    :param block_size: 每次向前查找换行符的字节数
+    :return:
+    """
+    if not os.path.isfile(path):
+        return
+    with open(path, 'rb+') as f:
+        size = f.seek(0, os.SEEK_END)
+        end = size
+        while end > 0:
+            start = max(0, end - block_size)
+            f.seek(start)
+            newline = f.read(end - start).rfind(b'\n')
+            if newline >= 0:
+                end = start + newline + 1
+                break
+            end = start
+        if end != size:
+            f.truncate(end)
+            logger.warning(f"日志末尾不完整的行已截掉: {path}")
+
+
+def format_row(detail: Dict[str, Any]) -> Tuple[str, str]:
+    """
+    将一次采样的字典转换为表头行和数据行（与原有日志格式一致，以逗号结尾）
+    :param detail:
+    :return:
+    """
+    return format_header(detail), format_line(detail.values())
+
+
+def format_header(names: Iterable[str]) -> str:
+    return ''.join(name.replace(' ', '') + ',' for name in names)
+
+
+def format_line(values: Iterable[Any]) -> str:
+    return ''.join(str(value) + ',' for value in values)
@@ -0,0 +1,101 @@
+# !/usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+@Version  : Python 3.12
+@Time     : 2025/7/14 21:30
+@Author   : wieszheng
+@Software : PyCharm
+"""
+import argparse
+import random
+import re
+import time
+
+from core.cpu import CpuMonitor
+from core.sample_buffer import SampleBuffer, sample_columns
+from core.sp_parser import parse_fields
+
+CORE_METRICS = ["Frequency", "Usage", "idleUsage", "ioWaitUsage", "irqUsage", "niceUsage", "softIrqUsage",
+                "systemUsage", "userUsage"]
+
+
+def build_block(timestamp: int, cores: int) -> str:
+    """
+    生成一个与SP_daemon -c -r 输出格式一致的采样块
+    """
+    pairs = [
+        ("timestamp", str(timestamp)),
+        ("ProcAppName", "com.baidu.yiyan.ent"),
+        ("ProcCpuLoad", "NA"),
+        ("ProcCpuUsage", f"{random.uniform(0, 100):.6f}"),
+        ("TotalcpuUsage", f"{random.uniform(0, 100):.6f}"),
+        ("TotalcpuidleUsage", f"{random.uniform(0, 100):.6f}"),
+    ]
+    for core in range(cores):
+        for metric in CORE_METRICS:
+            value = str(random.choice([1992000, 2400000])) if metric == "Frequency" else f"{random.uniform(0, 100):.6f}"
+            pairs.append((f"cpu{core}{metric}", value))
+    pairs += [("pss", str(random.randint(100000, 900000))), ("swapPss", "NA")]
+    return "\n".join(f"order:{i} {key}={value}" for i, (key, value) in enumerate(pairs))
+
+
+def legacy_parse(out: str) -> dict:
+    """
+    原实现：整块re.search后逐行re.split，再逐键startswith/re.match
+    """
+    raw_data = re.search(r'(?s)order:.*', out).group(0)
+    fields = {}
+    for line in raw_data.split("\n"):
+        line = line.strip()
+        if not line or "=" not in line:
+            continue
+        parts = re.split(r"\s+", line, 1)
+        key, value = parts[1].split("=", 1)
+        fields[key] = value
+    result = {"timestamp": 0, "process": {}, "system": {}, "cpus": {}}
+    for key, value in fields.items():
+        value = None if value == "NA" else value
+        if key == "timestamp":
+            result["timestamp"] = value
+        elif key.startswith("Proc"):
+            result["process"][key] = value
+        elif key.startswith("Totalcpu"):
+            result["system"][key] = value
+        elif key.startswith("cpu") and any(char.isdigit() for char in key):
+            match = re.match(r"^(cpu\d+)(\w+)$", key)
+            result["cpus"].setdefault(match.group(1), {})[match.group(2)] = value
+    return result
+
+
+def bench(name: str, func, samples: int):
+    start = time.perf_counter()
+    func()
+    cost = time.perf_counter() - start
+    print(f"{name:<32}{cost:>9.3f}s{samples / cost:>14.0f} samples/s")
+    return cost
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SP_daemon解析性能对比")
+    parser.add_argument("--samples", type=int, default=10000)
+    parser.add_argument("--cores", type=int, default=16)
+    args = parser.parse_args()
+
+    random.seed(0)
+    blocks = [build_block(1501839064260 + i * 1000, args.cores) for i in range(args.samples)]
+    stream = "\n".join(blocks)
+    monitor = CpuMonitor(device=None, resolver=object())
+    print(f"{args.samples}个采样，{args.cores}核，每块{blocks[0].count('order:')}个键，共{len(stream) / 1e6:.1f}MB")
+
+    base = bench("legacy per-line regex", lambda: [legacy_parse(b) for b in blocks], args.samples)
+    cost = bench("parse_fields + dispatch", lambda: [monitor.parse_sp_daemon_fields(parse_fields(b)) for b in blocks],
+                 args.samples)
+    print(f"parse_fields + dispatch 相对原实现加速 {base / cost:.1f}x")
+    # 采集线程实际使用的路径：原始键值对直接写入列式缓冲区
+    buffer = SampleBuffer(sample_columns(parse_fields(blocks[0])), capacity=args.samples)
+    cost = bench("parse_fields + SampleBuffer", lambda: [buffer.append_fields(parse_fields(b)) for b in blocks],
+                 args.samples)
+    print(f"parse_fields + SampleBuffer 相对原实现加速 {base / cost:.1f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+# !/usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+@Version  : Python 3.12
+@Time     : 2025/7/18 22:40
+@Author   : wieszheng
+@Software : PyCharm
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from core.device_pool import DevicePool
+from core.fake_driver import FakeHDC, LatencyModel
+from core.runlog import open_runlog
+
+
+def count_lines(run_dir: str) -> int:
+    total = 0
+    for root, _, files in os.walk(run_dir):
+        for name in files:
+            if 'sched' in root:
+                continue
+            if name.endswith('.bin'):
+                total += len(open_runlog(os.path.join(root, name)))
+            elif name.endswith('.txt'):
+                with open(os.path.join(root, name), encoding='utf-8') as f:
+                    total += max(0, sum(1 for _ in f) - 1)
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="模拟设备压测采集链路")
+    parser.add_argument("--devices", type=int, default=20)
+    parser.add_argument("--cores", type=int, default=12)
+    parser.add_argument("--interval", type=float, default=0.01, help="单台设备的采样间隔（秒）")
+    parser.add_argument("--latency-ms", type=float, default=3.0, help="shell调用耗时中位数（毫秒）")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--backend", default='shell', choices=['shell', 'stream', 'async'])
+    args = parser.parse_args()
+
+    run_dir = tempfile.mkdtemp(prefix='stress_')
+
+    def hdc_factory(serial: str) -> FakeHDC:
+        latency = LatencyModel('lognormal', mean=args.latency_ms / 1000, spread=0.5)
+        return FakeHDC(serial, core_count=args.cores, latency=latency, stream_interval=args.interval)
+
+    pool = DevicePool([f'fake-{i}' for i in range(args.devices)], run_dir=run_dir, hdc_factory=hdc_factory,
+                      backend=args.backend, interval=args.interval, sample_count=int(args.duration / args.interval))
+    start = time.perf_counter()
+    results = pool.run(duration=args.duration)
+    cost = time.perf_counter() - start
+    rows = count_lines(run_dir)
+    ok = sum(1 for result in results.values() if result.ok)
+    print(f"{ok}/{len(results)}台设备成功，{rows}行日志，{rows / args.duration:.0f}行/秒，总耗时{cost:.1f}s，目录: {run_dir}")
+
+
+if __name__ == '__main__':
+    main()
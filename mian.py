@@ -10,24 +10,42 @@ import os
 from typing import List
 
 from config.conf import ROOT_PATH
+from core.adaptive import ActivitySignal, AdaptiveRatePolicy
 from core.hdc import HDC
+from core.persistence.db import SQLPersister
+from core.persistence.journal import RunRecorder, recover_runs
 from core.thread_mem_cpu import ThreadMemCPU
 from scripts.wxy_dialogue import Dialogue
 from utils import time_format
 
 
+PACKAGE_NAME = 'com.baidu.yiyan.ent'
+SCENARIO_NAME = '文小言对话'
+
+
 class wxy_main:
-    def __init__(self):
-        self.hdc = HDC()
+    def __init__(self, serial: str = None, capture: bool = False, backend: str = 'shell'):
+        self.hdc = HDC(serial)
+        self.persister = SQLPersister()
+        # 上次异常退出留下的测试先从运行日志补齐并结束
+        recover_runs(self.persister)
+        self.recorder = RunRecorder(self.persister, 1, PACKAGE_NAME, SCENARIO_NAME)
 
-        self.wxy_dialog = Dialogue(self.hdc, "文小言对话")
+        self.wxy_dialog = Dialogue(self.hdc, SCENARIO_NAME)
+        self.activity = ActivitySignal()
+        self.wxy_dialog.set_activity(self.activity)
 
         self.hdc.driver.unlock()
 
         self.begin_str_time = time_format.get_str_detail_time_logfile()
-        self.log_dir, self.log_mem_dir, self.log_cpu_dir, self.log_view_dir = self.create_log_dir(
-            ['mem', 'cpu', 'view'])
-        self.thread_mem_cpu = ThreadMemCPU(self.hdc, self.log_mem_dir, self.log_cpu_dir, self.log_view_dir)
+        self.log_dir, self.log_mem_dir, self.log_cpu_dir, self.log_view_dir, self.log_sched_dir = self.create_log_dir(
+            ['mem', 'cpu', 'view', 'sched'])
+        self.thread_mem_cpu = ThreadMemCPU(self.hdc, self.log_mem_dir, self.log_cpu_dir, self.log_view_dir,
+                                           package_name=PACKAGE_NAME, backend=backend, log_sched_dir=self.log_sched_dir,
+                                           adaptive=AdaptiveRatePolicy(activity=self.activity),
+                                           capture_path=os.path.join(self.log_dir, 'capture.jsonl.gz')
+                                           if capture else None,
+                                           recorder=self.recorder)
 
     def create_log_dir(self, log_name_list: list) -> List:
         log_dir = os.path.join(ROOT_PATH, "log", self.begin_str_time)
@@ -42,10 +60,13 @@ class wxy_main:
         return all_log_path_list
 
     def start_run(self):
+        self.recorder.start()
         self.thread_mem_cpu.start_mem_cpu_thread()
 
     def stop_run(self):
+        # 停止采集时结束测试并删除运行日志
         self.thread_mem_cpu.stop_mem_cpu_thread()
+        self.persister.close()
 
     def run(self):
         self.start_run()
@@ -77,6 +77,8 @@ class Dialogue(Executor):
             self.device.xpath('//root[1]/Column[1]/__Common__[1]/SideBarContainer[1]/Stack[1]/Column[1]/__Common__[1]'
                               '/Tabs[1]/Swiper[1]/TabContent[1]/Column[1]/__Common__[2]/Column[1]/__Common__[1]/Column[1]'
                               '/Stack[1]/Column[1]/Flex[1]/Row[2]/Row[1]/Stack[1]').click()
+            # 回答流式输出期间为活跃阶段
+            self._mark_active(True)
             while True:
                 time.sleep(1)
                 if not self.hdc.find_image(os.path.join(ROOT_PATH, 'config', 'pic', 'ans.jpeg')):
@@ -87,6 +89,7 @@ class Dialogue(Executor):
                 if result:
                     x, y = result
                     self.device.double_click(x, y)
+            self._mark_active(False)
 
     def set_down(self) -> None:
         pass
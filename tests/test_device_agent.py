@@ -0,0 +1,60 @@
+# !/usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+@Version  : Python 3.12
+@Time     : 2025/7/24 20:40
+@Author   : wieszheng
+@Software : PyCharm
+"""
+import os
+import subprocess
+
+from core.device_agent import DeviceAgent, LocalShell, PULL_SCRIPT, parse_agent_output
+
+
+class HdcQuotedShell(LocalShell):
+    """
+    按 hmdriver2 HdcWrapper.shell 的方式执行命令：包上双引号后交给主机shell，
+    主机先展开其中的 $ 再把结果交给设备端 sh -c
+    """
+
+    def shell(self, cmd: str):
+        if cmd[0] != '"':
+            cmd = '"' + cmd
+        if cmd[-1] != '"':
+            cmd += '"'
+        process = subprocess.run(f"sh -c {cmd}", shell=True, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        return self._Result(process.stdout.decode('utf-8', errors='replace'))
+
+
+def _write_block(path: str, seq: int):
+    with open(path, 'a') as f:
+        f.write(f"#sample {seq} {1700000000 + seq} {100 + seq}.00 1234\n"
+                f"cpu  {seq * 100} 0 0 0\n"
+                f"#end {seq}\n")
+
+
+def test_pull_through_hdc_quoting(tmp_path):
+    remote_dir = str(tmp_path / 'agent')
+    agent = DeviceAgent(HdcQuotedShell(), 'com.example.app', remote_dir=remote_dir)
+    agent.device.shell(f"rm -rf {remote_dir}; mkdir -p {remote_dir}")
+    agent._push_script(PULL_SCRIPT, 'pull.sh')
+    _write_block(os.path.join(remote_dir, 'seg.00000000'), 1)
+    _write_block(os.path.join(remote_dir, 'seg.00000001'), 2)
+    _write_block(os.path.join(remote_dir, 'cur'), 3)
+
+    assert [sample.seq for sample in agent.pull()] == [1, 2]
+    assert sorted(os.listdir(remote_dir)) == ['cur', 'pull.sh']
+    assert [sample.seq for sample in agent.pull(include_current=True)] == [3]
+    assert os.listdir(remote_dir) == ['pull.sh']
+
+
+def test_parse_agent_output_keeps_sp_daemon_blocks():
+    out = ("#sample 1 1700000001 101.00 1234\n"
+           "order:0 timestamp=1\norder:1 ProcCpuUsage=1.5\norder:0 timestamp=2\norder:1 ProcCpuUsage=2.5\n"
+           "#end 1\n"
+           "#sample 2 1700000002 102.00 1234\n"
+           "order:0 timestamp=3\norder:1 ProcCpuUsage=3.5\n"
+           "#end 2\n")
+    samples = parse_agent_output(out)
+    assert [sample.sp_fields['ProcCpuUsage'] for sample in samples] == ['2.5', '3.5']
@@ -1,122 +1,86 @@
-import sqlite3
-from typing import List, Dict, Any, Optional
-
-DB_PATH = 'history.db'
-
-class HistoryDB:
-    def __init__(self, db_path: str = DB_PATH):
-        self.db_path = db_path
-        self._init_db()
-
-    def _init_db(self):
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
-        c.execute('''
-        CREATE TABLE IF NOT EXISTS version (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            version TEXT,
-            date TEXT,
-            score INTEGER
-        )''')
-        c.execute('''
-        CREATE TABLE IF NOT EXISTS metric (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            version_id INTEGER,
-            title TEXT,
-            value REAL,
-            unit TEXT,
-            FOREIGN KEY(version_id) REFERENCES version(id)
-        )''')
-        conn.commit()
-        conn.close()
-
-    def insert_version(self, version: str, date: str, score: int, metrics: List[Dict[str, Any]]):
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
-        c.execute("INSERT INTO version (version, date, score) VALUES (?, ?, ?)", (version, date, score))
-        version_id = c.lastrowid
-        for metric in metrics:
-            c.execute(
-                "INSERT INTO metric (version_id, title, value, unit) VALUES (?, ?, ?, ?)",
-                (version_id, metric['title'], metric['value'], metric['unit'])
-            )
-        conn.commit()
-        conn.close()
-
-    def get_history(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
-        sql = "SELECT id, version, date, score FROM version ORDER BY date DESC"
-        if limit:
-            sql += f" LIMIT {limit}"
-        c.execute(sql)
-        versions = c.fetchall()
-        history = []
-        for v in versions:
-            version_id, version, date, score = v
-            c.execute("SELECT title, value, unit FROM metric WHERE version_id=? ORDER BY id", (version_id,))
-            metrics = [
-                {"title": row[0], "value": row[1], "unit": row[2]} for row in c.fetchall()
-            ]
-            history.append({
-                "version": version,
-                "date": date,
-                "score": score,
-                "metrics": metrics
-            })
-        conn.close()
-        return history
+# !/usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+@Version  : Python 3.12
+@Time     : 2025/7/20 20:18
+@Author   : wieszheng
+@Software : PyCharm
+"""
+import os
+import threading
+from typing import List, Dict, Any, Optional, Sequence, Tuple
 
-    def clear(self):
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
-        c.execute("DELETE FROM metric")
-        c.execute("DELETE FROM version")
-        conn.commit()
-        conn.close()
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, select, func
+from sqlalchemy.orm import declarative_base, relationship
 
-# 使用示例：
-db = HistoryDB()
-db.insert_version('v2.1.3', '2025-07-01', 85, [
-    {"title": "应用启动", "value": 1.2, "unit": "s"},
-    {"title": "内存使用", "value": 156, "unit": "MB"},
-])
-history = db.get_history()
-print(history)
-
-
-from sqlalchemy import create_engine, Column, Integer, String, Float, ForeignKey
-from sqlalchemy.orm import declarative_base, sessionmaker, relationship
-from typing import List, Dict, Any, Optional
-import os
+from core.persistence.registry import get_engine, get_sessionmaker
 
 DB_PATH = 'history.db'
 Base = declarative_base()
 
+
 class Version(Base):
     __tablename__ = 'version'
     id = Column(Integer, primary_key=True, autoincrement=True)
     version = Column(String)
-    date = Column(String)
+    date = Column(String, index=True)
     score = Column(Integer)
     metrics = relationship('Metric', back_populates='version', cascade='all, delete-orphan')
 
+
 class Metric(Base):
     __tablename__ = 'metric'
     id = Column(Integer, primary_key=True, autoincrement=True)
-    version_id = Column(Integer, ForeignKey('version.id'))
+    version_id = Column(Integer, ForeignKey('version.id'), index=True)
     title = Column(String)
     value = Column(Float)
     unit = Column(String)
     version = relationship('Version', back_populates='metrics')
 
+
 class HistoryDB:
+    """
+    版本历史
+    查询一次联表取出版本及其指标；结果按数据库文件（含WAL文件）的修改时间和大小缓存，
+    文件未变化时直接返回缓存，返回值为共享对象，调用方不应修改。
+    """
+
     def __init__(self, db_path: str = DB_PATH):
         self.db_path = db_path
-        db_url = f'sqlite:///{self.db_path}'
-        self.engine = create_engine(db_url, echo=False, future=True)
-        Base.metadata.create_all(self.engine)
-        self.Session = sessionmaker(bind=self.engine, future=True)
+        self.engine = get_engine(self.db_path, Base.metadata)
+        self.Session = get_sessionmaker(self.db_path)
+        self._cache: Dict[Tuple[Any, ...], Any] = {}
+        self._cache_state: Optional[Tuple[Any, ...]] = None
+        self._lock = threading.Lock()
+
+    def _file_state(self) -> Tuple[Any, ...]:
+        state = []
+        for path in (self.db_path, self.db_path + '-wal'):
+            try:
+                stat = os.stat(path)
+                state.append((stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                state.append(None)
+        return tuple(state)
+
+    def _cached(self, key: Tuple[Any, ...], load):
+        state = self._file_state()
+        with self._lock:
+            if state != self._cache_state:
+                self._cache.clear()
+                self._cache_state = state
+            if key in self._cache:
+                return self._cache[key]
+        value = load()
+        with self._lock:
+            if self._cache_state == state:
+                self._cache[key] = value
+        return value
+
+    def invalidate(self):
+        with self._lock:
+            self._cache.clear()
+            self._cache_state = None
 
     def insert_version(self, version: str, date: str, score: int, metrics: List[Dict[str, Any]]):
         session = self.Session()
@@ -129,29 +93,63 @@ class HistoryDB:
             session.commit()
         finally:
             session.close()
+            self.invalidate()
+
+    def get_history(self, limit: Optional[int] = None, offset: int = 0,
+                    titles: Optional[Sequence[str]] = None) -> List[Dict[str, Any]]:
+        """
+        按日期倒序获取版本历史
+        :param limit: 每页版本数，为空时不限
+        :param offset: 跳过的版本数
+        :param titles: 只返回这些标题的指标，为空时返回全部指标
+        :return: [{'version', 'date', 'score', 'metrics': [{'title', 'value', 'unit'}]}]
+        """
+        key = ('history', limit, offset, tuple(titles) if titles is not None else None)
+        return self._cached(key, lambda: self._load_history(limit, offset, titles))
+
+    def _load_history(self, limit: Optional[int], offset: int,
+                      titles: Optional[Sequence[str]]) -> List[Dict[str, Any]]:
+        versions = select(Version.id, Version.version, Version.date, Version.score) \
+            .order_by(Version.date.desc(), Version.id.desc())
+        if limit:
+            versions = versions.limit(limit)
+        if offset:
+            versions = versions.offset(offset)
+        versions = versions.subquery()
+
+        join_on = Metric.version_id == versions.c.id
+        if titles is not None:
+            join_on &= Metric.title.in_(list(titles))
+        query = select(versions.c.id, versions.c.version, versions.c.date, versions.c.score,
+                       Metric.title, Metric.value, Metric.unit) \
+            .select_from(versions.outerjoin(Metric, join_on)) \
+            .order_by(versions.c.date.desc(), versions.c.id.desc(), Metric.id)
 
-    def get_history(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
-        session = self.Session()
-        try:
-            q = session.query(Version).order_by(Version.date.desc())
-            if limit:
-                q = q.limit(limit)
-            versions = q.all()
-            history = []
-            for v in versions:
-                metrics = [
-                    {"title": m.title, "value": m.value, "unit": m.unit}
-                    for m in v.metrics
-                ]
-                history.append({
-                    "version": v.version,
-                    "date": v.date,
-                    "score": v.score,
-                    "metrics": metrics
-                })
-            return history
-        finally:
-            session.close()
+        history = []
+        current_id = None
+        with self.engine.connect() as conn:
+            for version_id, version, date, score, title, value, unit in conn.execute(query):
+                if version_id != current_id:
+                    current_id = version_id
+                    history.append({
+                        "version": version,
+                        "date": date,
+                        "score": score,
+                        "metrics": []
+                    })
+                if title is not None:
+                    history[-1]["metrics"].append({"title": title, "value": value, "unit": unit})
+        return history
+
+    def count_versions(self) -> int:
+        """
+        版本总数，用于分页
+        """
+        return self._cached(('count',), self._load_count)
+
+    def _load_count(self) -> int:
+        with self.engine.connect() as conn:
+            return conn.execute(select(func.count(Version.id))).scalar()
 
     def clear(self):
         session = self.Session()
@@ -161,6 +159,8 @@ class HistoryDB:
             session.commit()
         finally:
             session.close()
+            self.invalidate()
+
 
 # 使用示例：
 if __name__ == '__main__':
@@ -170,4 +170,4 @@ if __name__ == '__main__':
         {"title": "内存使用", "value": 156, "unit": "MB"},
     ])
     history = db.get_history()
-    print(history)
\ No newline at end of file
+    print(history)
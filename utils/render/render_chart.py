@@ -10,11 +10,14 @@ import jinja2
 import json
 import os
 from datetime import datetime
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 
+import numpy as np
+import pandas as pd
 from loguru import logger
 
 from config.conf import ROOT_PATH
+from core.runlog import open_runlog
 
 
 class ChartRenderer:
@@ -28,13 +31,15 @@ class ChartRenderer:
         self.time_col = config.get('time_col', 'timestamp')
         self.time_format = config.get('time_format', '%H:%M:%S')
         self.output_file = config.get('output_file', 'chart.html')
-        self.template_file = config.get('template_file', '../template.html')
+        # 模板名相对于 config/template 目录（render_template 中的加载路径）
+        self.template_file = config.get('template_file', 'template.html')
         self.unit = config.get('unit', '%')
         self.title = config.get('title', '未知')
         self.decs = config.get('decs', '未知')
 
         self.headers: List[str] = []
-        self.data_rows: List[List[str]] = []
+        # 列名 -> 数值数组；二进制运行日志为内存映射，文本日志由pandas的C解析器读取
+        self.columns: Optional[Dict[str, np.ndarray]] = None
         self.x_labels: List[str] = []
         self.series: List[Dict[str, Any]] = []
         self.table_data: List[Dict[str, Any]] = []
@@ -74,22 +79,70 @@ class ChartRenderer:
             logger.warning(f"❌ 数据文件不存在: {self.data_file}")
             return False
 
-        with open(self.data_file, encoding='utf-8') as f:
-            lines = [line.strip() for line in f if line.strip()]
+        if self.data_file.endswith('.bin'):
+            return self.load_runlog()
 
-        if len(lines) < 2:
+        try:
+            frame = pd.read_csv(self.data_file, encoding='utf-8', skip_blank_lines=True)
+        except (ValueError, pd.errors.EmptyDataError) as e:
+            logger.warning(f"❌ 数据文件格式错误: {e}")
+            return False
+
+        # 行尾的逗号会产生无名空列，过滤掉
+        headers = [h for h in frame.columns if str(h).strip() and not str(h).startswith('Unnamed')]
+        if frame.empty or not headers:
             logger.warning(f"❌ 数据文件格式错误: 至少需要表头和数据行")
             return False
 
-        # 解析表头和数据和过滤空列
-        self.headers = lines[0].split(',')
-        self.data_rows = [line.split(',') for line in lines[1:]]
-        self.headers = [h for h in self.headers if h.strip()]
-        self.data_rows = [[cell for cell in row if cell.strip()] for row in self.data_rows]
+        self.headers = [str(h).strip() for h in headers]
+        self.columns = {
+            name: pd.to_numeric(frame[h], errors='coerce').to_numpy(dtype=np.float64)
+            for name, h in zip(self.headers, headers)
+        }
+        logger.success(f"✅ 成功加载数据: {len(self.headers)}列, {len(frame)}行")
+        return True
 
-        logger.success(f"✅ 成功加载数据: {len(self.headers)}列, {len(self.data_rows)}行")
+    def load_runlog(self) -> bool:
+        """
+        加载二进制运行日志，各列为内存映射的视图，不解析文本
+        :return:
+        """
+        try:
+            runlog = open_runlog(self.data_file)
+        except (OSError, ValueError) as e:
+            logger.warning(f"❌ 运行日志读取失败: {e}")
+            return False
+        if not len(runlog):
+            logger.warning(f"❌ 运行日志没有数据: {self.data_file}")
+            return False
+        self.headers = list(runlog.columns)
+        self.columns = {name: runlog.column(name) for name in runlog.columns}
+        logger.success(f"✅ 成功加载数据: {len(self.headers)}列, {len(runlog)}行")
         return True
 
+    @staticmethod
+    def column_values(column: np.ndarray) -> np.ndarray:
+        """
+        一列的数值，缺失或无法解析的记为0
+        """
+        return np.nan_to_num(np.asarray(column, dtype=np.float64), nan=0.0)
+
+    def format_times(self, column: np.ndarray) -> List[str]:
+        """
+        批量格式化时间戳：毫秒时间戳换算为秒后，只对不重复的秒格式化一次
+        :param column:
+        :return:
+        """
+        timestamps = np.asarray(column, dtype=np.float64)
+        valid = np.isfinite(timestamps)
+        seconds = np.where(timestamps > 1e10, timestamps // 1000, timestamps)
+        seconds = np.where(valid, seconds, 0).astype(np.int64)
+        unique, inverse = np.unique(seconds, return_inverse=True)
+        labels = np.array([self.parse_time(ts) for ts in unique.tolist()], dtype=object)
+        result = labels[inverse]
+        result[~valid] = ''
+        return result.tolist()
+
     def parse_time(self, ts: str) -> str:
         """
         解析时间戳为格式化时间
@@ -114,34 +167,27 @@ class ChartRenderer:
                 logger.warning(f"❌ 未找到时间列: {self.time_col}")
                 return False
 
-            time_idx = self.headers.index(self.time_col)
-            data_indices = [i for i in range(len(self.headers)) if i != time_idx]
-            data_headers = [self.headers[i] for i in data_indices]
+            data_headers = [h for h in self.headers if h != self.time_col]
 
             # 生成横坐标（时间）
-            self.x_labels = [self.parse_time(row[time_idx]) for row in self.data_rows]
+            self.x_labels = self.format_times(self.columns[self.time_col])
 
             # 生成系列数据
             self.series = []
             self.table_data = []
 
-            for i, col in zip(data_indices, data_headers):
-                values = []
+            for col in data_headers:
                 legend_name = self.legend_map.get(col, col)  # 优先用映射，否则用原名
-                for row in self.data_rows:
-                    try:
-                        v = float(row[i])
-                        values.append(v)
-                    except (ValueError, IndexError):
-                        values.append(0)
-
-                if not values:
+                column = self.column_values(self.columns[col])
+
+                if not len(column):
                     continue
 
                 # 计算统计值
-                avg = round(sum(values) / len(values), 1)
-                vmax = round(max(values), 1)
-                vmin = round(min(values), 1)
+                avg = round(float(column.mean()), 1)
+                vmax = round(float(column.max()), 1)
+                vmin = round(float(column.min()), 1)
+                values = column.tolist()
 
                 # 添加到系列
                 self.series.append({
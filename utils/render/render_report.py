@@ -1,7 +1,19 @@
-from jinja2 import Environment, FileSystemLoader
+# !/usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+@Version  : Python 3.12
+@Time     : 2025/7/20 20:40
+@Author   : wieszheng
+@Software : PyCharm
+"""
+import os
 from datetime import datetime
-from history_db import HistoryDB
+
+from jinja2 import Environment, FileSystemLoader
+
+from config.conf import ROOT_PATH
 from core.persistence.db import SQLPersister
+from utils.history_db import HistoryDB
 
 icons = {
     "clock": '<svg xmlns="http://www.w3.org/2000/svg" width="24" height="24" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2" stroke-linecap="round" stroke-linejoin="round"><circle cx="12" cy="12" r="10"></circle><polyline points="12 6 12 12 16 14"></polyline></svg>',
@@ -12,84 +24,100 @@ icons = {
     "thermometer": '<svg xmlns="http://www.w3.org/2000/svg" width="24" height="24" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2" stroke-linecap="round" stroke-linejoin="round"><path d="M14 4v10.54a4 4 0 1 1-4 0V4a2 2 0 0 1 4 0Z"></path></svg>',
 }
 
-# 获取历史数据
-db = SQLPersister()
-history = db.get_history(limit=2)  # 取最近两个版本
 
-# 当前版本和上一个版本
-current = history[0] if len(history) > 0 else {}
-previous = history[1] if len(history) > 1 else {}
+def render_report(output_file: str = 'performance_report.html', history_db: HistoryDB = None,
+                  persister: SQLPersister = None) -> str:
+    """
+    生成性能报告
+    :param output_file:
+    :param history_db: 版本历史
+    :param persister: 测试数据
+    :return: 报告路径
+    """
+    history_db = history_db or HistoryDB()
+    persister = persister or SQLPersister()
+    # 获取历史数据，一次查询最近五个版本，对比只用前两个
+    history = history_db.get_history(limit=5)
 
-# 计算每个指标的对比
-metrics = []
-for metric in current.get("metrics", []):
-    title = metric["title"]
-    value = metric["value"]
-    unit = metric["unit"]
-    # 查找上一个版本的同名指标
-    prev_metric = next((m for m in previous.get("metrics", []) if m["title"] == title), None)
-    if prev_metric:
-        prev_value = prev_metric["value"]
-        try:
-            diff = value - prev_value
-            if prev_value != 0:
-                percent = (diff / prev_value) * 100
-            else:
-                percent = 0
-            if diff > 0:
-                trend = f"↑ {percent:+.0f}%"
-                trend_type = "up"
-            elif diff < 0:
-                trend = f"↓ {percent:+.0f}%"
-                trend_type = "down"
-            else:
+    # 当前版本和上一个版本
+    current = history[0] if len(history) > 0 else {}
+    previous = history[1] if len(history) > 1 else {}
+
+    # 计算每个指标的对比
+    metrics = []
+    for metric in current.get("metrics", []):
+        title = metric["title"]
+        value = metric["value"]
+        unit = metric["unit"]
+        # 查找上一个版本的同名指标
+        prev_metric = next((m for m in previous.get("metrics", []) if m["title"] == title), None)
+        if prev_metric:
+            prev_value = prev_metric["value"]
+            try:
+                diff = value - prev_value
+                if prev_value != 0:
+                    percent = (diff / prev_value) * 100
+                else:
+                    percent = 0
+                if diff > 0:
+                    trend = f"↑ {percent:+.0f}%"
+                    trend_type = "up"
+                elif diff < 0:
+                    trend = f"↓ {percent:+.0f}%"
+                    trend_type = "down"
+                else:
+                    trend = "—"
+                    trend_type = ""
+            except Exception:
                 trend = "—"
                 trend_type = ""
-        except Exception:
+        else:
             trend = "—"
             trend_type = ""
-    else:
-        trend = "—"
-        trend_type = ""
+        metrics.append({
+            "title": title,
+            "value": value,
+            "unit": unit,
+            "target": metric.get("target", ""),
+            "trend": trend,
+            "trend_type": trend_type
+        })
+
+    # 新增：读取fps均值并与目标值对比
+    fps_avg = persister.get_fps_avg()  # 可加test_run_id参数
+    fps_target = 60
+    fps_trend = "达标" if fps_avg >= fps_target else "未达标"
     metrics.append({
-        "title": title,
-        "value": value,
-        "unit": unit,
-        "target": metric.get("target", ""),
-        "trend": trend,
-        "trend_type": trend_type
+        "title": "FPS均值",
+        "value": fps_avg,
+        "unit": "",
+        "target": fps_target,
+        "trend": fps_trend,
+        "trend_type": "up" if fps_avg >= fps_target else "down"
     })
 
-# 新增：读取fps均值并与目标值对比
-fps_avg = db.get_fps_avg()  # 可加test_run_id参数
-fps_target = 60
-fps_trend = "达标" if fps_avg >= fps_target else "未达标"
-metrics.append({
-    "title": "FPS均值",
-    "value": fps_avg,
-    "unit": "",
-    "target": fps_target,
-    "trend": fps_trend,
-    "trend_type": "up" if fps_avg >= fps_target else "down"
-})
+    data = {
+        "app_name": "文小言 App",
+        "version": current.get("version", ""),
+        "start_time": "12:00",
+        "duration": "12",
+        "score": current.get("score", 0),
+        "score_up": current.get("score", 0) - previous.get("score", 0) if previous else 0,
+        "metrics": metrics,
+        "gen_time": datetime.now().strftime("%Y/%m/%d %H:%M:%S"),
+        "history": history
+    }
 
-data = {
-    "app_name": "文小言 App",
-    "version": current.get("version", ""),
-    "start_time": "12:00",
-    "duration": "12",
-    "score": current.get("score", 0),
-    "score_up": current.get("score", 0) - previous.get("score", 0) if previous else 0,
-    "metrics": metrics,
-    "gen_time": datetime.now().strftime("%Y/%m/%d %H:%M:%S"),
-    "history": db.get_history(limit=5)
-}
+    env = Environment(loader=FileSystemLoader(os.path.join(ROOT_PATH, "config", "template")), autoescape=True)
+    template = env.get_template('performance_report_template.html')
+    html_content = template.render(**data)
+
+    with open(output_file, 'w', encoding='utf-8') as f:
+        f.write(html_content)
 
-env = Environment(loader=FileSystemLoader('.'), autoescape=True)
-template = env.get_template('performance_report_template.html')
-html_content = template.render(**data)
+    print(f"报告已生成：{output_file}")
+    return output_file
 
-with open('performance_report_template.html', 'w', encoding='utf-8') as f:
-    f.write(html_content)
 
-print("报告已生成：performance_report.html") 
\ No newline at end of file
+if __name__ == '__main__':
+    render_report()